@@ -0,0 +1,319 @@
+import contextlib
+import os
+import re
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+
+from fonctions import rotation_depuis_sorties
+from fonctions2 import reference_texte
+
+
+# Dossier des agrégats mensuels persistés (sorties et stocks par article et par
+# mois) : un sous-dossier par historique (site, société...), voir
+# `dossier_historique`
+DOSSIER_AGREGATS = os.environ.get("AUTOREPORTING_AGREGATS", ".agregats")
+
+# Colonne de date des extractions de mouvements Sage
+COLONNE_DATE = "Date"
+
+FICHIER_SORTIES = "sorties_mensuelles.parquet"
+FICHIER_STOCKS = "stocks_mensuels.parquet"
+
+# Verrou d'un historique : ses ajouts (lecture, contrôle, écriture) se font
+# l'un après l'autre, même depuis plusieurs processus de calcul
+FICHIER_VERROU = ".verrou"
+
+COLONNES_STOCK_MENSUEL = [
+    "Référence Article", "Désignation Article", "Code - Intitulé Famille",
+    "Qté Stock Réel"
+]
+
+# Fenêtres de calcul proposées : nombre de mois, ou "YTD" (depuis janvier)
+FENETRES = {
+    "12 mois glissants": 12,
+    "Depuis janvier": "YTD",
+    "3 ans glissants": 36,
+}
+
+
+class MoisDejaEnregistres(ValueError):
+    """Ajout refusé : des mois sont déjà enregistrés dans l'historique."""
+
+    def __init__(self, mois):
+        self.mois = mois
+        super().__init__(f"Mois déjà enregistrés dans l'historique : {', '.join(mois)}")
+
+
+def dossier_historique(nom, racine=DOSSIER_AGREGATS):
+    """
+    Dossier des agrégats d'un historique : chaque site ou société a le sien,
+    un ajout ne modifie pas les fenêtres des autres.
+    Args:
+        nom (str): Le nom de l'historique.
+        racine (str): Le dossier des historiques.
+    Returns:
+        str: Le dossier de l'historique.
+    """
+    nom_dossier = re.sub(r"[^\w-]+", "_", str(nom).strip()).strip("_")
+    if not nom_dossier:
+        raise ValueError("Le nom de l'historique est vide")
+    return os.path.join(racine, nom_dossier)
+
+
+def historiques(racine=DOSSIER_AGREGATS):
+    """
+    Returns:
+        list: Les noms des historiques enregistrés (noms de dossiers).
+    """
+    if not os.path.isdir(racine):
+        return []
+    return sorted(d for d in os.listdir(racine)
+                  if os.path.isdir(os.path.join(racine, d)))
+
+
+def convertir_dates(dates):
+    """
+    Convertit une colonne de dates lue dans un extrait : datetime, texte
+    jj/mm/aaaa (Sage) ou texte ISO aaaa-mm-jj (CSV réexportés).
+    Args:
+        dates (pd.Series): Les dates.
+    Returns:
+        pd.Series: Les dates en datetime.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+    premiere = dates.dropna().astype(str).head(1)
+    if len(premiere) and premiere.str.match(r"\d{4}-").all():
+        return pd.to_datetime(dates, format="ISO8601")
+    return pd.to_datetime(dates, dayfirst=True)
+
+
+def mois_de(dates):
+    """
+    Convertit une colonne de dates en mois au format "AAAA-MM".
+    Args:
+        dates (pd.Series): Les dates (voir `convertir_dates`).
+    Returns:
+        pd.Series: Les mois.
+    """
+    return convertir_dates(dates).dt.strftime("%Y-%m")
+
+
+def sorties_mensuelles(mouvements, colonne_date=COLONNE_DATE):
+    """
+    Agrège les sorties (mouvements négatifs) par article et par mois.
+    Args:
+        mouvements (pd.DataFrame): Les mouvements de stock, datés.
+        colonne_date (str): La colonne contenant la date du mouvement.
+    Returns:
+        pd.DataFrame: Référence Article, Mois, Qté Sortie (positive), Désignation
+        Article et Code - Intitulé Famille.
+    """
+    quant_neg = mouvements[mouvements["Quantité"] < 0].copy()
+    quant_neg["Référence Article"] = (
+        reference_texte(quant_neg["Référence Article"])
+    )
+    quant_neg["Mois"] = mois_de(quant_neg[colonne_date])
+
+    sorties = (
+        quant_neg.groupby(["Référence Article", "Mois"], sort=False)
+        .agg({
+            "Quantité": "sum",
+            "Désignation Article": "first",
+            "Code - Intitulé Famille": "first"
+        })
+        .rename(columns={"Quantité": "Qté Sortie"})
+        .reset_index()
+    )
+    sorties["Qté Sortie"] = sorties["Qté Sortie"].abs()
+    return sorties
+
+
+def _lire(dossier, fichier, filters=None):
+    chemin = os.path.join(dossier, fichier)
+    if not os.path.exists(chemin):
+        return None
+    # Le stockage des chaînes n'est pas enregistré dans le fichier
+    with pd.option_context("mode.string_storage", "pyarrow"):
+        return pd.read_parquet(chemin, filters=filters)
+
+
+@contextlib.contextmanager
+def verrou_historique(dossier):
+    """
+    Verrou exclusif d'un historique, entre processus. Il est libéré par le
+    système si le processus qui le tient s'arrête.
+    """
+    os.makedirs(dossier, exist_ok=True)
+    with open(os.path.join(dossier, FICHIER_VERROU), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _remplacer_mois(dossier, ajouts, remplacer=False):
+    """
+    Écrit les agrégats de chaque fichier de `ajouts` ({fichier: nouveaux
+    agrégats}), sous le verrou de l'historique. Les mois qu'ils contiennent et
+    qui sont déjà enregistrés ne sont remplacés qu'avec `remplacer` (un même
+    mois peut ainsi être réimporté sans doublon) ; sinon `MoisDejaEnregistres`
+    est levée et rien n'est écrit : tous les fichiers sont contrôlés avant
+    d'en écrire un.
+    """
+    with verrou_historique(dossier):
+        existants = {fichier: _lire(dossier, fichier) for fichier in ajouts}
+        deja = {
+            fichier: existant["Mois"].isin(ajouts[fichier]["Mois"].unique())
+            for fichier, existant in existants.items() if existant is not None
+        }
+        if not remplacer:
+            mois = sorted({m for fichier, masque in deja.items()
+                           for m in existants[fichier].loc[masque, "Mois"]})
+            if mois:
+                raise MoisDejaEnregistres(mois)
+
+        for fichier, nouveau in ajouts.items():
+            if fichier in deja:
+                nouveau = pd.concat([existants[fichier][~deja[fichier]], nouveau],
+                                    ignore_index=True)
+            chemin = os.path.join(dossier, fichier)
+            temporaire = f"{chemin}.{uuid.uuid4().hex}.tmp"
+            nouveau.sort_values("Mois", kind="stable").to_parquet(temporaire,
+                                                                  index=False)
+            os.replace(temporaire, chemin)
+
+
+def _etat_stock(stocks, mois):
+    colonnes = [c for c in COLONNES_STOCK_MENSUEL if c in stocks.columns]
+    etat = stocks[colonnes].assign(Mois=mois)
+    etat["Référence Article"] = reference_texte(etat["Référence Article"])
+    return etat
+
+
+def ajouter_mouvements(mouvements, colonne_date=COLONNE_DATE,
+                       dossier=DOSSIER_AGREGATS, remplacer=False, stocks=None):
+    """
+    Ajoute les sorties mensuelles de nouveaux mouvements aux agrégats persistés.
+    Seuls les nouveaux mouvements sont parcourus ; les mois qu'ils couvrent ne
+    remplacent ceux déjà enregistrés qu'avec `remplacer` (importer des mois
+    complets).
+    Args:
+        mouvements (pd.DataFrame): Les nouveaux mouvements de stock, datés.
+        colonne_date (str): La colonne contenant la date du mouvement.
+        dossier (str): Le dossier de l'historique (voir `dossier_historique`).
+        remplacer (bool): Remplacer les mois déjà enregistrés ; sinon
+            `MoisDejaEnregistres` est levée (ni les sorties ni l'état de stock
+            ne sont alors écrits).
+        stocks (pd.DataFrame, optional): L'état de stock, enregistré dans le
+            même ajout pour le dernier des mois.
+    Returns:
+        list: Les mois ajoutés ou remplacés.
+    """
+    sorties = sorties_mensuelles(mouvements, colonne_date)
+    mois = sorted(sorties["Mois"].unique())
+    ajouts = {FICHIER_SORTIES: sorties}
+    if stocks is not None and mois:
+        ajouts[FICHIER_STOCKS] = _etat_stock(stocks, mois[-1])
+    _remplacer_mois(dossier, ajouts, remplacer)
+    return mois
+
+
+def ajouter_stock(stocks, mois, dossier=DOSSIER_AGREGATS, remplacer=False):
+    """
+    Enregistre l'état du stock à la fin d'un mois.
+    Args:
+        stocks (pd.DataFrame): Données de stock
+        mois (str): Le mois de l'état de stock ("AAAA-MM").
+        dossier (str): Le dossier de l'historique.
+        remplacer (bool): Remplacer l'état déjà enregistré pour ce mois.
+    """
+    _remplacer_mois(dossier, {FICHIER_STOCKS: _etat_stock(stocks, mois)}, remplacer)
+
+
+def mois_disponibles(dossier=DOSSIER_AGREGATS):
+    """
+    Returns:
+        tuple: (mois des sorties enregistrées, mois des états de stock enregistrés)
+    """
+    resultat = []
+    for fichier in (FICHIER_SORTIES, FICHIER_STOCKS):
+        chemin = os.path.join(dossier, fichier)
+        if os.path.exists(chemin):
+            mois = pd.read_parquet(chemin, columns=["Mois"])["Mois"]
+            resultat.append(sorted(mois.unique()))
+        else:
+            resultat.append([])
+    return tuple(resultat)
+
+
+def fenetre(fin, taille):
+    """
+    Calcule les bornes d'une fenêtre de mois se terminant à `fin`.
+    Args:
+        fin (str): Le dernier mois inclus ("AAAA-MM").
+        taille (int ou str): Nombre de mois, ou "YTD" pour depuis janvier.
+    Returns:
+        tuple: (premier mois, dernier mois)
+    """
+    if taille == "YTD":
+        return f"{fin[:4]}-01", fin
+    debut = pd.Period(fin, freq="M") - (taille - 1)
+    return str(debut), fin
+
+
+def rotation_periode(debut, fin, dossier=DOSSIER_AGREGATS):
+    """
+    Calcule le taux de rotation par article sur une période à partir des seuls
+    agrégats mensuels : sorties cumulées de `debut` à `fin`, rapportées au
+    dernier état de stock enregistré jusqu'à `fin`.
+    Args:
+        debut (str): Le premier mois inclus ("AAAA-MM").
+        fin (str): Le dernier mois inclus ("AAAA-MM").
+        dossier (str): Le dossier des agrégats.
+    Returns:
+        pd.DataFrame: Même format que `preparer_donnees2`.
+    """
+    sorties = _lire(dossier, FICHIER_SORTIES,
+                    filters=[("Mois", ">=", debut), ("Mois", "<=", fin)])
+    etats = _lire(dossier, FICHIER_STOCKS, filters=[("Mois", "<=", fin)])
+    if etats is None or etats.empty:
+        raise ValueError(f"Aucun état de stock enregistré jusqu'à {fin}")
+    if sorties is None:
+        sorties = pd.DataFrame(columns=["Référence Article", "Mois", "Qté Sortie",
+                                        "Désignation Article",
+                                        "Code - Intitulé Famille"])
+
+    somme_neg = (
+        sorties.groupby("Référence Article")
+        .agg({
+            "Qté Sortie": "sum",
+            "Désignation Article": "first",
+            "Code - Intitulé Famille": "first"
+        })
+        .reset_index()
+    )
+    stocks = etats[etats["Mois"] == etats["Mois"].max()].drop(columns="Mois")
+    return rotation_depuis_sorties(stocks.reset_index(drop=True), somme_neg)
@@ -0,0 +1,161 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from export import exporter_excel
+from ingestion import partager_processus
+from jointures import POLITIQUES
+from rapports import RAPPORTS, executer
+
+
+EXTENSIONS = (".csv", ".xlsx")
+
+
+def trouver_entrees(dossier, prefixes):
+    """
+    Cherche dans un dossier les fichiers d'entrée d'un rapport.
+    Args:
+        dossier (str): Le dossier d'un site ou d'une période.
+        prefixes (list): Les préfixes des noms de fichiers attendus, dans l'ordre.
+    Returns:
+        list ou None: Les chemins des fichiers, ou None s'il en manque un.
+    """
+    fichiers = sorted(
+        f for f in os.listdir(dossier)
+        if f.lower().endswith(EXTENSIONS) and not f.startswith("~$")
+    )
+    chemins = []
+    for prefixe in prefixes:
+        correspondants = [f for f in fichiers if f.lower().startswith(prefixe)]
+        if not correspondants:
+            return None
+        chemins.append(os.path.join(dossier, correspondants[0]))
+    return chemins
+
+
+def executer_rapport(nom, chemins, dossier_sortie, options=None):
+    """
+    Exécute un rapport et écrit ses fichiers Excel (appelée dans un processus fils).
+    Returns:
+        tuple: (liste des fichiers écrits, durée en secondes)
+    """
+    debut = time.perf_counter()
+    rapport = RAPPORTS[nom]
+    # Options non renseignées : valeur par défaut du rapport
+    options = {
+        k: v for k, v in (options or {}).items()
+        if k in rapport.get("options", []) and v is not None
+    }
+    # Fichiers contrôlés puis lus en parallèle (avec la part de ce processus)
+    resultats = executer(nom, *chemins, **options)
+
+    os.makedirs(dossier_sortie, exist_ok=True)
+    ecrits = []
+    for cle, (nom_fichier, feuille) in rapport["sorties"].items():
+        chemin = os.path.join(dossier_sortie, nom_fichier)
+        # Même écriture que les téléchargements : en flux pour les gros
+        # résultats, refusée au-delà de la limite de lignes d'Excel
+        contenu = exporter_excel(resultats[cle], feuille)
+        with open(chemin, "wb") as f:
+            f.write(contenu)
+        ecrits.append(chemin)
+    return ecrits, time.perf_counter() - debut
+
+
+def lister_taches(entree, sortie, noms_rapports):
+    """
+    Associe chaque site (sous-dossier de `entree`, ou `entree` lui-même s'il
+    n'en a pas) aux rapports dont les fichiers d'entrée sont présents.
+    Returns:
+        list: Les tâches (site, rapport, chemins, dossier de sortie).
+    """
+    sites = sorted(
+        d for d in os.listdir(entree) if os.path.isdir(os.path.join(entree, d))
+    )
+    if not sites:
+        sites = [""]
+
+    taches = []
+    for site in sites:
+        dossier = os.path.join(entree, site)
+        for nom in noms_rapports:
+            chemins = trouver_entrees(dossier, RAPPORTS[nom]["entrees"])
+            if chemins is not None:
+                taches.append((site, nom, chemins, os.path.join(sortie, site)))
+    return taches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Génère les rapports sans Streamlit, pour un dossier de fichiers "
+                    "Sage (un sous-dossier par site ou par période)."
+    )
+    parser.add_argument("entree", help="Dossier des fichiers d'entrée")
+    parser.add_argument("sortie", help="Dossier où écrire les fichiers Excel")
+    parser.add_argument(
+        "--rapports", nargs="+", choices=sorted(RAPPORTS),
+        default=[nom for nom, rapport in RAPPORTS.items()
+                 if rapport.get("par_defaut", True)],
+        help="Rapports à générer (tous par défaut, sauf ceux qui lisent le "
+             "registre des remarques)"
+    )
+    parser.add_argument(
+        "--processus", type=int, default=os.cpu_count(),
+        help="Nombre de processus en parallèle (nombre de cœurs par défaut)"
+    )
+    parser.add_argument(
+        "--taille-bloc", type=int, default=None,
+        help="Lit les ventes par blocs de N lignes (mémoire constante)"
+    )
+    parser.add_argument(
+        "--espace-disque", action="store_true",
+        help="Passe les mouvements par un espace de travail sur disque "
+             "(historiques plus grands que la mémoire)"
+    )
+    parser.add_argument(
+        "--seuil-similarite", type=float, default=None,
+        help="Reporte aussi les remarques du suivi de commandes dont la "
+             "désignation a changé, si leur similarité atteint ce seuil (0 à 1)"
+    )
+    parser.add_argument(
+        "--doublons", choices=POLITIQUES, default=None,
+        help="Traitement des lignes de même clé dans les ventes (sommées par "
+             "défaut) et dans les anciens bons de livraison (première remarque "
+             "par défaut) ; 'erreur' refuse le fichier"
+    )
+    args = parser.parse_args(argv)
+    options = {"taille_bloc": args.taille_bloc, "espace_disque": args.espace_disque,
+               "seuil": args.seuil_similarite, "doublons": args.doublons}
+
+    taches = lister_taches(args.entree, args.sortie, args.rapports)
+    if not taches:
+        print("Aucun fichier d'entrée reconnu. Préfixes attendus :")
+        for nom in args.rapports:
+            print(f"  {nom} : {', '.join(RAPPORTS[nom]['entrees'])}")
+        return 1
+
+    erreurs = 0
+    # Les processus de lecture de chaque tâche se partagent les cœurs
+    with ProcessPoolExecutor(max_workers=args.processus, initializer=partager_processus,
+                             initargs=(min(args.processus, len(taches)),)) as executeur:
+        futures = {
+            executeur.submit(executer_rapport, nom, chemins, dossier_sortie, options):
+                (site or ".", nom)
+            for site, nom, chemins, dossier_sortie in taches
+        }
+        for future in as_completed(futures):
+            site, nom = futures[future]
+            try:
+                ecrits, duree = future.result()
+                print(f"✅ {site} / {nom} ({duree:.1f} s) : {', '.join(ecrits)}")
+            except Exception as e:
+                erreurs += 1
+                print(f"❌ {site} / {nom} : {e}", file=sys.stderr)
+
+    return 1 if erreurs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Compare la construction des clés de `traiter_fichiers` : ancienne version
+(apply ligne à ligne + nettoyer_chaine) contre la version vectorisée.
+
+Usage : python benchmarks/bench_cles.py [nb_lignes]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fonctions2 import construire_cle, nettoyer_chaine  # noqa: E402
+from generateurs import generer_suivi  # noqa: E402
+
+
+def cle_ancienne(df):
+    return df.apply(
+        lambda row: nettoyer_chaine(str(row['Référence'])) + "__" +
+                    nettoyer_chaine(str(row['Désignation'])),
+        axis=1
+    )
+
+
+def mapper_ancien(df_ancien, df_nouveau):
+    df_ancien['key'] = cle_ancienne(df_ancien)
+    df_nouveau['key'] = cle_ancienne(df_nouveau)
+    remarques_map = df_ancien.set_index('key')["Remarques"].to_dict()
+    return df_nouveau["key"].map(remarques_map)
+
+
+def mapper_nouveau(df_ancien, df_nouveau):
+    df_ancien['key'] = construire_cle(df_ancien)
+    df_nouveau['key'] = construire_cle(df_nouveau)
+    remarques_map = (
+        df_ancien.drop_duplicates('key', keep='last')
+        .set_index('key')["Remarques"]
+    )
+    return df_nouveau["key"].map(remarques_map)
+
+
+def chronometrer(fonction, *args):
+    debut = time.perf_counter()
+    resultat = fonction(*[a.copy() for a in args])
+    return time.perf_counter() - debut, resultat
+
+
+if __name__ == "__main__":
+    nb_lignes = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    ancien = generer_suivi(nb_lignes, seed=1, avec_remarques=True)
+    nouveau = generer_suivi(nb_lignes, seed=2)
+
+    t_ancien, r_ancien = chronometrer(mapper_ancien, ancien, nouveau)
+    t_nouveau, r_nouveau = chronometrer(mapper_nouveau, ancien, nouveau)
+
+    pd.testing.assert_series_equal(r_ancien, r_nouveau)
+    print(f"{nb_lignes} lignes")
+    print(f"apply + nettoyer_chaine : {t_ancien:.3f} s")
+    print(f"vectorisé               : {t_nouveau:.3f} s")
+    print(f"accélération            : x{t_ancien / t_nouveau:.1f}")
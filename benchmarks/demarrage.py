@@ -0,0 +1,154 @@
+"""
+Mesure le démarrage à froid de l'application, chaque mesure dans un nouvel
+interpréteur : durée d'import de chaque module, premier rendu de main.py (fin
+de la première exécution du script, imports compris) et délai avant que le
+serveur Streamlit réponde. Les résultats sont ajoutés au même fichier que
+run.py (format "demarrage") et se comparent avec `run.py --comparer`.
+
+Usage : python benchmarks/demarrage.py [--repetitions 5] [--sans-serveur]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from run import commit_courant  # noqa: E402
+
+# Modules dont l'import est mesuré seul
+MODULES = ["streamlit", "pandas", "main_imports", "rapports", "graphiques", "export"]
+
+# Script exécuté dans un nouvel interpréteur : durée d'import d'un module
+IMPORT = """
+import time
+debut = time.perf_counter()
+import {module}
+print(time.perf_counter() - debut)
+"""
+
+# Imports de tête de main.py (ce qui est chargé avant le premier rendu)
+MAIN_IMPORTS = """
+import ast, time
+with open("main.py", encoding="utf-8") as f:
+    arbre = ast.parse(f.read())
+tete = ast.Module([n for n in arbre.body if isinstance(n, (ast.Import, ast.ImportFrom))], [])
+debut = time.perf_counter()
+exec(compile(tete, "main.py", "exec"))
+print(time.perf_counter() - debut)
+"""
+
+# Première exécution de main.py, sans fichier téléversé
+PREMIER_RENDU = """
+import time
+debut = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("main.py")
+at.run(timeout=120)
+assert not at.exception, at.exception
+print(time.perf_counter() - debut)
+"""
+
+
+def _environnement():
+    # Pas de journal des performances ni de préchauffage pendant les mesures
+    return {**os.environ, "AUTOREPORTING_JOURNAL_PERF": os.devnull,
+            "AUTOREPORTING_PRECHAUFFAGE": "0", "PYTHONPATH": RACINE}
+
+
+def mesurer_script(script):
+    """Exécute `script` dans un nouvel interpréteur et renvoie la durée affichée."""
+    sortie = subprocess.run([sys.executable, "-c", script], cwd=RACINE,
+                            env=_environnement(), capture_output=True, text=True,
+                            check=True)
+    return float(sortie.stdout.strip().splitlines()[-1])
+
+
+def _port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def mesurer_serveur(delai_max=120):
+    """Délai entre le lancement de `streamlit run main.py` et la première
+    réponse du point de santé du serveur."""
+    port = _port_libre()
+    debut = time.perf_counter()
+    serveur = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", "main.py",
+         "--server.headless", "true", "--server.port", str(port),
+         "--browser.gatherUsageStats", "false"],
+        cwd=RACINE, env=_environnement(), stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - debut < delai_max:
+            try:
+                with urllib.request.urlopen(
+                        f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                    return time.perf_counter() - debut
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError("Le serveur Streamlit n'a pas répondu.")
+    finally:
+        serveur.terminate()
+        serveur.wait()
+
+
+def mesurer_demarrage(repetitions, serveur=True):
+    """
+    Returns:
+        list: Une mesure par étape (meilleure et médiane de `repetitions`).
+    """
+    etapes = {f"import:{module}": (mesurer_script,
+                                   MAIN_IMPORTS if module == "main_imports"
+                                   else IMPORT.format(module=module))
+              for module in MODULES}
+    etapes["premier_rendu"] = (mesurer_script, PREMIER_RENDU)
+    if serveur:
+        etapes["serveur_pret"] = (mesurer_serveur,)
+
+    mesures = []
+    for etape, (fonction, *args) in etapes.items():
+        durees = sorted(fonction(*args) for _ in range(repetitions))
+        mesures.append({"etape": etape, "duree_s": durees[0],
+                        "mediane_s": durees[len(durees) // 2]})
+        print(f"{etape:<28} {durees[0]:7.3f} s (médiane {durees[len(durees) // 2]:.3f} s)")
+    return mesures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid.")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--sortie", default="resultats_benchmarks.jsonl",
+                        help="Fichier JSON lines auquel ajouter les résultats")
+    parser.add_argument("--sans-serveur", action="store_true",
+                        help="Ne mesure pas le lancement du serveur Streamlit")
+    args = parser.parse_args(argv)
+
+    contexte = {
+        "commit": commit_courant(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "repetitions": args.repetitions,
+        "taille": 0,
+        "format": "demarrage",
+    }
+    with open(args.sortie, "a", encoding="utf-8") as fichier_resultats:
+        for mesure in mesurer_demarrage(args.repetitions, not args.sans_serveur):
+            fichier_resultats.write(json.dumps({**contexte, **mesure},
+                                               ensure_ascii=False) + "\n")
+    print(f"Résultats ajoutés à {args.sortie}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
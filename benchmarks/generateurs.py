@@ -0,0 +1,190 @@
+"""
+Générateurs de fichiers synthétiques au format des extractions Sage : stocks,
+ventes, mouvements, bons de livraison et suivi de commandes, en CSV (;) ou xlsx,
+avec leurs particularités (nombres au format français avec espaces insécables,
+lignes de titre au-dessus de l'en-tête, références en double...).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+LIGNES_MAX_EXCEL = 1_048_576
+
+FAMILLES = [
+    "PIUSIPOMPE - Equipement", "COMPTEUR - Comptage", "PISTOLET - Distribution",
+    "FLEXIBLE - Raccords", "FILTRE - Filtration", "CUVE - Stockage",
+]
+MOTS = ["POMPE", "GASOIL", "COMPTEUR", "PISTOLET", "FLEXIBLE", "FILTRE", "CUVE",
+        "RACCORD", "230V", "12V", "INOX", "K33", "K44", "AUTO", "MANUEL"]
+
+
+def nombre_fr(valeurs, decimales=2):
+    """Formate des nombres à la française : ' 1 688,47' (milliers en insécables)."""
+    texte = pd.Series(valeurs).map(lambda v: f" {v:,.{decimales}f}")
+    return texte.str.replace(",", "\xa0", regex=False).str.replace(".", ",",
+                                                                  regex=False)
+
+
+def references(nb_articles, rng):
+    """Références mêlant codes numériques et alphanumériques ('000305000/K33')."""
+    codes = rng.choice(900_000, size=nb_articles, replace=False) + 100_000
+    refs = pd.Series(codes.astype(str), dtype=object)
+    alpha = rng.random(nb_articles) < 0.3
+    refs[alpha] = ["000" + r + "/" + rng.choice(["K33", "K44", "B", "X2"])
+                   for r in refs[alpha]]
+    return refs
+
+
+def designations(nb, rng):
+    mots = rng.choice(MOTS, size=(nb, 3))
+    return pd.Series([" ".join(m) for m in mots], dtype=object)
+
+
+def generer_stocks(nb_articles, seed=0):
+    rng = np.random.default_rng(seed)
+    qte = rng.integers(0, 200, nb_articles)
+    cmup = rng.gamma(2.0, 400.0, nb_articles)
+    return pd.DataFrame({
+        "Référence Article": references(nb_articles, rng),
+        "Désignation Article": designations(nb_articles, rng),
+        "Code - Intitulé Famille": rng.choice(FAMILLES, nb_articles),
+        "Qté Stock Réel": qte,
+        "CMUP Unitaire": nombre_fr(cmup, 3),
+        "Montant Stock (CMUP)": nombre_fr(qte * cmup, 3),
+    })
+
+
+def generer_ventes(stocks, nb_lignes, seed=1):
+    """Ventes par article ; avec plus de lignes que d'articles, des références
+    apparaissent plusieurs fois."""
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(stocks), nb_lignes)
+    qte = rng.integers(1, 500, nb_lignes)
+    pu = rng.gamma(2.0, 500.0, nb_lignes)
+    return pd.DataFrame({
+        "Référence Article": stocks["Référence Article"].to_numpy()[idx],
+        "Désignation Article": stocks["Désignation Article"].to_numpy()[idx],
+        "Code - Intitulé Famille": stocks["Code - Intitulé Famille"].to_numpy()[idx],
+        "Qté Vendues": nombre_fr(qte, 0),
+        "PU": nombre_fr(pu),
+        "Chiffre d'affaires HT": nombre_fr(qte * pu),
+    })
+
+
+def generer_mouvements(stocks, nb_lignes, seed=2, debut="2022-01-01", nb_mois=36):
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(stocks), nb_lignes)
+    jours = rng.integers(0, nb_mois * 30, nb_lignes)
+    return pd.DataFrame({
+        "Date": pd.Timestamp(debut) + pd.to_timedelta(np.sort(jours), unit="D"),
+        "N° Pièce": [f"MV{i:08d}" for i in range(nb_lignes)],
+        "Référence Article": stocks["Référence Article"].to_numpy()[idx],
+        "Désignation Article": stocks["Désignation Article"].to_numpy()[idx],
+        "Code - Intitulé Famille": stocks["Code - Intitulé Famille"].to_numpy()[idx],
+        "Quantité": rng.integers(-50, 40, nb_lignes),
+    })
+
+
+def generer_bls(nb_lignes, seed=3, avec_remarques=False):
+    rng = np.random.default_rng(seed)
+    pieces = rng.integers(0, max(nb_lignes // 3, 1), nb_lignes)
+    df = pd.DataFrame({
+        "N° Compte Client": [f"C{c:05d}" for c in rng.integers(0, 5000, nb_lignes)],
+        "N° Pièce": [f" bl{p:07d}\xa0" for p in pieces],
+        "Date": pd.Timestamp("2024-01-01")
+        + pd.to_timedelta(rng.integers(0, 365, nb_lignes), unit="D"),
+        "Montant HT": nombre_fr(rng.gamma(2.0, 800.0, nb_lignes)),
+        "Prix Revient Total": rng.gamma(2.0, 600.0, nb_lignes).round(2),
+    })
+    if avec_remarques:
+        df["REMARQUES"] = np.where(rng.random(nb_lignes) < 0.4, "livré partiel", None)
+    return df
+
+
+def generer_suivi(nb_lignes, seed=4, avec_remarques=False):
+    """Suivi de commandes : références numériques ou texte avec espaces
+    (insécables compris), 1 % de désignations vides."""
+    rng = np.random.default_rng(seed)
+    refs = rng.integers(0, nb_lignes // 2 + 1, nb_lignes)
+    df = pd.DataFrame({
+        "N° Pièce": [f"BC{i:07d}" for i in range(nb_lignes)],
+        "Référence": [f" REF\xa0{r:06d} " if r % 7 else r for r in refs],
+        "Désignation": [f"pompe  gasoil {r % 500}\xa0v" for r in refs],
+        "Quantité": rng.integers(1, 100, nb_lignes),
+    })
+    df.loc[rng.random(nb_lignes) < 0.01, "Désignation"] = np.nan
+    if avec_remarques:
+        df["Remarques"] = np.where(refs % 3 == 0, "à relancer", None)
+    return df
+
+
+def ecrire_csv(df, chemin, titres=()):
+    """Écrit un CSV Sage : ';', UTF-8 avec BOM, lignes de titre éventuelles."""
+    with open(chemin, "w", encoding="utf-8-sig", newline="") as f:
+        for titre in titres:
+            f.write(titre + "\n")
+        df.to_csv(f, sep=";", index=False)
+
+
+def ecrire_xlsx(df, chemin, titres=(), sheet_name="Feuil1"):
+    """Écrit un xlsx ligne par ligne (mémoire constante), titres au-dessus."""
+    import xlsxwriter
+
+    if len(df) + len(titres) + 1 > LIGNES_MAX_EXCEL:
+        raise ValueError(f"{len(df)} lignes : trop pour une feuille Excel")
+    workbook = xlsxwriter.Workbook(chemin, {
+        "constant_memory": True, "default_date_format": "dd/mm/yyyy"
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
+    ligne = 0
+    for titre in titres:
+        worksheet.write_row(ligne, 0, [titre])
+        ligne += 2  # une ligne vide après chaque titre
+    worksheet.write_row(ligne, 0, list(df.columns))
+    for debut in range(0, len(df), 10_000):
+        bloc = df.iloc[debut:debut + 10_000]
+        valeurs = bloc.astype(object).where(bloc.notna(), None).to_numpy().tolist()
+        for valeurs_ligne in valeurs:
+            ligne += 1
+            worksheet.write_row(ligne, 0, valeurs_ligne)
+    workbook.close()
+
+
+def generer_jeu(dossier, nb_lignes, format_fichier="xlsx", seed=0, titres_csv=True):
+    """
+    Génère un jeu complet de fichiers d'entrée dans `dossier` (noms attendus par
+    batch.py). Le nombre d'articles vaut un dixième du nombre de lignes.
+    Args:
+        titres_csv (bool): Ajoute aussi les lignes de titre aux CSV, comme dans
+            les exports Sage (la ligne d'en-tête est retrouvée par mot clé).
+    Returns:
+        dict: nom du fichier -> chemin
+    """
+    os.makedirs(dossier, exist_ok=True)
+    stocks = generer_stocks(max(nb_lignes // 10, 10), seed)
+    jeux = {
+        "stocks": (stocks, ["Etat du stock au 31/12/2024"], "Feuil1"),
+        "ventes": (generer_ventes(stocks, nb_lignes, seed + 1),
+                   ["Ventes par article", "Période : 01/01/2022 - 31/12/2024"],
+                   "Feuil1"),
+        "mouvements": (generer_mouvements(stocks, nb_lignes, seed + 2),
+                       ["Mouvements de stock"], "Feuil1"),
+        "bls_nouveaux": (generer_bls(nb_lignes, seed + 3), ["Bons de livraison"],
+                         "Feuil2"),
+        "bls_anciens": (generer_bls(nb_lignes, seed + 3, avec_remarques=True),
+                        ["Bons de livraison"], "Feuil2"),
+        "suivi_ancien": (generer_suivi(nb_lignes, seed + 4, avec_remarques=True),
+                         ["Suivi des commandes"], "Feuil1"),
+        "suivi_nouveau": (generer_suivi(nb_lignes, seed + 5), ["Suivi des commandes"],
+                          "Feuil1"),
+    }
+    chemins = {}
+    for nom, (df, titres, feuille) in jeux.items():
+        chemin = os.path.join(dossier, f"{nom}.{format_fichier}")
+        if format_fichier == "csv":
+            ecrire_csv(df, chemin, titres if titres_csv else ())
+        else:
+            ecrire_xlsx(df, chemin, titres, feuille)
+        chemins[nom] = chemin
+    return chemins
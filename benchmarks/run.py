@@ -0,0 +1,222 @@
+"""
+Chronomètre chaque étape des rapports sur des jeux de données synthétiques
+(voir generateurs.py) et ajoute les résultats, une ligne JSON par mesure, à un
+fichier de résultats : les mesures de deux commits peuvent ainsi être comparées.
+
+Usage :
+    python benchmarks/run.py --tailles 10000 100000 --formats xlsx csv
+    python benchmarks/run.py --comparer avant.jsonl apres.jsonl
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+import fonctions as f  # noqa: E402
+import fonctions2 as f2  # noqa: E402
+import instrumentation  # noqa: E402
+from export import exporter_excel  # noqa: E402
+from extraits import normaliser_extrait  # noqa: E402
+from generateurs import LIGNES_MAX_EXCEL, generer_jeu  # noqa: E402
+from rapprochement import SEUIL_SIMILARITE  # noqa: E402
+from statistiques import classer_articles, statistiques_rotation  # noqa: E402
+
+# Les mesures sont écrites dans le fichier de résultats, pas dans le journal
+instrumentation.journal.disabled = True
+
+
+# Fichier -> (mot clé de l'en-tête, feuille, colonnes normalisées comme dans
+# `rapports`, toutes si None)
+LECTURES = {
+    "stocks": ("Référence Article", 0, None),
+    "ventes": ("Référence Article", 0, None),
+    "mouvements": ("Référence Article", 0, None),
+    "bls_nouveaux": ("N° Compte Client", "Feuil2", []),
+    "bls_anciens": ("N° Compte Client", "Feuil2", []),
+    "suivi_ancien": ("N° Pièce", 0, []),
+    "suivi_nouveau": ("N° Pièce", 0, []),
+}
+
+
+def commit_courant():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RACINE,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lire(chemin, mot_clef, feuille):
+    """Lit un fichier d'entrée comme l'application (en-tête retrouvé par mot
+    clé), sans le normaliser : colonnes telles que lues."""
+    return f2.lire_avec_header_auto(chemin, sheet_name=feuille, mot_clef=mot_clef)
+
+
+def chronometrer(fonction, preparer, repetitions):
+    """
+    Exécute `fonction(*preparer())` plusieurs fois ; les copies des entrées sont
+    préparées hors chronométrage, car la plupart des étapes les modifient en place.
+    Returns:
+        tuple: (meilleure durée en secondes, résultat de la dernière exécution)
+    """
+    meilleure = float("inf")
+    for _ in range(repetitions):
+        args = preparer()
+        debut = time.perf_counter()
+        resultat = fonction(*args)
+        meilleure = min(meilleure, time.perf_counter() - debut)
+    return meilleure, resultat
+
+
+def mesurer_jeu(chemins, repetitions):
+    """
+    Chronomètre toutes les étapes sur un jeu de fichiers.
+    Returns:
+        list: Les mesures (étape, durée, lignes en entrée et en sortie).
+    """
+    mesures = []
+
+    def mesurer(etape, fonction, *entrees, copier=True):
+        def preparer():
+            return [e.copy() if copier and hasattr(e, "copy") else e for e in entrees]
+        duree, resultat = chronometrer(fonction, preparer, repetitions)
+        mesures.append({
+            "etape": etape,
+            "duree_s": round(duree, 6),
+            "lignes_entree": instrumentation.nb_lignes(entrees[0]),
+            "lignes_sortie": instrumentation.nb_lignes(resultat),
+        })
+        print(f"  {etape:<40} {duree:8.3f} s")
+        return resultat
+
+    # Lecture et normalisation (voir `normaliser_extrait`) mesurées séparément :
+    # les étapes d'analyse des nombres ci-dessous partent des colonnes brutes
+    bruts, donnees = {}, {}
+    for nom, (mot_clef, feuille, normalisees) in LECTURES.items():
+        bruts[nom] = mesurer(f"lecture:{nom}", lire, chemins[nom], mot_clef, feuille)
+        donnees[nom] = mesurer(f"normalisation:{nom}",
+                               functools.partial(normaliser_extrait,
+                                                 normalisees=normalisees),
+                               bruts[nom])
+
+    stocks, ventes = donnees["stocks"], donnees["ventes"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        mesurer("nettoyer_et_convertir", f.nettoyer_et_convertir,
+                bruts["ventes"]["Chiffre d'affaires HT"])
+
+    rotation = mesurer("preparer_donnees", f.preparer_donnees, bruts["stocks"],
+                       bruts["ventes"])
+    articles = mesurer("preparer_donnees2", f.preparer_donnees2, stocks,
+                       donnees["mouvements"])
+    mesurer("groupby_famille", f.groupby_famille, articles)
+    mesurer("statistiques_rotation", statistiques_rotation,
+            classer_articles(articles.copy()))
+    mesurer("fusionner_bls", f2.fusionner_bls, donnees["bls_nouveaux"],
+            donnees["bls_anciens"])
+    mesurer("reporter_remarques", f2.reporter_remarques, donnees["suivi_ancien"],
+            donnees["suivi_nouveau"])
+    mesurer("reporter_remarques:approche",
+            functools.partial(f2.reporter_remarques, seuil=SEUIL_SIMILARITE),
+            donnees["suivi_ancien"], donnees["suivi_nouveau"])
+    # Lecture comprise
+    mesurer("traiter_fichiers", f2.traiter_fichiers, chemins["suivi_ancien"],
+            chemins["suivi_nouveau"], copier=False)
+
+    for nom, resultat in [("rotation", rotation), ("articles", articles)]:
+        if len(resultat) < LIGNES_MAX_EXCEL:
+            mesurer(f"export_excel:{nom}", exporter_excel, resultat, "Feuil1",
+                    copier=False)
+    return mesures
+
+
+def executer(tailles, formats, repetitions, sortie, dossier=None):
+    contexte = {
+        "commit": commit_courant(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "repetitions": repetitions,
+    }
+    with tempfile.TemporaryDirectory() as temporaire:
+        for taille in tailles:
+            for format_fichier in formats:
+                if format_fichier == "xlsx" and taille + 10 > LIGNES_MAX_EXCEL:
+                    print(f"{taille} lignes : ignoré en xlsx (limite d'Excel)")
+                    continue
+                jeu = os.path.join(dossier or temporaire, f"{format_fichier}_{taille}")
+                print(f"{taille} lignes, {format_fichier} : génération...")
+                chemins = generer_jeu(jeu, taille, format_fichier)
+                with open(sortie, "a", encoding="utf-8") as fichier_resultats:
+                    for mesure in mesurer_jeu(chemins, repetitions):
+                        ligne = {**contexte, "taille": taille,
+                                 "format": format_fichier, **mesure}
+                        fichier_resultats.write(json.dumps(ligne, ensure_ascii=False)
+                                                + "\n")
+    print(f"Résultats ajoutés à {sortie}")
+
+
+def charger(chemin):
+    with open(chemin, encoding="utf-8") as fichier:
+        df = pd.DataFrame([json.loads(ligne) for ligne in fichier if ligne.strip()])
+    # Pour chaque mesure, la plus récente
+    return df.groupby(["etape", "taille", "format"])["duree_s"].last()
+
+
+def comparer(avant, apres, seuil=1.10):
+    """
+    Affiche les durées de deux fichiers de résultats côte à côte.
+    Returns:
+        int: 1 si une étape a ralenti de plus de `seuil`, 0 sinon.
+    """
+    df = pd.concat({"avant": charger(avant), "apres": charger(apres)},
+                   axis=1).dropna()
+    df["ratio"] = df["apres"] / df["avant"]
+    with pd.option_context("display.max_rows", None, "display.width", 120):
+        print(df.round(3).to_string())
+    regressions = df[df["ratio"] > seuil]
+    if not regressions.empty:
+        print(f"\n{len(regressions)} étape(s) ralentie(s) de plus de "
+              f"{(seuil - 1):.0%}")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des rapports.")
+    parser.add_argument("--tailles", nargs="+", type=int, default=[10_000, 100_000],
+                        help="Nombres de lignes des jeux générés (10k à 5M)")
+    parser.add_argument("--formats", nargs="+", choices=["xlsx", "csv"],
+                        default=["xlsx", "csv"])
+    parser.add_argument("--repetitions", type=int, default=3,
+                        help="Meilleure durée sur N exécutions")
+    parser.add_argument("--sortie", default="resultats_benchmarks.jsonl",
+                        help="Fichier JSON lines auquel ajouter les résultats")
+    parser.add_argument("--dossier", default=None,
+                        help="Conserve les fichiers générés dans ce dossier")
+    parser.add_argument("--comparer", nargs=2, metavar=("AVANT", "APRES"),
+                        help="Compare deux fichiers de résultats")
+    args = parser.parse_args(argv)
+
+    if args.comparer:
+        return comparer(*args.comparer)
+    executer(args.tailles, args.formats, args.repetitions, args.sortie, args.dossier)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
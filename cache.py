@@ -0,0 +1,110 @@
+import hashlib
+import os
+import sys
+import threading
+
+from cachetools import LRUCache
+
+
+# Taille maximale du cache en mémoire (en Mo), partagée par toutes les sessions
+TAILLE_MAX_CACHE_MO = int(os.environ.get("AUTOREPORTING_CACHE_MO", "512"))
+
+
+def _taille(valeur):
+    """
+    Estime l'occupation mémoire (en octets) d'une valeur mise en cache.
+    Args:
+        valeur: Un DataFrame, une Series, un tuple/liste/dict de ceux-ci ou des octets.
+    Returns:
+        int: La taille estimée en octets.
+    """
+    # Import différé : pandas n'est pas chargé avant la première mise en cache
+    import pandas as pd
+
+    if isinstance(valeur, pd.DataFrame):
+        return int(valeur.memory_usage(index=True, deep=True).sum())
+    if isinstance(valeur, pd.Series):
+        return int(valeur.memory_usage(index=True, deep=True))
+    if isinstance(valeur, dict):
+        return sum(_taille(v) for v in valeur.values())
+    if isinstance(valeur, (tuple, list)):
+        return sum(_taille(v) for v in valeur)
+    return sys.getsizeof(valeur)
+
+
+_cache = LRUCache(maxsize=TAILLE_MAX_CACHE_MO * 1024 * 1024, getsizeof=_taille)
+_verrou = threading.Lock()
+
+
+def hash_fichier(file_obj):
+    """
+    Calcule l'empreinte du contenu d'un fichier (chemin ou fichier Streamlit).
+    Args:
+        file_obj (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+    Returns:
+        str: L'empreinte hexadécimale du contenu.
+    """
+    empreinte = hashlib.blake2b(digest_size=20)
+    if isinstance(file_obj, str):
+        with open(file_obj, "rb") as f:
+            for bloc in iter(lambda: f.read(1024 * 1024), b""):
+                empreinte.update(bloc)
+    elif hasattr(file_obj, "getvalue"):
+        empreinte.update(file_obj.getvalue())
+    else:
+        raise TypeError("Entrée non reconnue : chemin ou fichier Streamlit attendu.")
+    return empreinte.hexdigest()
+
+
+def hash_dataframe(df):
+    """
+    Calcule l'empreinte du contenu d'un DataFrame (valeurs, index et colonnes).
+    Args:
+        df (pd.DataFrame): Le DataFrame.
+    Returns:
+        str: L'empreinte hexadécimale.
+    """
+    import pandas as pd
+
+    empreinte = hashlib.blake2b(digest_size=20)
+    empreinte.update(repr(list(df.columns)).encode())
+    empreinte.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return empreinte.hexdigest()
+
+
+def memoiser(cle, fonction, *args, **kwargs):
+    """
+    Renvoie le résultat mis en cache pour `cle`, ou calcule `fonction(*args, **kwargs)`
+    et le conserve. Le cache est borné en mémoire et évince les entrées les moins
+    récemment utilisées. Le résultat est partagé : il ne doit pas être modifié en place.
+    Args:
+        cle (tuple): La clé du résultat (empreintes des fichiers et paramètres).
+        fonction (callable): La fonction à appeler si le résultat est absent.
+    Returns:
+        Le résultat de la fonction.
+    """
+    with _verrou:
+        if cle in _cache:
+            return _cache[cle]
+
+    resultat = fonction(*args, **kwargs)
+
+    with _verrou:
+        try:
+            _cache[cle] = resultat
+        except ValueError:
+            # Résultat plus gros que le cache entier : on ne le conserve pas
+            pass
+    return resultat
+
+
+def contient(cle):
+    """Indique si un résultat est en cache pour `cle`."""
+    with _verrou:
+        return cle in _cache
+
+
+def vider_cache():
+    """Vide le cache en mémoire."""
+    with _verrou:
+        _cache.clear()
@@ -0,0 +1,255 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from agregats import COLONNE_DATE, convertir_dates
+from fonctions import lire_par_blocs, rotation_depuis_sorties
+from fonctions2 import normaliser_reference, reference_texte
+from instrumentation import mesurer
+from nombres import convertir_nombres
+
+
+# Espace de travail sur disque : les colonnes numériques des mouvements sont
+# écrites dans des tableaux binaires, lus ensuite par projection en mémoire
+# (np.memmap). Seuls les blocs en cours, les totaux par article (quelques
+# milliers de lignes) et les sorties des couples (article, mois) présents sont
+# en mémoire : l'historique peut dépasser la RAM.
+
+# Dossier des espaces de travail (un sous-dossier temporaire par calcul)
+DOSSIER_ESPACE = os.environ.get("AUTOREPORTING_ESPACE", tempfile.gettempdir())
+
+# Nombre de lignes lues à la fois dans les fichiers de mouvements
+TAILLE_BLOC = 50_000
+
+# Nombre de lignes parcourues à la fois dans les tableaux projetés
+TAILLE_TRANCHE = 1_000_000
+
+# Tableaux de l'espace : nom -> type (une valeur par ligne de mouvement)
+TABLEAUX = {
+    "codes": np.int32,       # code entier de l'article (position dans `references`)
+    "quantites": np.float64,  # Quantité (NaN si non convertible)
+    "mois": np.int32,        # année * 12 + mois - 1, -1 si pas de date
+}
+
+# Colonnes descriptives : première valeur non vide parmi les sorties
+COLONNES_LIBELLES = ["Désignation Article", "Code - Intitulé Famille"]
+
+# Plage des dates plausibles : une date hors de cette plage (année mal saisie,
+# 1900, 2099...) est signalée ; son mouvement compte dans les totaux de
+# l'article, pas dans ses sorties mensuelles
+ANNEE_MIN = 1980
+ANNEES_FUTURES = 1
+
+# Nombre de dates hors plage citées
+NB_EXEMPLES = 5
+
+
+def _mois(dates):
+    """
+    Dates -> numéro de mois entier (année * 12 + mois - 1), -1 si absente ou
+    hors de la plage plausible (voir `ANNEE_MIN`).
+    Returns:
+        tuple: (numéros de mois, masque des dates hors plage)
+    """
+    dates = convertir_dates(dates)
+    annees = dates.dt.year
+    hors_plage = ((annees < ANNEE_MIN)
+                  | (annees > pd.Timestamp.now().year + ANNEES_FUTURES)).to_numpy()
+    mois = (annees * 12 + dates.dt.month - 1).fillna(-1).astype(np.int32).to_numpy()
+    mois[hors_plage] = -1
+    return mois, hors_plage
+
+
+def _cumuler(cases, sommes, nouvelles, poids):
+    """
+    Ajoute `poids` aux sommes des cases `nouvelles` : seules les cases non
+    vides sont gardées (triées, distinctes), pas un tableau dense de toutes
+    les cases possibles.
+    Returns:
+        tuple: (cases, sommes)
+    """
+    toutes, positions = np.unique(np.concatenate([cases, nouvelles]),
+                                  return_inverse=True)
+    return toutes, np.bincount(positions, weights=np.concatenate([sommes, poids]),
+                               minlength=len(toutes))
+
+
+def _tranches(nb_lignes, taille_tranche):
+    for debut in range(0, nb_lignes, taille_tranche):
+        yield slice(debut, min(debut + taille_tranche, nb_lignes))
+
+
+@mesurer
+def ecrire_mouvements(fichiers, dossier, taille_bloc=TAILLE_BLOC):
+    """
+    Lit les fichiers de mouvements par blocs et écrit leurs colonnes
+    numériques dans l'espace de travail `dossier`. Les références sont
+    remplacées par des codes entiers.
+    Args:
+        fichiers (str, UploadedFile ou list): Le ou les fichiers de mouvements.
+        dossier (str): Le dossier de l'espace de travail.
+        taille_bloc (int): Nombre de lignes lues à la fois.
+    Returns:
+        dict: L'espace (dossier, nombre de lignes, références de chaque code,
+        libellés par code, présence des dates, dates hors plage : nombre et
+        exemples).
+    """
+    fichiers = fichiers if isinstance(fichiers, list) else [fichiers]
+    references = pd.Index([], dtype=object)
+    libelles = {colonne: pd.Series(dtype=object) for colonne in COLONNES_LIBELLES}
+    nb_lignes = 0
+    avec_dates = True
+    hors_plage = {"nombre": 0, "exemples": []}
+
+    sorties = {nom: open(os.path.join(dossier, f"{nom}.bin"), "wb")
+               for nom in TABLEAUX}
+    try:
+        for fichier in fichiers:
+            for bloc in lire_par_blocs(fichier, taille_bloc):
+                bloc.columns = bloc.columns.astype(str).str.strip()
+                refs = normaliser_reference(bloc["Référence Article"])
+                # Sans référence, un mouvement n'est rattaché à aucun article
+                bloc = bloc[refs.notna()]
+                refs = reference_texte(refs[refs.notna()])
+
+                # Codes entiers : les nouvelles références sont ajoutées à la fin
+                codes = references.get_indexer(refs)
+                if (codes == -1).any():
+                    nouvelles = pd.Index(refs[codes == -1].unique())
+                    references = references.append(nouvelles)
+                    codes = references.get_indexer(refs)
+
+                quantites, _ = convertir_nombres(bloc["Quantité"])
+                avec_dates = avec_dates and COLONNE_DATE in bloc.columns
+                if avec_dates:
+                    mois, hors = _mois(bloc[COLONNE_DATE])
+                    hors_plage["nombre"] += int(hors.sum())
+                    for date in bloc[COLONNE_DATE][hors].astype(str).unique():
+                        if len(hors_plage["exemples"]) < NB_EXEMPLES:
+                            hors_plage["exemples"].append(date)
+                else:
+                    mois = np.full(len(bloc), -1, dtype=np.int32)
+
+                # Libellés : première valeur non vide parmi les sorties
+                negatifs = (quantites < 0).to_numpy()
+                for colonne, valeurs in libelles.items():
+                    if colonne in bloc.columns:
+                        premiers = (
+                            pd.Series(bloc[colonne].to_numpy()[negatifs],
+                                      index=codes[negatifs])
+                            .dropna()
+                        )
+                        premiers = premiers[~premiers.index.duplicated()
+                                            & ~premiers.index.isin(valeurs.index)]
+                        libelles[colonne] = pd.concat([valeurs, premiers])
+
+                for nom, tableau in [("codes", codes), ("quantites", quantites),
+                                     ("mois", mois)]:
+                    sorties[nom].write(np.asarray(tableau, dtype=TABLEAUX[nom])
+                                       .tobytes())
+                nb_lignes += len(bloc)
+    finally:
+        for sortie in sorties.values():
+            sortie.close()
+
+    return {
+        "dossier": dossier,
+        "nb_lignes": nb_lignes,
+        "references": references,
+        "libelles": libelles,
+        "avec_dates": avec_dates and nb_lignes > 0,
+        "dates_hors_plage": hors_plage,
+    }
+
+
+def ouvrir_tableau(espace, nom):
+    """Projette en mémoire (lecture seule) un tableau de l'espace."""
+    if espace["nb_lignes"] == 0:
+        return np.empty(0, dtype=TABLEAUX[nom])
+    return np.memmap(os.path.join(espace["dossier"], f"{nom}.bin"),
+                     dtype=TABLEAUX[nom], mode="r", shape=(espace["nb_lignes"],))
+
+
+@mesurer
+def sorties_depuis_espace(espace, taille_tranche=TAILLE_TRANCHE):
+    """
+    Calcule les sorties par article (et par mois si les mouvements sont
+    datés) en parcourant les tableaux de l'espace par tranches : filtre et
+    sommes se font sur les vues projetées, sans copie de l'historique.
+    Args:
+        espace (dict): L'espace (voir `ecrire_mouvements`).
+        taille_tranche (int): Nombre de lignes parcourues à la fois.
+    Returns:
+        tuple: (sorties par article, même format que `sorties_par_article` ;
+        sorties par article et par mois, même format que
+        `agregats.sorties_mensuelles`, ou None sans dates)
+    """
+    codes, quantites, mois = (ouvrir_tableau(espace, nom) for nom in TABLEAUX)
+    nb_articles = len(espace["references"])
+
+    totaux = np.zeros(nb_articles)
+    nb_sorties = np.zeros(nb_articles, dtype=np.int64)
+    # Sorties mensuelles : une case par (article, mois) ayant des sorties,
+    # numérotée code << 32 | mois, cumulée tranche par tranche
+    cases_mois, par_mois = np.empty(0, dtype=np.int64), np.empty(0)
+    for tranche in _tranches(len(codes), taille_tranche):
+        q = quantites[tranche]
+        negatifs = q < 0
+        c = codes[tranche][negatifs]
+        totaux += np.bincount(c, weights=q[negatifs], minlength=nb_articles)
+        nb_sorties += np.bincount(c, minlength=nb_articles)
+        if espace["avec_dates"]:
+            m = mois[tranche][negatifs]
+            dates = m >= 0
+            cases = (c[dates].astype(np.int64) << 32) | m[dates]
+            cases_mois, par_mois = _cumuler(cases_mois, par_mois, cases,
+                                            q[negatifs][dates])
+
+    # Articles ayant au moins une sortie, triés comme par un groupby
+    avec_sortie = np.flatnonzero(nb_sorties)
+    somme_neg = pd.DataFrame({
+        "Référence Article": espace["references"][avec_sortie],
+        "Qté Sortie": np.abs(totaux[avec_sortie]),
+    })
+    for colonne, valeurs in espace["libelles"].items():
+        somme_neg[colonne] = pd.Series(avec_sortie).map(valeurs)
+    somme_neg = somme_neg.sort_values("Référence Article").reset_index(drop=True)
+
+    mensuelles = None
+    non_vides = par_mois != 0
+    if non_vides.any():
+        cases = cases_mois[non_vides]
+        numeros = cases & 0xFFFFFFFF
+        mensuelles = pd.DataFrame({
+            "Référence Article": espace["references"][cases >> 32],
+            "Mois": [f"{n // 12:04d}-{n % 12 + 1:02d}" for n in numeros],
+            "Qté Sortie": np.abs(par_mois[non_vides]),
+        })
+    return somme_neg, mensuelles
+
+
+@mesurer
+def preparer_donnees2_disque(stocks, fichiers_mouvement, taille_bloc=TAILLE_BLOC):
+    """
+    Variante de `preparer_donnees2` pour les historiques de mouvements plus
+    grands que la mémoire : les mouvements passent par un espace de travail
+    temporaire sur disque, supprimé après le calcul.
+    Args:
+        stocks (pd.DataFrame): Données de stock
+        fichiers_mouvement (str, UploadedFile ou list): Le ou les fichiers de
+            mouvements.
+        taille_bloc (int): Nombre de lignes lues à la fois.
+    Returns:
+        tuple: (taux de rotation par article, même format que
+        `preparer_donnees2`, avec `attrs["dates_hors_plage"]` si des dates
+        ont été écartées ; sorties mensuelles par article, ou None)
+    """
+    with tempfile.TemporaryDirectory(prefix="espace_", dir=DOSSIER_ESPACE) as dossier:
+        espace = ecrire_mouvements(fichiers_mouvement, dossier, taille_bloc)
+        somme_neg, mensuelles = sorties_depuis_espace(espace)
+    df_resultat = rotation_depuis_sorties(stocks, somme_neg)
+    if espace["dates_hors_plage"]["nombre"]:
+        df_resultat.attrs["dates_hors_plage"] = espace["dates_hors_plage"]
+    return df_resultat, mensuelles
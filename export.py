@@ -0,0 +1,122 @@
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+from cache import hash_dataframe, memoiser
+from extraits import homogeneiser_types
+from instrumentation import mesurer
+
+
+# Au-delà de ce nombre de cellules, le fichier Excel est écrit en flux
+# (mode constant_memory de xlsxwriter) plutôt que construit en mémoire
+SEUIL_CELLULES_FLUX = 2_000_000
+
+# Taille des blocs de lignes convertis à la fois en mode flux
+TAILLE_BLOC_FLUX = 10_000
+
+LIGNES_MAX_EXCEL = 1_048_576
+
+
+def _excel_en_memoire(df, sheet_name):
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return buffer.getvalue()
+
+
+def _excel_en_flux(df, sheet_name):
+    """
+    Écrit le fichier Excel ligne par ligne en mode `constant_memory` : seule la
+    ligne en cours est gardée en mémoire, le classeur est assemblé sur disque.
+    """
+    import xlsxwriter
+
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, "export.xlsx")
+        workbook = xlsxwriter.Workbook(chemin, {
+            "constant_memory": True,
+            "tmpdir": dossier,
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        })
+        worksheet = workbook.add_worksheet(sheet_name)
+        entete = workbook.add_format({"bold": True, "border": 1,
+                                      "align": "center", "valign": "top"})
+        worksheet.write_row(0, 0, [str(c) for c in df.columns], entete)
+
+        for debut in range(0, len(df), TAILLE_BLOC_FLUX):
+            bloc = df.iloc[debut:debut + TAILLE_BLOC_FLUX]
+            # Valeurs Python natives, valeurs manquantes => cellules vides
+            lignes = bloc.astype(object).where(bloc.notna(), None).to_numpy().tolist()
+            for i, ligne in enumerate(lignes, start=debut + 1):
+                worksheet.write_row(i, 0, ligne)
+
+        workbook.close()
+        with open(chemin, "rb") as f:
+            return f.read()
+
+
+@mesurer
+def exporter_excel(df, sheet_name):
+    """
+    Sérialise un DataFrame en fichier Excel (octets). Les gros résultats sont
+    écrits en flux pour ne pas garder à la fois le DataFrame et tout le classeur.
+    Args:
+        df (pd.DataFrame): Le résultat à exporter.
+        sheet_name (str): Le nom de la feuille.
+    Returns:
+        bytes: Le contenu du fichier .xlsx.
+    """
+    if len(df) >= LIGNES_MAX_EXCEL:
+        raise ValueError(
+            f"{len(df)} lignes : trop pour une feuille Excel, "
+            "utilisez l'export CSV ou Parquet"
+        )
+    if df.size >= SEUIL_CELLULES_FLUX:
+        return _excel_en_flux(df, sheet_name)
+    return _excel_en_memoire(df, sheet_name)
+
+
+@mesurer
+def exporter_csv(df, sheet_name=None):
+    """Sérialise un DataFrame en CSV au format français (;, virgule décimale)."""
+    return df.to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig")
+
+
+@mesurer
+def exporter_parquet(df, sheet_name=None):
+    """Sérialise un DataFrame au format Parquet."""
+    buffer = io.BytesIO()
+    homogeneiser_types(df.copy()).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+# Format -> (fonction d'export, extension, type MIME)
+FORMATS = {
+    "Excel": (
+        exporter_excel, ".xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    ),
+    "CSV": (exporter_csv, ".csv", "text/csv"),
+    "Parquet": (exporter_parquet, ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def exporter(df, format_export="Excel", sheet_name="Feuil1", cle=None):
+    """
+    Exporte un résultat dans le format demandé. Le fichier est mis en cache
+    selon l'empreinte du résultat : il n'est généré qu'une fois.
+    Args:
+        df (pd.DataFrame): Le résultat à exporter.
+        format_export (str): "Excel", "CSV" ou "Parquet".
+        sheet_name (str): Le nom de la feuille (Excel uniquement).
+        cle (tuple, optional): Identifiant du résultat (sinon, empreinte du DataFrame).
+    Returns:
+        bytes: Le contenu du fichier.
+    """
+    if cle is None:
+        cle = (hash_dataframe(df),)
+    fonction = FORMATS[format_export][0]
+    return memoiser(("export", format_export, sheet_name) + tuple(cle),
+                    fonction, df, sheet_name)
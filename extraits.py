@@ -0,0 +1,195 @@
+import hashlib
+import os
+import uuid
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from cache import hash_fichier, memoiser
+from fonctions2 import TYPE_TEXTE, lire_avec_header_auto, normaliser_reference
+from instrumentation import mesurer
+from nombres import convertir_nombres
+
+
+# Dossier du cache Parquet des extraits Sage normalisés
+DOSSIER_EXTRAITS = os.environ.get("AUTOREPORTING_EXTRAITS", ".cache_extraits")
+
+# À incrémenter quand la normalisation change (invalide les anciens fichiers)
+VERSION_NORMALISATION = 4
+
+COLONNES_NUMERIQUES = [
+    "Qté Stock Réel", "Qté Vendues", "Chiffre d'affaires HT", "Quantité"
+]
+COLONNES_REFERENCES = ["Référence Article", "N° Pièce"]
+
+# Types compacts : chaînes Arrow pour les identifiants et libellés, catégories
+# pour les familles (peu de valeurs distinctes, très répétées)
+TYPES_COMPACTS = {
+    "Référence Article": TYPE_TEXTE,
+    "N° Pièce": TYPE_TEXTE,
+    "Désignation Article": TYPE_TEXTE,
+    "Code - Intitulé Famille": "category",
+}
+
+
+def homogeneiser_types(df):
+    """
+    Convertit en texte les colonnes mêlant nombres et textes, que Parquet ne
+    sait pas stocker (les valeurs manquantes sont conservées).
+    """
+    for colonne in types_mixtes(df):
+        df[colonne] = df[colonne].where(df[colonne].isna(), df[colonne].astype(str))
+    return df
+
+
+def compacter_types(df, colonnes=None):
+    """
+    Convertit les colonnes de `TYPES_COMPACTS` présentes dans `df` (ou
+    seulement celles de `colonnes`) dans leur type compact (les valeurs
+    manquantes sont conservées).
+    """
+    for colonne, type_compact in TYPES_COMPACTS.items():
+        if colonne in df.columns and (colonnes is None or colonne in colonnes):
+            if type_compact == TYPE_TEXTE:
+                valeurs = df[colonne]
+                df[colonne] = valeurs.where(valeurs.isna(),
+                                            valeurs.astype(str)).astype(TYPE_TEXTE)
+            else:
+                df[colonne] = df[colonne].astype(type_compact)
+    return df
+
+
+def types_mixtes(df):
+    """Les colonnes de `df` mêlant nombres et textes (non stockables en Parquet)."""
+    return [colonne for colonne in df.columns[df.dtypes == object]
+            if pd.api.types.infer_dtype(df[colonne], skipna=True).startswith("mixed")]
+
+
+@mesurer
+def normaliser_extrait(df, normalisees=None):
+    """
+    Normalise un extrait Sage lu par `lire_avec_header_auto` :
+    - noms de colonnes nettoyés
+    - colonnes numériques converties en float (valeurs non convertibles listées
+      dans `df.attrs["valeurs_non_converties"]`)
+    - références nettoyées et en majuscules
+    - références, désignations et familles en types compacts (voir
+      `TYPES_COMPACTS`)
+
+    Args:
+        df (pd.DataFrame): L'extrait brut.
+        normalisees (list, optional): Les colonnes sur lesquelles le rapport
+            calcule (numériques ou références) : seules celles-ci sont
+            normalisées, les autres sont gardées telles que lues (fichiers
+            rendus à l'utilisateur). Toutes les colonnes si None.
+
+    Returns:
+        pd.DataFrame: L'extrait normalisé.
+    """
+    df.columns = df.columns.astype(str).str.strip()
+
+    def a_normaliser(colonnes):
+        return [c for c in colonnes if c in df.columns
+                and (normalisees is None or c in normalisees)]
+
+    non_converties = {}
+    for colonne in a_normaliser(COLONNES_NUMERIQUES):
+        df[colonne], invalides = convertir_nombres(df[colonne])
+        if len(invalides):
+            non_converties[colonne] = invalides.astype(str).unique().tolist()
+
+    for colonne in a_normaliser(COLONNES_REFERENCES):
+        df[colonne] = normaliser_reference(df[colonne])
+
+    if normalisees is None:
+        df = homogeneiser_types(compacter_types(df))
+    else:
+        df = compacter_types(df, a_normaliser(TYPES_COMPACTS))
+    df.attrs["valeurs_non_converties"] = non_converties
+    return df
+
+
+def _chemin_extrait(empreinte, sheet_name, mot_clef, colonnes=None, normalisees=None):
+    parametres = (VERSION_NORMALISATION, sheet_name, mot_clef)
+    if colonnes is not None:
+        parametres += (tuple(colonnes),)
+    if normalisees is not None:
+        parametres += (("normalisees",) + tuple(normalisees),)
+    suffixe = hashlib.blake2b(repr(parametres).encode(), digest_size=8).hexdigest()
+    return os.path.join(DOSSIER_EXTRAITS, f"{empreinte}_{suffixe}.parquet")
+
+
+def _lire_extrait(file_obj, empreinte, sheet_name, mot_clef, colonnes, normalisees):
+    """
+    Lit l'extrait depuis le cache Parquet, ou le construit et l'y écrit. Un
+    extrait complet déjà en cache sert à toutes les lectures ; sinon, seules
+    les colonnes demandées sont analysées, et l'extrait partiel est mis en
+    cache sous sa propre clé. Un extrait dont des colonnes gardées telles que
+    lues mêlent nombres et textes n'est pas écrit (Parquet ne les stocke pas).
+    """
+    complet = _chemin_extrait(empreinte, sheet_name, mot_clef)
+    if colonnes is not None and normalisees is None and os.path.exists(complet):
+        # Projection : seules les colonnes demandées (et présentes) sont lues
+        presentes = set(pq.read_schema(complet).names)
+        # Le stockage des chaînes n'est pas enregistré dans le fichier
+        with pd.option_context("mode.string_storage", "pyarrow"):
+            return pd.read_parquet(complet,
+                                   columns=[c for c in colonnes if c in presentes])
+
+    chemin = _chemin_extrait(empreinte, sheet_name, mot_clef, colonnes, normalisees)
+    if os.path.exists(chemin):
+        with pd.option_context("mode.string_storage", "pyarrow"):
+            return pd.read_parquet(chemin)
+
+    df = normaliser_extrait(
+        lire_avec_header_auto(file_obj, sheet_name=sheet_name, mot_clef=mot_clef,
+                              colonnes=colonnes),
+        normalisees
+    )
+    if not types_mixtes(df):
+        try:
+            os.makedirs(DOSSIER_EXTRAITS, exist_ok=True)
+            temporaire = f"{chemin}.{uuid.uuid4().hex}.tmp"
+            df.to_parquet(temporaire, index=False)
+            os.replace(temporaire, chemin)
+        except Exception:
+            # Le cache disque n'est qu'une optimisation
+            pass
+    if colonnes is None:
+        return df
+    return df[[c for c in colonnes if c in df.columns]]
+
+
+def cle_extrait(empreinte, sheet_name=0, mot_clef="N° Pièce", colonnes=None,
+                normalisees=None):
+    """Clé de l'extrait d'un fichier dans le cache en mémoire."""
+    return ("extrait", empreinte, sheet_name, mot_clef,
+            None if colonnes is None else tuple(colonnes),
+            None if normalisees is None else tuple(normalisees))
+
+
+@mesurer
+def charger_extrait(file_obj, sheet_name=0, mot_clef="N° Pièce", colonnes=None,
+                    normalisees=None):
+    """
+    Charge un extrait Sage normalisé (voir `normaliser_extrait`). Il est mis en
+    cache sur disque au format Parquet selon l'empreinte du contenu et les
+    paramètres de lecture ; avec `colonnes`, seules ces colonnes sont analysées
+    et chargées.
+
+    Args:
+        file_obj (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+        sheet_name (int ou str): La feuille à lire.
+        mot_clef (str): Le mot clé identifiant la ligne d'en-tête.
+        colonnes (list, optional): Les colonnes utiles (toutes si None).
+        normalisees (list, optional): Les seules colonnes à normaliser (voir
+            `normaliser_extrait`).
+
+    Returns:
+        pd.DataFrame: Une copie de l'extrait (les traitements le modifient en place).
+    """
+    empreinte = hash_fichier(file_obj)
+    cle = cle_extrait(empreinte, sheet_name, mot_clef, colonnes, normalisees)
+    df = memoiser(cle, _lire_extrait, file_obj, empreinte, sheet_name, mot_clef,
+                  colonnes, normalisees)
+    return df.copy()
@@ -1,63 +1,70 @@
+import itertools
+
 import pandas as pd
 import numpy as np
 
+from fonctions2 import lire_excel_par_blocs, normaliser_reference, reference_texte
+from instrumentation import mesurer
+from jointures import joindre_gauche
+from lecture_csv import lire_csv, lire_csv_par_blocs
+from nombres import convertir_nombres, nettoyer_et_convertir  # noqa: F401
+
+
+# Colonnes utilisées par chaque traitement (None : toutes les colonnes sont
+# conservées dans le résultat)
+COLONNES_STOCKS = ["Référence Article", "Désignation Article", "Qté Stock Réel"]
+COLONNES_VENTES = [
+    "Référence Article", "Désignation Article", "Qté Vendues", "Chiffre d'affaires HT"
+]
+COLONNES_STOCKS2 = None
+COLONNES_MOUVEMENTS = [
+    "Référence Article", "Désignation Article", "Code - Intitulé Famille", "Quantité"
+]
+
 
-def read_table(file_obj):
+@mesurer
+def read_table(file_obj, chunksize=None):
     """
     Lit un fichier CSV ou Excel à partir d’un chemin ou d’un fichier Streamlit.
+    Le format d'un CSV (encodage, BOM, séparateur) est deviné par `lire_csv`.
     Args:
         file_obj (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+        chunksize (int, optional): Pour un CSV, lit le fichier par blocs
+            d'environ `chunksize` lignes.
     Returns:
-        pd.DataFrame: Le DataFrame contenant les données.
+        pd.DataFrame: Le DataFrame contenant les données (ou un itérateur de
+        DataFrames si `chunksize` est donné pour un CSV).
     """
 
     # Si c’est un chemin (str)
     if isinstance(file_obj, str):
-        if file_obj.endswith(".csv"):
-            return pd.read_csv(file_obj, sep=';', encoding='utf-8')
-        elif file_obj.endswith(".xlsx"):
-            return pd.read_excel(file_obj)
-        else:
-            raise ValueError("Le fichier doit être au format .csv ou .xlsx")
+        filename = file_obj
 
     # Si c’est un fichier uploadé (Streamlit UploadedFile)
     elif hasattr(file_obj, "name"):
         filename = file_obj.name
-        if filename.endswith(".csv"):
-            return pd.read_csv(file_obj, sep=';', encoding='utf-8')
-        elif filename.endswith(".xlsx"):
-            return pd.read_excel(file_obj)
-        else:
-            raise ValueError("Le fichier doit être au format .csv ou .xlsx")
 
     else:
         raise TypeError("Entrée non reconnue : chemin ou fichier Streamlit attendu.")
 
-
-def nettoyer_et_convertir(col):
-    """
-    Nettoie une colonne de données en supprimant les espaces (y compris insécables),
-    remplaçant les virgules par des points, et convertissant en float.
-    Args:
-        col (pd.Series): La colonne à nettoyer et convertir.
-    Returns:
-        pd.Series: La colonne nettoyée et convertie en float.
-    """
-    return (
-        col.astype(str)
-        .str.replace("\xa0", "", regex=False)  # supprime les espaces insécables
-        .str.replace(" ", "")                  # supprime les espaces classiques
-        .str.replace(",", ".", regex=False)    # remplace virgule par point
-        .replace("", "0")                      # chaîne vide => 0
-        .astype(float)
-    )
+    if filename.endswith(".csv"):
+        if chunksize is not None:
+            return lire_csv_par_blocs(file_obj, chunksize)
+        return lire_csv(file_obj)
+    elif filename.endswith(".xlsx"):
+        return pd.read_excel(file_obj)
+    else:
+        raise ValueError("Le fichier doit être au format .csv ou .xlsx")
 
 
-def preparer_donnees(stocks, ventes):
+@mesurer
+def preparer_donnees(stocks, ventes, doublons="somme", cle_ventes=None):
     """
     Prépare les données pour le calcul du taux de rotation.
-    - Nettoie les colonnes numériques
-    - Effectue une jointure gauche
+    - Nettoie les colonnes numériques (valeurs non convertibles listées dans
+      `df_final.attrs["valeurs_non_converties"]`)
+    - Effectue une jointure gauche (ventes en double traitées selon
+      `doublons`, voir `df_final.attrs["jointure"]`)
     - Remplace les NA
     - Calcule le taux de rotation
     - Sélectionne et renomme les colonnes pertinentes
@@ -65,19 +72,31 @@ def preparer_donnees(stocks, ventes):
     Args:
         stocks (pd.DataFrame): Données de stock
         ventes (pd.DataFrame): Données de ventes
+        doublons (str): Le traitement des ventes d'une même référence (voir
+            `jointures.POLITIQUES`) : sommées par défaut.
+        cle_ventes (tuple, optional): Identifiant du contenu des ventes : leur
+            table indexée est réutilisée (voir `jointures.joindre_gauche`).
 
     Returns:
         pd.DataFrame: Données finales prêtes à être exportées
     """
-    # Nettoyage des colonnes numériques
-    ventes["Qté Vendues"] = nettoyer_et_convertir(ventes["Qté Vendues"])
-    ventes["Chiffre d'affaires HT"] = nettoyer_et_convertir(
-        ventes["Chiffre d'affaires HT"]
-    )
-    stocks["Qté Stock Réel"] = nettoyer_et_convertir(stocks["Qté Stock Réel"])
-
-    # LEFT MERGE sur "Référence Article"
-    df = pd.merge(stocks, ventes, on="Référence Article", how="left")
+    # Nettoyage des colonnes numériques (les cellules non convertibles sont
+    # mises de côté pour être signalées)
+    non_converties = {
+        **stocks.attrs.get("valeurs_non_converties", {}),
+        **ventes.attrs.get("valeurs_non_converties", {}),
+    }
+    for table, colonne in [(ventes, "Qté Vendues"),
+                           (ventes, "Chiffre d'affaires HT"),
+                           (stocks, "Qté Stock Réel")]:
+        table[colonne], invalides = convertir_nombres(table[colonne])
+        if len(invalides):
+            non_converties[colonne] = invalides.astype(str).unique().tolist()
+
+    # LEFT MERGE sur "Référence Article" : les ventes d'une même référence sont
+    # regroupées, une ligne de stock donne exactement une ligne de résultat
+    df = joindre_gauche(stocks, ventes, "Référence Article", politique=doublons,
+                        cle_cache=cle_ventes)
 
     # Remplacement des valeurs manquantes
     df["Qté Vendues"] = df["Qté Vendues"].fillna(0)
@@ -106,16 +125,114 @@ def preparer_donnees(stocks, ventes):
         inplace=True
     )
 
+    df_final.attrs["valeurs_non_converties"] = non_converties
+    df_final.attrs["jointure"] = df.attrs["jointure"]
+
     return df_final
 
 
-def preparer_donnees2(stocks, mouvements):
+def lire_par_blocs(file_obj, taille_bloc, mot_clef="Référence Article"):
+    """
+    Lit un fichier CSV ou Excel par blocs de lignes.
+    Args:
+        file_obj (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+        taille_bloc (int): Le nombre de lignes par bloc.
+        mot_clef (str): Le mot clé de la ligne d'en-tête.
+    Returns:
+        iterator: Les blocs (pd.DataFrame).
+    """
+    nom = file_obj if isinstance(file_obj, str) else getattr(file_obj, "name", "")
+    if nom.endswith(".csv"):
+        return lire_csv_par_blocs(file_obj, taille_bloc, mot_clef=mot_clef)
+    return lire_excel_par_blocs(file_obj, taille_bloc, mot_clef=mot_clef)
+
+
+@mesurer
+def agreger_ventes(blocs):
+    """
+    Agrège des blocs de ventes par Référence Article au fil de la lecture :
+    seul l'agrégat (une ligne par article) est gardé en mémoire.
+    Args:
+        blocs (iterable): Les blocs du fichier de ventes (pd.DataFrame).
+    Returns:
+        pd.DataFrame: Qté Vendues et Chiffre d'affaires HT sommés par article, avec
+        la première Désignation Article rencontrée.
+    """
+    agregation = {
+        "Désignation Article": "first",
+        "Qté Vendues": "sum",
+        "Chiffre d'affaires HT": "sum",
+    }
+    total = None
+    non_converties = {}
+
+    for bloc in blocs:
+        bloc.columns = bloc.columns.str.strip()
+        bloc = bloc[COLONNES_VENTES].copy()
+        bloc["Référence Article"] = normaliser_reference(bloc["Référence Article"])
+        for colonne in ("Qté Vendues", "Chiffre d'affaires HT"):
+            bloc[colonne], invalides = convertir_nombres(bloc[colonne])
+            if len(invalides):
+                non_converties.setdefault(colonne, set()).update(
+                    invalides.astype(str)
+                )
+
+        if total is not None:
+            bloc = pd.concat([total, bloc], ignore_index=True)
+        total = (
+            bloc.groupby("Référence Article", sort=False)
+            .agg(agregation)
+            .reset_index()
+        )
+
+    if total is None:
+        total = pd.DataFrame(columns=COLONNES_VENTES)
+    total.attrs["valeurs_non_converties"] = {
+        colonne: sorted(valeurs) for colonne, valeurs in non_converties.items()
+    }
+    return total
+
+
+@mesurer
+def preparer_donnees_flux(stocks, fichier_ventes, taille_bloc=100_000):
+    """
+    Variante de `preparer_donnees` à mémoire constante : le fichier de ventes est
+    lu par blocs et agrégé par article au fil de l'eau, puis l'agrégat (petit)
+    est joint à la table des stocks.
+
+    Le résultat est identique à celui de `preparer_donnees` sur des extraits
+    chargés avec `charger_extrait` (références normalisées).
+
+    Args:
+        stocks (pd.DataFrame): Données de stock
+        fichier_ventes (str, UploadedFile ou list): Le ou les fichiers de ventes
+        taille_bloc (int): Nombre de lignes de ventes lues à la fois
+
+    Returns:
+        pd.DataFrame: Données finales prêtes à être exportées
+    """
+    fichiers = fichier_ventes if isinstance(fichier_ventes, list) else [fichier_ventes]
+    ventes = agreger_ventes(itertools.chain.from_iterable(
+        lire_par_blocs(fichier, taille_bloc) for fichier in fichiers
+    ))
+    return preparer_donnees(stocks, ventes)
+
+
+@mesurer
+def sorties_par_article(mouvements):
+    """
+    Calcule la quantité sortie (mouvements négatifs) par article.
+    Args:
+        mouvements (pd.DataFrame): Les mouvements de stock.
+    Returns:
+        pd.DataFrame: Référence Article, Qté Sortie (positive), Désignation Article
+        et Code - Intitulé Famille.
+    """
     # Calculer Qté Sortie négative par article
     quant_neg = mouvements[mouvements["Quantité"] < 0].copy()
     quant_neg["Référence Article"] = (
-        quant_neg["Référence Article"].astype(str).str.strip()
+        reference_texte(quant_neg["Référence Article"])
     )
-    stocks["Référence Article"] = stocks["Référence Article"].astype(str).str.strip()
 
     somme_neg = (
         quant_neg.groupby("Référence Article")
@@ -131,17 +248,48 @@ def preparer_donnees2(stocks, mouvements):
     # Qté Sortie positive
     somme_neg["Qté Sortie"] = somme_neg["Qté Sortie"].abs()
 
+    return somme_neg
+
+
+def completer(colonne, remplacement):
+    """
+    Complète les valeurs manquantes de `colonne` par celles de `remplacement`.
+    Deux colonnes catégorielles gardent ce type (catégories réunies).
+    """
+    categorielles = [isinstance(c.dtype, pd.CategoricalDtype)
+                     for c in (colonne, remplacement)]
+    if all(categorielles):
+        categories = colonne.cat.categories.union(remplacement.cat.categories)
+        colonne = colonne.cat.set_categories(categories)
+        remplacement = remplacement.cat.set_categories(categories)
+    elif any(categorielles):
+        colonne, remplacement = colonne.astype(object), remplacement.astype(object)
+    return colonne.fillna(remplacement)
+
+
+@mesurer
+def rotation_depuis_sorties(stocks, somme_neg):
+    """
+    Joint les sorties par article aux stocks et calcule le taux de rotation.
+    Args:
+        stocks (pd.DataFrame): Données de stock
+        somme_neg (pd.DataFrame): Sorties par article (voir `sorties_par_article`)
+    Returns:
+        pd.DataFrame: Stocks et sorties par article avec le taux de rotation
+    """
+    stocks["Référence Article"] = reference_texte(stocks["Référence Article"])
+
     # Fusionner directement avec stocks
     df = pd.merge(stocks, somme_neg, on="Référence Article", how="outer")
 
     # Pour la colonne Désignation Article
-    df["Désignation Article"] = df["Désignation Article_x"].fillna(
-        df["Désignation Article_y"]
+    df["Désignation Article"] = completer(
+        df["Désignation Article_x"], df["Désignation Article_y"]
     )
 
     # Pour la colonne Code - Intitulé Famille
-    df["Code - Intitulé Famille"] = (
-        df["Code - Intitulé Famille_x"].fillna(df["Code - Intitulé Famille_y"])
+    df["Code - Intitulé Famille"] = completer(
+        df["Code - Intitulé Famille_x"], df["Code - Intitulé Famille_y"]
     )
 
     # Ensuite tu peux supprimer les colonnes originales
@@ -156,14 +304,29 @@ def preparer_donnees2(stocks, mouvements):
     df["Taux de rotation"] = (
         df["Qté Sortie"] / df["Qté Stock Réel"]
     )
-    df["Taux de rotation"].replace([np.inf, -np.inf], np.nan, inplace=True)
+    df["Taux de rotation"] = df["Taux de rotation"].replace([np.inf, -np.inf], np.nan)
 
     return df
 
 
+@mesurer
+def preparer_donnees2(stocks, mouvements):
+    """
+    Calcule le taux de rotation par article à partir des stocks et des
+    mouvements (Qté Sortie / Qté Stock Réel).
+    Args:
+        stocks (pd.DataFrame): Données de stock
+        mouvements (pd.DataFrame): Mouvements de stock
+    Returns:
+        pd.DataFrame: Stocks et sorties par article avec le taux de rotation
+    """
+    return rotation_depuis_sorties(stocks, sorties_par_article(mouvements))
+
+
+@mesurer
 def groupby_famille(df_article):
     df_grouped = (
-        df_article.groupby("Code - Intitulé Famille")[
+        df_article.groupby("Code - Intitulé Famille", observed=True)[
             ["Taux de rotation", "Qté Stock Réel", "Qté Sortie"]
         ]
         .mean()
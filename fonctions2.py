@@ -1,29 +1,308 @@
+import numpy as np
 import pandas as pd
 import re
+from pandas.io.parsers import TextParser
 
+from instrumentation import etape, mesurer
+from jointures import joindre_gauche
+from lecture_csv import est_csv, lire_csv, lire_entete_csv
+from rapprochement import apparier
+from schemas import ALIAS_REMARQUES, NB_LIGNES_EXEMPLE, cle_nom, noms_canoniques
 
-def trouver_ligne_header(filepath, mot_clef="N° Pièce", sheet_name=0):
-    # On lit les 10 premières lignes du fichier pour chercher le header
-    preview = pd.read_excel(
-        filepath, sheet_name=sheet_name, nrows=10, header=None
-    )
-    for i, row in preview.iterrows():
-        if row.astype(str).str.contains(mot_clef).any():
-            return i
+
+# Type des colonnes de texte compactes (chaînes stockées par Arrow)
+TYPE_TEXTE = "string[pyarrow]"
+
+# Espaces retirés des clés : tous les espaces Unicode (ceux de `str.split` et
+# du `\s` de `re`), énumérés pour que les chaînes Arrow (expressions RE2, où
+# `\s` ne couvre que l'ASCII) et les colonnes objet donnent les mêmes clés
+ESPACES = ("\t\n\v\f\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002"
+           "\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029"
+           "\u202f\u205f\u3000")
+# Espaces insécables, retirés même à l'intérieur d'un numéro de pièce
+INSECABLES = "\xa0\u2007\u202f"
+
+_MOTIF_ESPACES = f"[{ESPACES}]+"
+_MOTIF_INSECABLES = f"[{INSECABLES}]+"
+
+
+def _convertir_cellule(valeur):
+    """Convertit une valeur openpyxl comme le fait pd.read_excel."""
+    if valeur is None:
+        return ""
+    if isinstance(valeur, float) and valeur.is_integer():
+        return int(valeur)
+    return valeur
+
+
+def _iterer_lignes_excel(filepath, sheet_name=0):
+    """
+    Parcourt paresseusement les lignes d'une feuille Excel (mode lecture seule
+    d'openpyxl). Les cellules vides de fin de ligne sont retirées.
+    Args:
+        filepath (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+        sheet_name (int ou str): Index ou nom de la feuille.
+    Returns:
+        generator: Les lignes (listes de valeurs) de la feuille.
+    """
+    from openpyxl import load_workbook
+
+    if hasattr(filepath, "seek"):
+        filepath.seek(0)
+    wb = load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+    try:
+        if isinstance(sheet_name, int):
+            ws = wb.worksheets[sheet_name]
+        elif sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+        else:
+            raise ValueError(f"La feuille '{sheet_name}' est introuvable dans le "
+                             f"fichier (feuilles : {', '.join(wb.sheetnames)})")
+        ws.reset_dimensions()
+        for ligne in ws.iter_rows(values_only=True):
+            ligne = [_convertir_cellule(v) for v in ligne]
+            while ligne and ligne[-1] == "":
+                ligne.pop()
+            yield ligne
+    finally:
+        wb.close()
+
+
+def _chercher_header(lignes, mot_clef, nb_lignes=10):
+    """
+    Cherche parmi les premières lignes celle qui contient le mot clé.
+    Args:
+        lignes (iterable): Les lignes du fichier.
+        mot_clef (str): Le mot clé à chercher.
+        nb_lignes (int): Le nombre de lignes à examiner.
+    Returns:
+        tuple: (index de la ligne d'en-tête, lignes lues jusqu'à l'en-tête inclus)
+    """
+    lues = []
+    for i, ligne in enumerate(lignes):
+        if i >= nb_lignes:
+            break
+        lues.append(ligne)
+        if any(mot_clef in str(v) for v in ligne):
+            return i, lues
     raise ValueError(f"Impossible de trouver une ligne contenant '{mot_clef}'")
 
 
-def lire_avec_header_auto(filepath, sheet_name=0, mot_clef="N° Pièce"):
-    """    Lit un fichier Excel et détermine automatiquement la ligne d'en-tête
-    en cherchant un mot clé spécifique dans les premières lignes."""
-    header_line = trouver_ligne_header(
-        filepath, mot_clef=mot_clef, sheet_name=sheet_name
-    )
-    df = pd.read_excel(filepath, sheet_name=sheet_name, skiprows=header_line)
+def trouver_ligne_header(filepath, mot_clef="N° Pièce", sheet_name=0):
+    # On parcourt les 10 premières lignes du fichier pour chercher le header
+    return _chercher_header(_iterer_lignes_excel(filepath, sheet_name), mot_clef)[0]
+
+
+def lire_entete(filepath, sheet_name=0, mot_clef="N° Pièce",
+                nb_lignes=NB_LIGNES_EXEMPLE):
+    """
+    Lit seulement la ligne d'en-tête d'un fichier et les premières lignes qui
+    la suivent, pour contrôler le fichier avant de le lire en entier.
+    Args:
+        filepath (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+        sheet_name (int ou str): Index ou nom de la feuille (ignoré pour un CSV).
+        mot_clef (str): Le mot clé identifiant la ligne d'en-tête.
+        nb_lignes (int): Le nombre de lignes de données à lire.
+    Returns:
+        tuple: (noms lus sur la ligne d'en-tête, premières lignes de données)
+    """
+    if est_csv(filepath):
+        return lire_entete_csv(filepath, mot_clef, nb_lignes)
+
+    lignes = _iterer_lignes_excel(filepath, sheet_name)
+    try:
+        header_line, debut = _chercher_header(lignes, mot_clef)
+        exemples = [ligne for _, ligne in zip(range(nb_lignes), lignes)]
+    finally:
+        lignes.close()
+    return debut[header_line], exemples
+
+
+@mesurer
+def lire_avec_header_auto(filepath, sheet_name=0, mot_clef="N° Pièce", colonnes=None):
+    """
+    Lit un fichier Excel et détermine automatiquement la ligne d'en-tête
+    en cherchant un mot clé spécifique dans les premières lignes.
+    Le fichier n'est ouvert qu'une seule fois : les lignes sont lues à la volée,
+    et celles qui suivent l'en-tête servent directement à construire le DataFrame.
+    Les colonnes prennent leur nom connu (voir `schemas.noms_canoniques`) ; avec
+    `colonnes`, seules celles-ci sont analysées.
+    Un fichier .csv est lu par `lire_csv` (`sheet_name` est alors ignoré).
+    """
+    if est_csv(filepath):
+        return lire_csv(filepath, mot_clef=mot_clef, colonnes=colonnes)
+
+    lignes = _iterer_lignes_excel(filepath, sheet_name)
+    try:
+        with etape("recherche_en_tete"):
+            header_line, debut = _chercher_header(lignes, mot_clef)
+        with etape("lecture_lignes") as mesure:
+            data = debut[header_line:] + list(lignes)
+            mesure["lignes_sortie"] = len(data) - 1
+    finally:
+        lignes.close()
+
+    # Même mise en forme que pd.read_excel : lignes vides finales retirées,
+    # lignes complétées à la largeur maximale de la feuille
+    while len(data) > 1 and not data[-1]:
+        data.pop()
+    largeur = max(len(ligne) for ligne in debut + data)
+    data[0] = noms_canoniques(data[0] + [""] * (largeur - len(data[0])))
+
+    if colonnes is None:
+        data = [ligne + [""] * (largeur - len(ligne)) for ligne in data]
+    else:
+        # Projection : seules les cellules des colonnes utiles sont analysées
+        positions = [i for i, nom in enumerate(data[0]) if nom in colonnes]
+        data = [[ligne[i] if i < len(ligne) else "" for i in positions]
+                for ligne in data]
+
+    df = TextParser(data, header=0).read()
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def lire_excel_par_blocs(filepath, taille_bloc, sheet_name=0, mot_clef="N° Pièce"):
+    """
+    Lit un fichier Excel par blocs de lignes, sans jamais le charger en entier :
+    chaque bloc est un DataFrame avec les colonnes de la ligne d'en-tête.
+    Args:
+        filepath (str ou UploadedFile): Le chemin du fichier ou l'objet UploadedFile.
+        taille_bloc (int): Le nombre de lignes par bloc.
+        sheet_name (int ou str): Index ou nom de la feuille.
+        mot_clef (str): Le mot clé identifiant la ligne d'en-tête.
+    Returns:
+        generator: Les blocs (pd.DataFrame).
+    """
+    lignes = _iterer_lignes_excel(filepath, sheet_name)
+    try:
+        header_line, debut = _chercher_header(lignes, mot_clef)
+        header = noms_canoniques(debut[header_line])
+        bloc = []
+        for ligne in lignes:
+            if ligne:
+                bloc.append(ligne)
+            if len(bloc) == taille_bloc:
+                yield _bloc_vers_dataframe(header, bloc)
+                bloc = []
+        if bloc:
+            yield _bloc_vers_dataframe(header, bloc)
+    finally:
+        lignes.close()
+
+
+def _bloc_vers_dataframe(header, bloc):
+    largeur = max(len(header), max(len(ligne) for ligne in bloc))
+    data = [ligne + [""] * (largeur - len(ligne)) for ligne in [header] + bloc]
+    df = TextParser(data, header=0).read()
     df.columns = df.columns.str.strip()
     return df
 
 
+def _normaliser_distinctes(serie, normaliser):
+    """
+    Applique `normaliser` (str -> str) aux seules valeurs distinctes d'une
+    colonne objet, converties en texte, puis les redistribue. Les valeurs
+    manquantes sont conservées, comme dans une colonne Arrow.
+    """
+    codes, uniques = pd.factorize(serie)
+    normalises = np.array([normaliser(str(u)) for u in uniques] + [np.nan],
+                          dtype=object)
+    # Code -1 (valeur manquante) : le dernier élément
+    return pd.Series(normalises.take(codes), index=serie.index, name=serie.name)
+
+
+def normaliser_texte(serie, tous_espaces=True):
+    """
+    Normalise une colonne de texte d'un seul tenant (sans apply) : conversion en
+    chaîne, suppression des espaces (voir `ESPACES`, insécables compris),
+    majuscules. Les valeurs distinctes ne sont normalisées qu'une fois puis
+    redistribuées ; les valeurs manquantes sont conservées. Une colonne Arrow et
+    une colonne objet de mêmes valeurs donnent les mêmes clés.
+    Args:
+        serie (pd.Series): La colonne à normaliser.
+        tous_espaces (bool): Si True, supprime tous les espaces (clés de jointure) ;
+            sinon, seuls les espaces de début/fin et les insécables sont retirés.
+    Returns:
+        pd.Series: La colonne normalisée.
+    """
+    if isinstance(serie.dtype, pd.StringDtype):
+        # Texte compact : traitement vectorisé
+        if tous_espaces:
+            return serie.str.replace(_MOTIF_ESPACES, "", regex=True).str.upper()
+        return (serie.str.strip(ESPACES)
+                .str.replace(_MOTIF_INSECABLES, "", regex=True).str.upper())
+
+    if tous_espaces:
+        espaces = re.compile(_MOTIF_ESPACES)
+        return _normaliser_distinctes(serie, lambda u: espaces.sub("", u).upper())
+    insecables = re.compile(_MOTIF_INSECABLES)
+    return _normaliser_distinctes(
+        serie, lambda u: insecables.sub("", u.strip(ESPACES)).upper()
+    )
+
+
+def reference_texte(serie):
+    """
+    Convertit une colonne de références en texte sans espaces de bord. Une
+    colonne déjà en texte compact (voir `TYPE_TEXTE`) le reste.
+    Args:
+        serie (pd.Series): La colonne de références.
+    Returns:
+        pd.Series: La colonne nettoyée.
+    """
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie.str.strip()
+    return serie.astype(str).str.strip()
+
+
+def normaliser_reference(serie):
+    """
+    Supprime les espaces de bord et insécables d'une colonne de références et la
+    met en majuscules. Les références numériques entières restent sans décimale
+    et les valeurs manquantes sont conservées.
+    Args:
+        serie (pd.Series): La colonne de références.
+    Returns:
+        pd.Series: La colonne normalisée.
+    """
+    if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+        serie = serie.astype("Int64")
+    return normaliser_texte(serie, tous_espaces=False).where(serie.notna())
+
+
+def construire_cle(df):
+    """
+    Construit la clé Référence + Désignation normalisée de chaque ligne,
+    équivalente à nettoyer_chaine appliquée ligne à ligne (valeur manquante :
+    partie vide).
+    Args:
+        df (pd.DataFrame): Le DataFrame contenant `Référence` et `Désignation`.
+    Returns:
+        pd.Series: La clé de jointure.
+    """
+    return (normaliser_texte(df['Référence']).fillna("") + "__"
+            + normaliser_texte(df['Désignation']).fillna(""))
+
+
+def normaliser_designation(serie):
+    """
+    Normalise une colonne de désignations pour les comparer entre elles :
+    majuscules, espaces de bord retirés, espaces intérieurs (classiques et
+    insécables) réduits à un seul.
+    Args:
+        serie (pd.Series): La colonne `Désignation`.
+    Returns:
+        pd.Series: La colonne normalisée.
+    """
+    if isinstance(serie.dtype, pd.StringDtype):
+        return (serie.str.replace(_MOTIF_ESPACES, " ", regex=True).str.strip(" ")
+                .str.upper())
+
+    espaces = re.compile(_MOTIF_ESPACES)
+    return _normaliser_distinctes(serie, lambda u: espaces.sub(" ", u).strip(" ").upper())
+
+
 def nettoyer_chaine(s):
     if pd.isna(s):
         return ''
@@ -33,15 +312,70 @@ def nettoyer_chaine(s):
     return s.upper()
 
 
-def traiter_fichiers(ancien_path, nouveau_path):
+# Colonnes utilisées dans l'ancien fichier de suivi de commandes
+COLONNES_SUIVI_ANCIEN = ["Référence", "Désignation", "Remarques"]
+
+# Colonne ajoutée par le report approché : 1 pour une clé identique, la
+# similarité des désignations pour un rapprochement, vide sinon
+COLONNE_CONFIANCE = "Confiance remarque"
+
+
+@mesurer
+def traiter_fichiers(ancien_path, nouveau_path, seuil=None):
     """
     Transfère les remarques de l'ancien fichier vers le nouveau,
     en utilisant une clé basée sur Référence + Désignation.
     """
-    try:
-        df_ancien = lire_avec_header_auto(ancien_path)
-        df_nouveau = lire_avec_header_auto(nouveau_path)
+    return reporter_remarques(
+        lire_avec_header_auto(ancien_path), lire_avec_header_auto(nouveau_path),
+        seuil=seuil
+    )
+
+
+def _rapprocher(df_ancien, df_nouveau, a_rapprocher, seuil):
+    """
+    Reporte les remarques des lignes de `df_nouveau` sans clé identique
+    (masque `a_rapprocher`) depuis la ligne de même référence de `df_ancien`
+    dont la désignation est la plus proche (voir `rapprochement.apparier`).
+    Returns:
+        pd.Series: La similarité de chaque ligne rapprochée.
+    """
+    anciens = df_ancien[df_ancien["Remarques"].notna()].drop_duplicates(
+        'key', keep='last'
+    )
 
+    def blocs(df):
+        return pd.DataFrame({
+            "reference": normaliser_texte(df["Référence"]),
+            "designation": normaliser_designation(df["Désignation"]),
+        }, index=df.index)
+
+    appariement = apparier(blocs(anciens), blocs(df_nouveau[a_rapprocher]), seuil)
+    reportees = pd.Series(
+        anciens["Remarques"].to_numpy().take(appariement["position"].to_numpy()),
+        index=appariement.index
+    )
+    df_nouveau["Remarques"] = df_nouveau["Remarques"].combine_first(reportees)
+    return appariement["similarite"]
+
+
+@mesurer
+def reporter_remarques(df_ancien, df_nouveau, seuil=None):
+    """
+    Transfère les remarques d'un ancien suivi de commandes (déjà lu) vers le
+    nouveau, en utilisant une clé basée sur Référence + Désignation.
+    Avec `seuil`, une ligne sans clé identique reçoit la remarque de la ligne
+    de même référence dont la désignation est la plus proche, si leur
+    similarité atteint `seuil` ; la colonne `COLONNE_CONFIANCE` est ajoutée.
+    Args:
+        df_ancien (pd.DataFrame): L'ancien suivi, avec la colonne `Remarques`.
+        df_nouveau (pd.DataFrame): Le nouveau suivi.
+        seuil (float ou None): La similarité minimale du report approché
+            (entre 0 et 1), None pour un report sur clé identique seulement.
+    Returns:
+        pd.DataFrame: Le nouveau suivi avec les remarques reportées.
+    """
+    try:
         # Nettoyage des noms de colonnes
         df_ancien.columns = df_ancien.columns.str.strip()
         df_nouveau.columns = df_nouveau.columns.str.strip()
@@ -51,23 +385,28 @@ def traiter_fichiers(ancien_path, nouveau_path):
             raise ValueError("La colonne 'Remarques' est absente du fichier ancien")
 
         # Création des clés de jointure
-        df_ancien['key'] = df_ancien.apply(
-            lambda row: nettoyer_chaine(str(row['Référence'])) + "__" +
-                        nettoyer_chaine(str(row['Désignation'])),
-            axis=1
-        )
-        df_nouveau['key'] = df_nouveau.apply(
-            lambda row: nettoyer_chaine(str(row['Référence'])) + "__" +
-                        nettoyer_chaine(str(row['Désignation'])),
-            axis=1
-        )
+        df_ancien['key'] = construire_cle(df_ancien)
+        df_nouveau['key'] = construire_cle(df_nouveau)
 
-        # Dictionnaire : clé -> remarque
-        remarques_map = df_ancien.set_index('key')["Remarques"].to_dict()
+        # Correspondance clé -> remarque (la dernière occurrence l'emporte)
+        remarques_map = (
+            df_ancien.drop_duplicates('key', keep='last')
+            .set_index('key')["Remarques"]
+        )
 
         # Ajout des remarques dans le fichier nouveau
         df_nouveau["Remarques"] = df_nouveau["key"].map(remarques_map)
 
+        # Report approché pour les lignes dont la clé a changé
+        if seuil is not None:
+            identiques = df_nouveau["key"].isin(remarques_map.index)
+            confiance = pd.Series(np.where(identiques, 1.0, np.nan),
+                                  index=df_nouveau.index)
+            if not identiques.all():
+                similarites = _rapprocher(df_ancien, df_nouveau, ~identiques, seuil)
+                confiance.loc[similarites.index] = similarites
+            df_nouveau[COLONNE_CONFIANCE] = confiance
+
         # Suppression de la clé temporaire
         df_nouveau.drop(columns=["key"], inplace=True)
 
@@ -76,13 +415,62 @@ def traiter_fichiers(ancien_path, nouveau_path):
     except Exception as e:
         raise Exception(f"Erreur dans traitement fichiers : {e}")
 
+
+def colonne_remarques(colonnes, nom="REMARQUES"):
+    """
+    La colonne des remarques d'un fichier exporté : celle qui s'appelle `nom`
+    ou l'un des noms de `ALIAS_REMARQUES` (casse, accents et espaces ignorés).
+    Raises:
+        ValueError: Aucune colonne de remarques dans le fichier.
+    """
+    cles = [cle_nom(n) for n in [nom] + ALIAS_REMARQUES]
+    for cle in cles:
+        for colonne in colonnes:
+            if cle_nom(colonne) == cle:
+                return colonne
+    raise ValueError(f"La colonne '{nom}' est absente du fichier")
+
+
+@mesurer
 def nettoyer_num_piece(df):
     """    Nettoie la colonne "N° Pièce" d'un DataFrame."""
-    df["N° Pièce"] = (
-        df["N° Pièce"]
-        .astype(str)
-        .str.strip()
-        .str.upper()
-        .str.replace("\xa0", "", regex=False)  # supprime les espaces insécables
-    )
+    df["N° Pièce"] = normaliser_texte(df["N° Pièce"], tous_espaces=False)
     return df
+
+
+@mesurer
+def fusionner_bls(bls_t, bls_tm1, doublons="premier", cle_anciens=None):
+    """
+    Reporte les remarques des anciens bons de livraison sur les nouveaux.
+    Args:
+        bls_t (pd.DataFrame): Les bons de livraison du mois.
+        bls_tm1 (pd.DataFrame): Les anciens bons de livraison avec remarques
+            (colonne REMARQUES, quelle que soit sa casse, voir
+            `colonne_remarques`).
+        doublons (str): La remarque retenue pour un BL de plusieurs lignes
+            (voir `jointures.POLITIQUES`) : la première non vide par défaut.
+        cle_anciens (tuple, optional): Identifiant du contenu des anciens bons
+            de livraison : leur table indexée est réutilisée (voir
+            `jointures.joindre_gauche`).
+    Returns:
+        pd.DataFrame: Les nouveaux bons de livraison avec la colonne REMARQUES.
+    """
+    # nettoyer le nom des colonnes et les numéros de pièces
+    bls_t.columns = bls_t.columns.str.strip()
+    bls_tm1.columns = bls_tm1.columns.str.strip()
+    bls_tm1 = bls_tm1.rename(columns={colonne_remarques(bls_tm1.columns): "REMARQUES"})
+
+    bls_t = nettoyer_num_piece(bls_t)
+    bls_tm1 = nettoyer_num_piece(bls_tm1)
+
+    # Fusion sans doublons : un BL de plusieurs lignes garde une seule
+    # remarque, chaque nouvelle ligne donne une seule ligne
+    df_bls = joindre_gauche(
+        bls_t,
+        bls_tm1[["N° Pièce", "REMARQUES"]],
+        "N° Pièce", politique=doublons, cle_cache=cle_anciens
+    )
+
+    df_bls.drop(columns=["Prix Revient Total"], inplace=True, errors='ignore')
+
+    return df_bls
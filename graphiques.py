@@ -0,0 +1,120 @@
+import io
+
+from cache import memoiser
+from instrumentation import mesurer
+
+
+# Moteurs de rendu proposés : image statique (matplotlib/seaborn) ou graphique
+# interactif plus léger (Altair, rendu par le navigateur)
+RENDUS = ["Image (matplotlib)", "Interactif (Altair)"]
+
+# Graphiques du tableau de bord de l'onglet 1 : titre de la section, colonne
+# de classement, colonne en abscisse, titre et libellé de l'abscisse
+GRAPHIQUES_ROTATION = [
+    {
+        "section": "📊 Top 10 par chiffre d'affaires",
+        "tri": "Chiffre d'affaires HT",
+        "x": "Taux de rotation",
+        "titre": "Top 10 produits par CA - Taux de rotation en abscisse",
+        "xlabel": "Taux de rotation",
+    },
+    {
+        "section": "📊 Top 10 par taux de rotation",
+        "tri": "Taux de rotation",
+        "x": "Chiffre d'affaires HT",
+        "titre": "Top 10 par taux de rotation - CA en abscisse",
+        "xlabel": "Chiffre d'affaires HT en MAD",
+    },
+]
+
+
+def top_n(df, colonne, n=10, colonnes=None):
+    """
+    Sélectionne les `n` lignes ayant les plus grandes valeurs de `colonne`,
+    par sélection partielle (sans trier tout le DataFrame). Les valeurs
+    manquantes sont ignorées.
+    Args:
+        df (pd.DataFrame): Les données.
+        colonne (str): La colonne de classement.
+        n (int): Le nombre de lignes.
+        colonnes (list, optional): Les colonnes à conserver.
+    Returns:
+        pd.DataFrame: Les `n` premières lignes, par ordre décroissant.
+    """
+    top = df.nlargest(n, colonne)
+    return top if colonnes is None else top[colonnes]
+
+
+@mesurer
+def barres_png(top, x, y, titre, xlabel):
+    """
+    Dessine un diagramme en barres horizontales avec seaborn et le renvoie en
+    PNG. La figure n'est pas enregistrée auprès de pyplot et elle est libérée
+    dès l'image produite.
+    Returns:
+        bytes: L'image PNG.
+    """
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 6))
+    try:
+        ax = fig.subplots()
+        sns.barplot(data=top, x=x, y=y, hue=y, palette="tab10", legend=False, ax=ax)
+        ax.set_title(titre)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(y)
+        ax.grid(True)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+    finally:
+        fig.clear()
+
+
+def barres_altair(top, x, y, titre, xlabel):
+    """
+    Construit le même diagramme en barres avec Altair (interactif, rendu par
+    le navigateur).
+    Returns:
+        alt.Chart: Le graphique.
+    """
+    import altair as alt
+
+    return (
+        alt.Chart(top, title=titre)
+        .mark_bar()
+        .encode(
+            x=alt.X(f"{x}:Q", title=xlabel),
+            y=alt.Y(f"{y}:N", sort=None, title=y),
+            color=alt.Color(f"{y}:N", legend=None,
+                            scale=alt.Scale(scheme="tableau10")),
+            tooltip=[y, alt.Tooltip(f"{x}:Q", format=",.2f")],
+        )
+        .properties(height=400)
+    )
+
+
+def graphique_top(df, graphique, cle, rendu=RENDUS[0], y="Désignation Article",
+                  n=10):
+    """
+    Prépare un graphique du tableau de bord : top `n` selon `graphique["tri"]`,
+    rendu en PNG (mis en cache pour ce résultat) ou avec Altair.
+    Args:
+        df (pd.DataFrame): Le résultat.
+        graphique (dict): Une entrée de `GRAPHIQUES_ROTATION`.
+        cle (tuple): L'identifiant du résultat (empreintes des fichiers d'origine).
+        rendu (str): Un élément de `RENDUS`.
+        y (str): La colonne des libellés.
+        n (int): Le nombre de barres.
+    Returns:
+        bytes ou alt.Chart: L'image PNG ou le graphique Altair.
+    """
+    cle_top = ("top", graphique["tri"], n) + tuple(cle)
+    colonnes = list(dict.fromkeys([y, graphique["x"], graphique["tri"]]))
+    top = memoiser(cle_top, top_n, df, graphique["tri"], n, colonnes)
+    if rendu == RENDUS[1]:
+        return barres_altair(top, graphique["x"], y, graphique["titre"],
+                             graphique["xlabel"])
+    return memoiser(("graphique",) + cle_top, barres_png, top, graphique["x"], y,
+                    graphique["titre"], graphique["xlabel"])
@@ -0,0 +1,185 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import cache
+from extraits import charger_extrait, cle_extrait
+from instrumentation import mesurer
+
+
+# Nombre de processus d'analyse des fichiers (la lecture xlsx est limitée par
+# le CPU, les fichiers d'un même rapport sont donc lus en parallèle)
+NB_PROCESSUS = int(os.environ.get("AUTOREPORTING_PROCESSUS",
+                                  str(min(os.cpu_count() or 1, 4))))
+
+# Processus disponibles pour l'ensemble des lectures : quand plusieurs rapports
+# sont calculés en même temps (travaux de l'application, tâches du mode batch),
+# chacun lit ses fichiers avec sa part de ce budget (voir `partager_processus`)
+BUDGET_PROCESSUS = int(os.environ.get("AUTOREPORTING_BUDGET_PROCESSUS",
+                                      str(os.cpu_count() or 1)))
+
+_pool = None
+_verrou = threading.Lock()
+
+
+def partager_processus(nb_concurrents):
+    """
+    Limite le pool de lecture de ce processus à sa part de `BUDGET_PROCESSUS`,
+    appelée au démarrage de chacun des `nb_concurrents` processus qui calculent
+    des rapports en même temps. Avec une part d'un seul processus, les fichiers
+    sont lus l'un après l'autre (voir `precharger`).
+    Args:
+        nb_concurrents (int): Le nombre de rapports calculés en même temps.
+    Returns:
+        int: Le nombre de processus de lecture de ce processus.
+    """
+    global NB_PROCESSUS
+    NB_PROCESSUS = max(1, min(NB_PROCESSUS, BUDGET_PROCESSUS // max(nb_concurrents, 1)))
+    return NB_PROCESSUS
+
+
+def _obtenir_pool():
+    """Pool de processus partagé par les sessions, créé à la première lecture.
+    Les processus sont lancés par "spawn" (pas de fork d'un serveur multi-thread)."""
+    global _pool
+    with _verrou:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=NB_PROCESSUS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _analyser(contenu, nom, parametres):
+    """
+    Lit un fichier dans un processus fils. Le fichier est transmis sous forme
+    d'octets et de nom (un fichier Streamlit ne peut pas être envoyé tel quel).
+    L'extrait est aussi écrit dans le cache Parquet, commun à tous les processus.
+    """
+    fichier = io.BytesIO(contenu)
+    fichier.name = nom
+    return charger_extrait(fichier, **parametres)
+
+
+def _nom(fichier):
+    return fichier if isinstance(fichier, str) else getattr(fichier, "name", "")
+
+
+def _contenu(fichier):
+    if isinstance(fichier, str):
+        with open(fichier, "rb") as f:
+            return f.read()
+    return fichier.getvalue()
+
+
+def en_liste(fichiers):
+    """Un fichier seul, ou une liste de fichiers -> liste de fichiers."""
+    return list(fichiers) if isinstance(fichiers, (list, tuple)) else [fichiers]
+
+
+def concatener(extraits):
+    """
+    Concatène des extraits de même format (par exemple un fichier de
+    mouvements par mois). Les colonnes catégorielles le restent (catégories
+    réunies) et les valeurs non converties de chaque extrait sont cumulées.
+    Args:
+        extraits (list): Les extraits (pd.DataFrame).
+    Returns:
+        pd.DataFrame: L'extrait concaténé.
+    """
+    if len(extraits) == 1:
+        return extraits[0]
+
+    for colonne in extraits[0].columns:
+        if isinstance(extraits[0][colonne].dtype, pd.CategoricalDtype):
+            categories = pd.Index([])
+            for df in extraits:
+                if colonne in df.columns:
+                    df[colonne] = df[colonne].astype("category")
+                    categories = categories.union(df[colonne].cat.categories)
+            for df in extraits:
+                if colonne in df.columns:
+                    df[colonne] = df[colonne].cat.set_categories(categories)
+
+    non_converties = {}
+    for df in extraits:
+        for colonne, valeurs in df.attrs.get("valeurs_non_converties", {}).items():
+            non_converties.setdefault(colonne, []).extend(
+                v for v in valeurs if v not in non_converties[colonne]
+            )
+
+    resultat = pd.concat(extraits, ignore_index=True)
+    resultat.attrs["valeurs_non_converties"] = non_converties
+    return resultat
+
+
+def cle_contenu(fichiers, **parametres):
+    """
+    Identifiant du contenu d'un emplacement lu par `charger` avec les mêmes
+    paramètres (clés des extraits de ses fichiers), pour mettre en cache un
+    calcul qui n'en dépend que.
+    Returns:
+        tuple: Les clés des extraits.
+    """
+    return tuple(cle_extrait(cache.hash_fichier(fichier), **parametres)
+                 for fichier in en_liste(fichiers))
+
+
+def charger(fichiers, sheet_name=0, mot_clef="N° Pièce", colonnes=None,
+            normalisees=None):
+    """
+    Charge un ou plusieurs fichiers d'un même emplacement (voir
+    `charger_extrait`) et concatène leurs extraits.
+    Args:
+        fichiers (str, UploadedFile ou list): Le ou les fichiers.
+    Returns:
+        pd.DataFrame: L'extrait (une copie).
+    """
+    return concatener([
+        charger_extrait(fichier, sheet_name=sheet_name, mot_clef=mot_clef,
+                        colonnes=colonnes, normalisees=normalisees)
+        for fichier in en_liste(fichiers)
+    ])
+
+
+@mesurer
+def precharger(fichiers, lectures):
+    """
+    Lit en parallèle, dans le pool de processus, tous les fichiers d'un rapport
+    qui ne sont pas déjà en cache, et les place dans le cache des extraits :
+    les lectures suivantes (`charger`) sont immédiates. La durée est ainsi
+    proche de celle du fichier le plus long à lire.
+    Args:
+        fichiers (list): Les fichiers de chaque emplacement (un fichier ou une
+            liste de fichiers par emplacement).
+        lectures (list): Les paramètres de `charger_extrait` de chaque emplacement.
+    Returns:
+        int: Le nombre de fichiers lus.
+    """
+    a_lire = []
+    for emplacement, parametres in zip(fichiers, lectures):
+        for fichier in en_liste(emplacement):
+            cle = cle_extrait(cache.hash_fichier(fichier), **parametres)
+            if not cache.contient(cle) and cle not in [c for _, c, _ in a_lire]:
+                a_lire.append((fichier, cle, parametres))
+
+    # Un seul fichier ou un seul processus : pas de gain à passer par le pool
+    if len(a_lire) <= 1 or NB_PROCESSUS <= 1:
+        for fichier, _, parametres in a_lire:
+            charger_extrait(fichier, **parametres)
+        return len(a_lire)
+
+    pool = _obtenir_pool()
+    futures = [
+        (cle, pool.submit(_analyser, _contenu(fichier), _nom(fichier), parametres))
+        for fichier, cle, parametres in a_lire
+    ]
+    for cle, future in futures:
+        extrait = future.result()
+        cache.memoiser(cle, lambda: extrait)
+    return len(a_lire)
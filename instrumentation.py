@@ -0,0 +1,150 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Journal des mesures, une ligne JSON par étape : sur la sortie d'erreur, ou dans
+# le fichier indiqué par AUTOREPORTING_JOURNAL_PERF
+journal = logging.getLogger("autoreporting.performance")
+journal.setLevel(logging.INFO)
+journal.propagate = False
+if not journal.handlers:
+    _chemin_journal = os.environ.get("AUTOREPORTING_JOURNAL_PERF")
+    _handler = (logging.FileHandler(_chemin_journal, encoding="utf-8")
+                if _chemin_journal else logging.StreamHandler(sys.stderr))
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    journal.addHandler(_handler)
+
+# Le pic mémoire n'est mesuré que si tracemalloc est actif (il ralentit les
+# allocations) : AUTOREPORTING_MEMOIRE=1 l'active au démarrage
+if os.environ.get("AUTOREPORTING_MEMOIRE") == "1" and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Mesures de la collecte en cours et pile des étapes ouvertes (propres à chaque
+# session Streamlit, qui s'exécute dans son propre thread)
+_mesures = contextvars.ContextVar("mesures", default=None)
+_pile = contextvars.ContextVar("pile", default=())
+
+
+def memoire_mesuree():
+    """Indique si le pic mémoire des étapes est mesuré (tracemalloc actif)."""
+    return tracemalloc.is_tracing()
+
+
+def nb_lignes(valeur):
+    """Nombre de lignes d'un DataFrame ou d'une Series (ou du premier élément
+    d'un tuple), None pour les autres valeurs."""
+    # Ce module est chargé avant le premier rendu de l'app : pandas n'est pas
+    # importé ici, une valeur ne peut être un DataFrame que s'il l'est déjà
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(valeur, (pd.DataFrame, pd.Series)):
+        return len(valeur)
+    if isinstance(valeur, tuple) and valeur:
+        return nb_lignes(valeur[0])
+    return None
+
+
+@contextmanager
+def collecter():
+    """
+    Collecte les mesures des étapes exécutées dans le bloc.
+    Returns:
+        list: Les mesures (dictionnaires), complétées au fil de l'exécution.
+    """
+    mesures = []
+    jeton = _mesures.set(mesures)
+    try:
+        yield mesures
+    finally:
+        _mesures.reset(jeton)
+
+
+@contextmanager
+def etape(nom, lignes_entree=None):
+    """
+    Mesure une étape : durée, lignes en entrée et en sortie, pic mémoire.
+    Le dictionnaire renvoyé peut être complété dans le bloc (`lignes_sortie`).
+    Les étapes peuvent être imbriquées : le pic d'une étape englobe ceux des
+    étapes qu'elle contient.
+    Args:
+        nom (str): Le nom de l'étape.
+        lignes_entree (int, optional): Le nombre de lignes traitées.
+    """
+    pile = _pile.get()
+    mesure = {"etape": nom, "lignes_entree": lignes_entree, "lignes_sortie": None,
+              "profondeur": len(pile)}
+    # Ajoutée dès son début : les mesures restent dans l'ordre des étapes
+    mesures = _mesures.get()
+    if mesures is not None:
+        mesures.append(mesure)
+    memoire = memoire_mesuree()
+    if memoire:
+        courant, pic = tracemalloc.get_traced_memory()
+        if pile:
+            pile[-1]["pic"] = max(pile[-1]["pic"], pic)
+        tracemalloc.reset_peak()
+        cadre = {"debut": courant, "pic": courant}
+    else:
+        cadre = {}
+    jeton = _pile.set(pile + (cadre,))
+
+    debut = time.perf_counter()
+    try:
+        yield mesure
+        mesure["statut"] = "ok"
+    except BaseException:
+        mesure["statut"] = "erreur"
+        raise
+    finally:
+        mesure["duree_s"] = round(time.perf_counter() - debut, 6)
+        _pile.reset(jeton)
+        if memoire:
+            cadre["pic"] = max(cadre["pic"], tracemalloc.get_traced_memory()[1])
+            mesure["memoire_max_mo"] = round((cadre["pic"] - cadre["debut"]) / 2**20, 2)
+            if pile:
+                pile[-1]["pic"] = max(pile[-1]["pic"], cadre["pic"])
+            tracemalloc.reset_peak()
+        mesure["horodatage"] = datetime.now().isoformat(timespec="milliseconds")
+        journal.info(json.dumps(mesure, ensure_ascii=False))
+
+
+def mesurer(fonction):
+    """
+    Décorateur : mesure chaque appel de `fonction` comme une étape portant son
+    nom. Les lignes en entrée sont celles du premier argument, les lignes en
+    sortie celles du résultat.
+    """
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        with etape(fonction.__name__,
+                   nb_lignes(args[0]) if args else None) as mesure:
+            resultat = fonction(*args, **kwargs)
+            mesure["lignes_sortie"] = nb_lignes(resultat)
+            return resultat
+    return enveloppe
+
+
+def tableau(mesures):
+    """
+    Met en forme des mesures pour l'affichage (étapes imbriquées indentées).
+    """
+    colonnes = {
+        "etape": "Étape", "duree_s": "Durée (s)", "lignes_entree": "Lignes en entrée",
+        "lignes_sortie": "Lignes en sortie", "memoire_max_mo": "Mémoire max (Mo)",
+        "statut": "Statut",
+    }
+    import pandas as pd
+
+    if not mesures:
+        return pd.DataFrame(columns=list(colonnes.values()))
+    df = pd.DataFrame(mesures)
+    df["etape"] = ["· " * p + e for p, e in zip(df["profondeur"], df["etape"])]
+    df = df[[c for c in colonnes if c in df.columns]].rename(columns=colonnes)
+    return df.reset_index(drop=True)
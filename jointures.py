@@ -0,0 +1,133 @@
+import pandas as pd
+
+from cache import memoiser
+from instrumentation import etape
+
+
+# Politiques appliquées aux clés en double de la table de droite :
+# - "somme" : colonnes numériques sommées, première valeur non vide pour les autres
+# - "premier" / "dernier" : première / dernière valeur non vide de chaque colonne
+# - "erreur" : lève une ValueError
+POLITIQUES = ("somme", "premier", "dernier", "erreur")
+
+# Nombre de clés en double citées dans les messages
+NB_EXEMPLES = 5
+
+
+def dedoublonner(df, cle, politique="somme"):
+    """
+    Ramène une table à une ligne par valeur de `cle` selon `politique`.
+    Les valeurs manquantes de la clé forment un groupe comme les autres.
+    Args:
+        df (pd.DataFrame): La table.
+        cle (str): La colonne clé.
+        politique (str): Un élément de `POLITIQUES`.
+    Returns:
+        tuple: (table sans doublons, nombre de clés qui étaient en double)
+    """
+    if politique not in POLITIQUES:
+        raise ValueError(f"Politique de dédoublonnage inconnue : '{politique}' "
+                         f"(attendu : {', '.join(POLITIQUES)})")
+
+    doublons = df[cle].duplicated(keep=False)
+    if not doublons.any():
+        return df, 0
+
+    cles_doublons = df.loc[doublons, cle].unique()
+    if politique == "erreur":
+        exemples = ", ".join(str(c) for c in cles_doublons[:NB_EXEMPLES])
+        raise ValueError(f"{len(cles_doublons)} valeur(s) en double dans la "
+                         f"colonne '{cle}' : {exemples}")
+
+    groupes = df.groupby(cle, sort=False, dropna=False)
+    if politique == "somme":
+        agregation = {
+            colonne: ("sum" if pd.api.types.is_numeric_dtype(df[colonne])
+                      else "first")
+            for colonne in df.columns if colonne != cle
+        }
+        resultat = groupes.agg(agregation)
+    elif politique == "premier":
+        resultat = groupes.first()
+    else:
+        resultat = groupes.last()
+    return resultat.reset_index(), len(cles_doublons)
+
+
+def indexer(droite, cle, politique="somme"):
+    """
+    Prépare la table de droite d'une jointure : dédoublonnée selon `politique`
+    et indexée par sa clé. La table indexée peut servir à plusieurs jointures.
+    Args:
+        droite (pd.DataFrame): La table de droite.
+        cle (str): La colonne clé (déjà normalisée).
+        politique (str): Un élément de `POLITIQUES`.
+    Returns:
+        pd.DataFrame: La table indexée par la clé ; `attrs["jointure"]` décrit
+        le dédoublonnage (lignes, clés uniques, clés en double, politique).
+    """
+    unique, nb_doublons = dedoublonner(droite, cle, politique)
+    table = unique.set_index(cle)
+    table.attrs["jointure"] = {
+        "cle": cle,
+        "politique": politique,
+        "lignes_droite": len(droite),
+        "cles_droite": len(table),
+        "cles_en_double": nb_doublons,
+    }
+    return table
+
+
+def joindre_gauche(gauche, droite, cle, politique="somme", suffixes=("_x", "_y"),
+                   cle_cache=None):
+    """
+    Jointure gauche à taille de sortie garantie : exactement une ligne par ligne
+    de `gauche`, même si la clé est en double à droite. Colonnes et suffixes
+    sont ceux de `pd.merge(gauche, droite, on=cle, how="left")`.
+    Args:
+        gauche (pd.DataFrame): La table de gauche.
+        droite (pd.DataFrame): La table de droite, brute ou déjà passée par
+            `indexer` (elle n'est alors pas réindexée).
+        cle (str): La colonne clé, présente des deux côtés.
+        politique (str): Le traitement des clés en double à droite.
+        suffixes (tuple): Suffixes des colonnes présentes des deux côtés.
+        cle_cache (tuple, optional): Identifiant du contenu de `droite` (par
+            exemple les clés des extraits lus, voir `ingestion.cle_contenu`) :
+            la table indexée est mise en cache (voir `cache.memoiser`) et
+            réutilisée par les jointures suivantes sur la même table.
+    Returns:
+        pd.DataFrame: Le résultat ; `attrs["jointure"]` donne la cardinalité
+        (lignes de chaque côté, clés en double, lignes sans correspondance).
+    """
+    with etape(f"jointure:{cle}", len(gauche)) as mesure:
+        if droite.index.name != cle:
+            if cle_cache is None:
+                droite = indexer(droite, cle, politique)
+            else:
+                droite = memoiser(("index_jointure", cle, politique) + tuple(cle_cache),
+                                  indexer, droite, cle, politique)
+        rapport = dict(droite.attrs.get("jointure", {"cle": cle}))
+
+        # Positions des clés de gauche dans l'index (-1 : sans correspondance,
+        # valeurs manquantes dans le résultat)
+        positions = droite.index.get_indexer(gauche[cle])
+        alignee = droite.reset_index(drop=True).reindex(positions)
+        alignee.index = gauche.index
+
+        # Colonnes : celles de gauche (clé comprise), puis celles de droite
+        communes = gauche.columns.intersection(alignee.columns)
+        resultat = pd.concat([
+            gauche.rename(columns={c: c + suffixes[0] for c in communes}),
+            alignee.rename(columns={c: c + suffixes[1] for c in communes}),
+        ], axis=1).reset_index(drop=True)
+        resultat.attrs = {}
+
+        rapport.update({
+            "lignes_gauche": len(gauche),
+            "sans_correspondance": int((positions == -1).sum()),
+            "lignes_resultat": len(resultat),
+        })
+        resultat.attrs["jointure"] = rapport
+        mesure.update(rapport)
+        mesure["lignes_sortie"] = len(resultat)
+    return resultat
@@ -0,0 +1,220 @@
+import codecs
+import csv
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from instrumentation import etape, mesurer
+from schemas import noms_canoniques
+
+
+# Taille de l'échantillon examiné pour deviner le format (octets)
+TAILLE_ECHANTILLON = 64 * 1024
+
+# Nombre de lignes examinées pour trouver la ligne d'en-tête
+NB_LIGNES_ENTETE = 10
+
+SEPARATEURS = ";,\t|"
+
+# Marques d'ordre des octets (BOM) reconnues, de la plus longue à la plus courte
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+# Encodage des exports Sage qui ne sont pas en UTF-8
+ENCODAGE_WINDOWS = "cp1252"
+
+
+def _echantillon(fichier):
+    """Premiers octets d'un fichier (chemin ou fichier Streamlit)."""
+    if isinstance(fichier, str):
+        with open(fichier, "rb") as f:
+            return f.read(TAILLE_ECHANTILLON)
+    if hasattr(fichier, "getvalue"):
+        return fichier.getvalue()[:TAILLE_ECHANTILLON]
+    raise TypeError("Entrée non reconnue : chemin ou fichier Streamlit attendu.")
+
+
+def _source(fichier, format_csv):
+    """Flux Arrow du fichier, BOM exclue : projection en mémoire d'un chemin
+    (les pages sont lues à la demande) ou tampon sans copie d'un fichier
+    Streamlit (déjà en mémoire)."""
+    if isinstance(fichier, str):
+        source = pa.memory_map(fichier)
+        source.seek(format_csv["bom"])
+        return source
+    return pa.BufferReader(pa.py_buffer(fichier.getvalue())[format_csv["bom"]:])
+
+
+def detecter_encodage(echantillon):
+    """
+    Détermine l'encodage d'un début de fichier : BOM s'il y en a une, sinon
+    UTF-8 s'il est valide, sinon Windows-1252.
+    Args:
+        echantillon (bytes): Les premiers octets du fichier.
+    Returns:
+        tuple: (encodage, longueur de la BOM en octets)
+    """
+    for bom, encodage in BOMS:
+        if echantillon.startswith(bom):
+            return encodage, len(bom)
+    try:
+        echantillon.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Un caractère coupé en fin d'échantillon n'est pas une erreur
+        if e.start < len(echantillon) - 3:
+            return ENCODAGE_WINDOWS, 0
+    return "utf-8", 0
+
+
+def detecter_format(echantillon, mot_clef=None):
+    """
+    Devine le format d'un CSV à partir de ses premiers kilo-octets : encodage,
+    BOM, séparateur et ligne d'en-tête (la première contenant `mot_clef`, ou la
+    première ligne si `mot_clef` est None).
+    Args:
+        echantillon (bytes): Le début du fichier (au moins
+            `TAILLE_ECHANTILLON` octets s'il est plus long).
+        mot_clef (str, optional): Le mot clé identifiant la ligne d'en-tête.
+    Returns:
+        dict: encodage, bom (octets), separateur, ligne_entete (index) et
+        colonnes (noms lus sur la ligne d'en-tête).
+    """
+    echantillon = echantillon[:TAILLE_ECHANTILLON]
+    encodage, bom = detecter_encodage(echantillon)
+    texte = echantillon[bom:].decode(encodage, errors="ignore")
+    lignes = texte.splitlines()[:NB_LIGNES_ENTETE]
+
+    ligne_entete = 0
+    if mot_clef is not None:
+        for i, ligne in enumerate(lignes):
+            if mot_clef in ligne:
+                ligne_entete = i
+                break
+        else:
+            raise ValueError(f"Impossible de trouver une ligne contenant '{mot_clef}'")
+
+    # Séparateur : deviné sur l'en-tête et les lignes qui suivent
+    try:
+        separateur = csv.Sniffer().sniff(
+            "\n".join(lignes[ligne_entete:]), delimiters=SEPARATEURS
+        ).delimiter
+    except csv.Error:
+        separateur = ";"
+
+    colonnes = next(csv.reader([lignes[ligne_entete]], delimiter=separateur), [])
+    return {
+        "encodage": encodage,
+        "bom": bom,
+        "separateur": separateur,
+        "ligne_entete": ligne_entete,
+        "colonnes": colonnes,
+    }
+
+
+def _options(format_csv, taille_bloc_octets=None, colonnes=None):
+    """Options de lecture pyarrow : toutes les colonnes en texte, comme les
+    cellules lues par `lire_avec_header_auto` avant conversion des nombres.
+    Avec `colonnes` (noms connus, voir `schemas.noms_canoniques`), seules les
+    colonnes correspondantes sont analysées."""
+    lecture = pacsv.ReadOptions(
+        skip_rows=format_csv["ligne_entete"],
+        encoding=format_csv["encodage"],
+        use_threads=True,
+        **({"block_size": taille_bloc_octets} if taille_bloc_octets else {})
+    )
+    analyse = pacsv.ParseOptions(delimiter=format_csv["separateur"])
+    projection = {}
+    if colonnes is not None:
+        projection["include_columns"] = [
+            brut for brut, nom in zip(format_csv["colonnes"],
+                                      noms_canoniques(format_csv["colonnes"]))
+            if nom in colonnes
+        ]
+    conversion = pacsv.ConvertOptions(
+        column_types={c: pa.string() for c in format_csv["colonnes"]},
+        strings_can_be_null=True,
+        **projection
+    )
+    return lecture, analyse, conversion
+
+
+def _vers_dataframe(table):
+    df = table.to_pandas()
+    df.columns = noms_canoniques(df.columns)
+    return df
+
+
+@mesurer
+def lire_csv(fichier, mot_clef=None, colonnes=None):
+    """
+    Lit un fichier CSV (chemin ou fichier Streamlit) : encodage, BOM, séparateur
+    et ligne d'en-tête sont devinés sur le début du fichier, puis il est analysé
+    en une passe par le moteur CSV d'Arrow, sur plusieurs threads. Les
+    cellules restent du texte (les nombres sont convertis ensuite).
+    Args:
+        fichier (str ou UploadedFile): Le fichier.
+        mot_clef (str, optional): Le mot clé identifiant la ligne d'en-tête.
+        colonnes (list, optional): Les seules colonnes à analyser (toutes si None).
+    Returns:
+        pd.DataFrame: Les données.
+    """
+    with etape("detection_format_csv"):
+        format_csv = detecter_format(_echantillon(fichier), mot_clef)
+    table = pacsv.read_csv(_source(fichier, format_csv),
+                           *_options(format_csv, colonnes=colonnes))
+    return _vers_dataframe(table)
+
+
+def lire_entete_csv(fichier, mot_clef=None, nb_lignes=20):
+    """
+    Lit la ligne d'en-tête d'un CSV et les lignes qui la suivent dans le
+    début du fichier (voir `detecter_format`), sans analyser le reste.
+    Returns:
+        tuple: (noms lus sur la ligne d'en-tête, premières lignes de données)
+    """
+    echantillon = _echantillon(fichier)
+    format_csv = detecter_format(echantillon, mot_clef)
+    texte = echantillon[format_csv["bom"]:].decode(format_csv["encodage"],
+                                                   errors="ignore")
+    lignes = texte.splitlines()[format_csv["ligne_entete"] + 1:]
+    # La dernière ligne de l'échantillon peut être coupée
+    if len(echantillon) >= TAILLE_ECHANTILLON:
+        lignes = lignes[:-1]
+    exemples = list(csv.reader(lignes[:nb_lignes],
+                               delimiter=format_csv["separateur"]))
+    return format_csv["colonnes"], exemples
+
+
+def lire_csv_par_blocs(fichier, taille_bloc, mot_clef=None):
+    """
+    Lit un fichier CSV par blocs d'environ `taille_bloc` lignes, sans le
+    convertir en entier (lecteur en flux d'Arrow).
+    Args:
+        fichier (str ou UploadedFile): Le fichier.
+        taille_bloc (int): Le nombre de lignes visé par bloc.
+        mot_clef (str, optional): Le mot clé identifiant la ligne d'en-tête.
+    Returns:
+        generator: Les blocs (pd.DataFrame).
+    """
+    echantillon = _echantillon(fichier)
+    format_csv = detecter_format(echantillon, mot_clef)
+
+    # Taille des blocs en octets, estimée d'après la longueur moyenne des lignes
+    longueur_ligne = max(len(echantillon) // max(echantillon.count(b"\n"), 1), 1)
+    taille_bloc_octets = max(taille_bloc * longueur_ligne, 64 * 1024)
+
+    lecteur = pacsv.open_csv(_source(fichier, format_csv),
+                             *_options(format_csv, taille_bloc_octets))
+    for lot in lecteur:
+        yield _vers_dataframe(pa.Table.from_batches([lot]))
+
+
+def est_csv(fichier):
+    """Indique si un fichier (chemin ou fichier Streamlit) est un CSV."""
+    nom = fichier if isinstance(fichier, str) else getattr(fichier, "name", "")
+    return nom.lower().endswith(".csv")
@@ -1,10 +1,340 @@
 import streamlit as st
-import pandas as pd
-import io
-from fonctions import preparer_donnees, preparer_donnees2, groupby_famille
-import matplotlib.pyplot as plt
-import seaborn as sns
-import fonctions2 as f2
+import cache
+import instrumentation
+import prechauffage
+import travaux
+
+# Les modules de calcul (pandas, openpyxl, matplotlib...) sont importés là où
+# ils servent, après le premier affichage : les rapports tournent dans les
+# processus de `travaux`, et `prechauffage` les charge en tâche de fond.
+
+
+def proposer_telechargement(df, cle, nom_fichier, sheet_name, label):
+    """
+    Propose le téléchargement d'un résultat. Le fichier n'est généré que lorsque
+    l'utilisateur le demande, puis mis en cache pour ce résultat et ce format.
+    Args:
+        df (pd.DataFrame): Le résultat à télécharger.
+        cle (tuple): L'identifiant du résultat (empreintes des fichiers d'origine).
+        nom_fichier (str): Le nom du fichier, sans extension.
+        sheet_name (str): Le nom de la feuille Excel.
+        label (str): Le libellé du bouton de téléchargement.
+    """
+    import export
+
+    id_widget = "_".join(str(c) for c in (nom_fichier,) + cle)
+    format_export = st.radio("Format", list(export.FORMATS), horizontal=True,
+                             key=f"format_{id_widget}")
+    demande = (format_export, cle)
+
+    if st.session_state.get(f"export_{id_widget}") != demande:
+        if not st.button(f"⚙️ Préparer le fichier {format_export}",
+                         key=f"preparer_{id_widget}"):
+            return
+        st.session_state[f"export_{id_widget}"] = demande
+
+    _, extension, mime = export.FORMATS[format_export]
+    st.download_button(
+        label=label,
+        data=export.exporter(df, format_export, sheet_name, cle=cle),
+        file_name=nom_fichier + extension,
+        mime=mime,
+        key=f"telecharger_{id_widget}"
+    )
+
+
+def afficher_tableau(df, cle, nom):
+    """
+    Affiche un résultat page par page : tri, recherche et filtre sont appliqués
+    sur le serveur (voir `visionneuse`), seule la page visible est envoyée.
+    Args:
+        df (pd.DataFrame): Le résultat.
+        cle (tuple): L'identifiant du calcul.
+        nom (str): Le nom du résultat (voir `rapports.RAPPORTS`).
+    """
+    import visionneuse
+
+    cle = (nom,) + cle
+    id_widget = "_".join(str(c) for c in cle)
+    colonnes = [str(c) for c in df.columns]
+
+    recherches, filtres = {}, {}
+    col_recherche, col_filtre, col_tri, col_sens = st.columns([3, 3, 3, 1])
+    with col_recherche:
+        for colonne in [c for c in visionneuse.COLONNES_RECHERCHE if c in colonnes][:1]:
+            recherches[colonne] = st.text_input(
+                f"🔍 {colonne}", key=f"recherche_{id_widget}",
+                help="Lignes dont la valeur commence par la saisie."
+            ).strip()
+    with col_filtre:
+        for colonne in [c for c in visionneuse.COLONNES_FILTRE if c in colonnes][:1]:
+            index = cache.memoiser(("codes_filtre", colonne) + cle,
+                                   visionneuse.codes_filtre, df, colonne)
+            filtres[colonne] = st.selectbox(colonne, visionneuse.valeurs_filtre(index),
+                                            index=None,
+                                            placeholder="Toutes",
+                                            key=f"filtre_{id_widget}")
+    with col_tri:
+        tri = st.selectbox("Trier par", colonnes, index=None,
+                           placeholder="Ordre du résultat", key=f"tri_{id_widget}")
+    with col_sens:
+        croissant = st.radio("Sens", ["↑", "↓"], key=f"sens_{id_widget}") == "↑"
+
+    positions = visionneuse.selection(df, cle, tri, croissant, recherches, filtres)
+
+    col_taille, col_page, col_total = st.columns([1, 1, 4])
+    with col_taille:
+        taille = st.selectbox("Lignes par page", visionneuse.TAILLES_PAGE, index=1,
+                              key=f"taille_{id_widget}")
+    nb_pages = visionneuse.nb_pages(len(positions), taille)
+    cle_page = f"page_{id_widget}"
+    if st.session_state.get(cle_page, 1) > nb_pages:
+        st.session_state[cle_page] = 1
+    with col_page:
+        numero = st.number_input(f"Page (sur {nb_pages})", 1, nb_pages, key=cle_page)
+    with col_total:
+        st.caption(f"{len(positions)} ligne(s) sur {len(df)}")
+
+    st.dataframe(visionneuse.page(df, positions, numero, taille))
+
+
+def cle_fichiers(nom, *fichiers):
+    """Identifiant d'un calcul : son nom et les empreintes de ses fichiers."""
+    import ingestion
+
+    return (nom,) + tuple(
+        "+".join(cache.hash_fichier(f) for f in ingestion.en_liste(emplacement))
+        for emplacement in fichiers
+    )
+
+
+def fichiers_conformes(nom, *fichiers):
+    """
+    Contrôle les fichiers d'un calcul avant de le lancer (en-têtes et premières
+    lignes seulement, voir `rapports.verifier`) et affiche les problèmes.
+    Returns:
+        bool: True si les fichiers sont conformes.
+    """
+    import rapports
+
+    problemes = cache.memoiser(("verification",) + cle_fichiers(nom, *fichiers),
+                               rapports.verifier, nom, *fichiers)
+    if problemes:
+        st.error("❌ Fichier(s) refusé(s) :\n\n"
+                 + "\n".join(f"- {probleme}" for probleme in problemes))
+    return not problemes
+
+
+@st.fragment(run_every=1)
+def afficher_progression(id_travail):
+    """Barre de progression d'un travail, actualisée chaque seconde ; la page
+    est relancée dès que le travail n'est plus actif."""
+    etat = travaux.etat(id_travail)
+    if etat is None or etat["statut"] not in travaux.ACTIFS:
+        st.rerun()
+    if etat["statut"] == travaux.EN_ATTENTE:
+        texte = "⏳ En attente d'un processus de calcul…"
+    else:
+        texte = f"⚙️ Calcul en cours : {etat['etape'] or 'démarrage'}"
+    st.progress(etat["progression"], text=texte)
+
+
+def suivre_travail(nom, *fichiers, **options):
+    """
+    Lance en arrière-plan le calcul d'un rapport (voir `travaux.soumettre`) et
+    en suit l'avancement. L'identifiant du travail est gardé dans l'URL : après
+    un rafraîchissement de la page, le résultat est retrouvé sans téléverser à
+    nouveau les fichiers.
+    Args:
+        nom (str): Le nom du rapport (voir `rapports.RAPPORTS`).
+        fichiers: Les fichiers de chaque emplacement (un fichier, ou une liste
+            pour les emplacements qui en acceptent plusieurs).
+        options: Les options du rapport (par exemple `espace_disque=True`).
+    Returns:
+        tuple: (clé du résultat, résultats du rapport, mesures du calcul), ou
+        None tant que le travail n'est pas terminé.
+    """
+    parametre = f"travail_{nom}"
+    if all(fichiers):
+        if not fichiers_conformes(nom, *fichiers):
+            return None
+        cle = cle_fichiers(nom, *fichiers) + tuple(
+            sorted((k, v) for k, v in options.items() if v)
+        )
+        id_travail = travaux.soumettre(nom, fichiers, options, cle=cle)
+        st.query_params[parametre] = id_travail
+    elif parametre in st.query_params:
+        id_travail = st.query_params[parametre]
+    else:
+        return None
+
+    etat = travaux.etat(id_travail)
+    if etat is None:
+        del st.query_params[parametre]
+        return None
+    if etat["statut"] in travaux.ACTIFS:
+        afficher_progression(id_travail)
+        return None
+    if etat["statut"] == travaux.INTERROMPU:
+        st.warning("⚠️ Le calcul a été interrompu par un redémarrage du serveur : "
+                   "téléversez à nouveau les fichiers pour le relancer.")
+        return None
+    if etat["statut"] == travaux.ERREUR:
+        st.error(f"Erreur pendant le traitement : {etat['message']}")
+        if all(fichiers) and st.button("🔄 Relancer le calcul", key=f"relancer_{nom}"):
+            travaux.soumettre(nom, fichiers, options, cle=cle, relancer=True)
+            st.rerun()
+        return None
+
+    if not all(fichiers):
+        st.caption("Résultat du dernier calcul (fichiers non téléversés).")
+    resultats, mesures = cache.memoiser(("travail", id_travail), travaux.resultat,
+                                        id_travail)
+    return (nom, id_travail), resultats, mesures
+
+
+def afficher_evolution(nom, *fichiers):
+    """
+    Affiche l'évolution mensuelle du taux de rotation. Les séries sont
+    calculées en arrière-plan une fois par jeu de fichiers (voir
+    `suivre_travail`) ; changer de période ou de niveau ne fait que les
+    découper.
+    Args:
+        nom (str): Le calcul des séries (voir `rapports.CALCULS`).
+        fichiers: Les fichiers d'entrée.
+    """
+    import series_temporelles
+
+    travail = suivre_travail(nom, *fichiers)
+    if not travail:
+        return
+    cle, series, _ = travail
+    mois = list(series["sorties"].columns)
+    if not mois:
+        st.info("ℹ️ Aucune ligne datée.")
+        return
+
+    debut, fin = mois[0], mois[-1]
+    if len(mois) > 1:
+        debut, fin = st.select_slider("Période", options=mois, value=(debut, fin),
+                                      key=f"periode_{nom}")
+    niveau = st.radio("Niveau", ["Par famille", "Ensemble", "Par article"],
+                      horizontal=True, key=f"niveau_{nom}")
+    par = {"Par famille": "famille", "Ensemble": "ensemble",
+           "Par article": "article"}[niveau]
+
+    df_evolution = cache.memoiser(("evolution", debut, fin, par) + cle,
+                                  series_temporelles.evolution, series, debut, fin,
+                                  par)
+    if par != "article":
+        st.line_chart(df_evolution.pivot(index="Mois", columns=df_evolution.columns[0],
+                                         values="Taux de rotation"))
+    st.dataframe(df_evolution, hide_index=True)
+
+    st.markdown(f"#### Taux de rotation par article, {debut} → {fin}")
+    df_periode = cache.memoiser(("periode", debut, fin) + cle,
+                                series_temporelles.rotation_periode, series, debut,
+                                fin)
+    st.dataframe(df_periode, hide_index=True)
+    proposer_telechargement(df_periode, cle + (debut, fin),
+                            f"taux_de_rotation_{debut}_{fin}", "Taux de rotation",
+                            "📥 Télécharger le taux de rotation sur la période")
+
+
+def afficher_performance(onglet, mesures):
+    """
+    Affiche, dans un panneau replié, la durée, les lignes et le pic mémoire de
+    chaque étape du dernier calcul de l'onglet. Les mesures sont conservées
+    dans la session : un résultat servi depuis le cache garde celles du calcul.
+    Args:
+        onglet (str): L'identifiant de l'onglet.
+        mesures (list): Les mesures collectées pendant cette exécution.
+    """
+    cle = f"performance_{onglet}"
+    if mesures:
+        # Les étapes qui viennent d'être exécutées remplacent les précédentes
+        # du même nom (un export préparé après coup complète le calcul)
+        nouvelles = {m["etape"] for m in mesures}
+        anciennes = [m for m in st.session_state.get(cle, [])
+                     if m["etape"] not in nouvelles]
+        st.session_state[cle] = anciennes + mesures
+
+    with st.expander("⏱️ Performance"):
+        if cle not in st.session_state:
+            st.caption("Aucune mesure : le résultat vient du cache.")
+            return
+        st.dataframe(instrumentation.tableau(st.session_state[cle]),
+                     hide_index=True)
+        if not instrumentation.memoire_mesuree():
+            st.caption("Mémoire non mesurée (lancer avec AUTOREPORTING_MEMOIRE=1).")
+
+
+def signaler_doublons(df, libelle):
+    """
+    Signale les clés en double de la table de droite d'une jointure (voir
+    `jointures.joindre_gauche`) et la façon dont elles ont été regroupées.
+    Args:
+        df (pd.DataFrame): Le résultat de la jointure.
+        libelle (str): La table de droite, pour le message.
+    """
+    jointure = df.attrs.get("jointure", {})
+    if jointure.get("cles_en_double"):
+        regroupement = {"somme": "sommées", "premier": "première valeur retenue",
+                        "dernier": "dernière valeur retenue"}
+        st.info(
+            f"ℹ️ {jointure['cles_en_double']} valeur(s) de `{jointure['cle']}` en "
+            f"double dans {libelle} "
+            f"({regroupement.get(jointure['politique'], jointure['politique'])}) : "
+            f"{jointure['lignes_gauche']} ligne(s) en entrée, "
+            f"{jointure['lignes_resultat']} en sortie."
+        )
+
+
+def afficher_registre(registre, libelle):
+    """
+    Enregistre dans le registre des remarques (voir `remarques`) celles d'un
+    fichier exporté puis complété : le mois suivant, le nouvel extrait suffit.
+    Args:
+        registre (str): `remarques.BLS` ou `remarques.SUIVI`.
+        libelle (str): Le type de fichier, pour les libellés.
+    """
+    import ingestion
+    import rapports
+    import remarques
+
+    if registre == remarques.BLS:
+        schema, enregistrer = rapports.SCHEMA_BLS_ANCIENS, remarques.enregistrer_bls
+    else:
+        schema, enregistrer = rapports.SCHEMA_SUIVI_ANCIEN, remarques.enregistrer_suivi
+
+    fichier = st.file_uploader(f"📤 Fichier {libelle} complété (remarques à enregistrer)",
+                               type=["csv", "xlsx"], key=f"registre_{registre}")
+    if fichier and st.button("🗂️ Enregistrer ces remarques",
+                             key=f"enregistrer_{registre}"):
+        # Un fichier sans colonne de remarques est refusé : il effacerait
+        # les remarques de tous ses BL
+        problemes = rapports.verifier_fichier(fichier, schema)
+        if problemes:
+            st.error("❌ Fichier refusé :\n\n"
+                     + "\n".join(f"- {probleme}" for probleme in problemes))
+        else:
+            enregistrees, retirees = enregistrer(
+                ingestion.charger(fichier, **schema["lecture"])
+            )
+            st.success(f"✅ {enregistrees} remarque(s) enregistrée(s), "
+                       f"{retirees} retirée(s) (remarques effacées).")
+    st.caption(f"{remarques.nb_remarques().get(registre, 0)} remarque(s) dans "
+               f"le registre.")
+
+
+# Sources des remarques reprises dans les onglets 2 et 3
+SOURCES_REMARQUES = ["📄 Fichier précédent", "🗂️ Registre des remarques"]
+
+# Traitement des lignes de même clé dans la table jointe (voir
+# `jointures.POLITIQUES`), option "doublons" des rapports
+DOUBLONS = {"somme": "Sommer les quantités", "premier": "Garder la première",
+            "dernier": "Garder la dernière", "erreur": "Refuser le fichier"}
+
 
 # Initialisation de l'app
 st.set_page_config(page_title="Automatisation des reporting", layout="wide")
@@ -55,6 +385,9 @@ with tab1:
         > mais **seules celles-ci sont nécessaires**.
 
         ⚠️ Les deux tables doivent concerner la **même période** (idéalement 1 an pour un résultat cohérent.
+
+        📈 Si les ventes comportent une colonne `Date` (une ligne par vente), l'évolution
+        mensuelle du taux de rotation peut être affichée sur la période de votre choix.
         """
     )
 
@@ -64,78 +397,70 @@ with tab1:
             "📦 Fichier des **stocks** (.csv ou .xlsx)", type=["csv", "xlsx"], key="stocks"
         )
     with col2:
-        fichier_ventes = st.file_uploader(
-            "🛒 Fichier des **ventes** (.csv ou .xlsx)", type=["csv", "xlsx"], key="ventes"
+        fichiers_ventes = st.file_uploader(
+            "🛒 Fichier(s) des **ventes** (.csv ou .xlsx, plusieurs fichiers "
+            "possibles, par exemple un par mois)", type=["csv", "xlsx"], key="ventes",
+            accept_multiple_files=True
         )
 
-    if fichier_ventes and fichier_stocks:
-        try:
-            ventes = f2.lire_avec_header_auto(fichier_ventes, mot_clef="Référence Article")
-            stocks = f2.lire_avec_header_auto(fichier_stocks, mot_clef="Référence Article")
-
-            df_final = preparer_donnees(stocks, ventes)
-
-            st.subheader("📊 Résultat")
-            st.dataframe(df_final)
-
-            # ✅ Création de graphs pour avoir des insights pertinents
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.subheader("📊 Top 10 par chiffre d'affaires")
-
-                top_CA = df_final.sort_values("Chiffre d'affaires HT",
-                                              ascending=False).head(10)
-
-                fig1, ax1 = plt.subplots(figsize=(8, 6))
-                sns.barplot(
-                    data=top_CA,
-                    x="Taux de rotation",
-                    y="Désignation Article",
-                    palette="tab10",
-                    ax=ax1
-                )
-                ax1.set_title("Top 10 produits par CA - Taux de rotation en abscisse")
-                ax1.set_xlabel("Taux de rotation")
-                ax1.set_ylabel("Désignation Article")
-                ax1.grid(True)
-                st.pyplot(fig1)
-
-            with col2:
-                st.subheader("📊 Top 10 par taux de rotation")
-
-                top_rotation = df_final.sort_values("Taux de rotation",
-                                                    ascending=False).head(10)
-
-                fig2, ax2 = plt.subplots(figsize=(8, 6))
-                sns.barplot(
-                    data=top_rotation,
-                    x="Chiffre d'affaires HT",
-                    y="Désignation Article",
-                    palette="tab10",
-                    ax=ax2
-                )
-                ax2.set_title("Top 10 par taux de rotation - CA en abscisse")
-                ax2.set_xlabel("Chiffre d'affaires HT en MAD")
-                ax2.set_ylabel("Désignation Article")
-                ax2.grid(True)
-                st.pyplot(fig2)
-
-            # ✅ Export Excel
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-                df_final.to_excel(writer, index=False, sheet_name="Taux de rotation")
-            buffer.seek(0)
-
-            st.download_button(
-                label="📥 Télécharger le fichier Excel",
-                data=buffer,
-                file_name="résultat_taux_rotation.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-        except Exception as e:
-            st.error(f"Erreur pendant le traitement : {e}")
+    # Calcul en arrière-plan, résultat réutilisé pour les mêmes fichiers
+    doublons = st.selectbox(
+        "Ventes d'une même référence", list(DOUBLONS), format_func=DOUBLONS.get,
+        key="doublons_ventes",
+        help="Par défaut, les lignes de ventes d'une même référence sont sommées ; "
+             "« Refuser le fichier » arrête le calcul et liste les références "
+             "en double."
+    )
+    travail = suivre_travail("rotation_ventes", fichier_stocks, fichiers_ventes,
+                             doublons=doublons)
+    if travail:
+        cle, resultats, mesures_travail = travail
+        with instrumentation.collecter() as mesures:
+            try:
+                df_final = resultats["taux_rotation"]
+
+                for colonne, valeurs in df_final.attrs.get("valeurs_non_converties",
+                                                           {}).items():
+                    st.warning(
+                        f"⚠️ {len(valeurs)} valeur(s) non numérique(s) dans `{colonne}` "
+                        f"ignorée(s) : {', '.join(valeurs[:5])}"
+                    )
+
+                signaler_doublons(df_final, "les ventes")
+
+                st.subheader("📊 Résultat")
+                afficher_tableau(df_final, cle, "taux_rotation")
+
+                # ✅ Création de graphs pour avoir des insights pertinents
+                # (top 10 par sélection partielle, images mises en cache)
+                import graphiques
+                rendu = st.radio("Rendu des graphiques", graphiques.RENDUS,
+                                 horizontal=True, key="rendu_graphiques")
+                with instrumentation.etape("graphiques", len(df_final)):
+                    for colonne, graphique in zip(st.columns(2),
+                                                  graphiques.GRAPHIQUES_ROTATION):
+                        with colonne:
+                            st.subheader(graphique["section"])
+                            resultat = graphiques.graphique_top(df_final, graphique,
+                                                                cle, rendu)
+                            if rendu == graphiques.RENDUS[1]:
+                                st.altair_chart(resultat, use_container_width=True)
+                            else:
+                                st.image(resultat)
+
+                # ✅ Export (généré à la demande)
+                proposer_telechargement(df_final, cle, "résultat_taux_rotation",
+                                        "Taux de rotation",
+                                        "📥 Télécharger le fichier")
+
+                if fichier_stocks and fichiers_ventes:
+                    with st.expander("📈 Évolution mensuelle (ventes datées)"):
+                        afficher_evolution("series_ventes", fichier_stocks,
+                                           fichiers_ventes)
+
+            except Exception as e:
+                st.error(f"Erreur pendant le traitement : {e}")
+        afficher_performance("rotation_ventes", mesures_travail + mesures)
 
 
 with tab2:
@@ -160,61 +485,61 @@ with tab2:
 
     Les colonnes nommés ainsi sont nécessaires pour que la fusion fonctionne correctement.
     Si les noms de colonnes sont différents, vous pouvez les renommer dans le fichier Excel
-    """)
-
-    col1, col2 = st.columns(2)
 
-    with col1:
-        fichier_bls_t = st.file_uploader("📥 Fichier avec nouvelles remarques",
-                                         type=["xlsx"], key="BLS_de_ce_mois")
-    with col2:
-        fichier_bls_tm1 = st.file_uploader("📥 Fichier avec anciennes remarques",
-                                           type=["xlsx"],
-                                           key="BLS_t_m1")
-    if fichier_bls_t and fichier_bls_tm1:
-        try:
-            bls_t = f2.lire_avec_header_auto(fichier_bls_t, sheet_name="Feuil2",
-                                             mot_clef="N° Compte Client")
-            bls_tm1 = f2.lire_avec_header_auto(fichier_bls_tm1, sheet_name="Feuil2",
-                                               mot_clef="N° Compte Client")
-
-            bls_tm1.columns.values[-1] = "REMARQUES"
-
-            # nettoyer le nom des colonnes et les numéros de pièces
-            bls_t.columns = bls_t.columns.str.strip()
-            bls_tm1.columns = bls_tm1.columns.str.strip()
-
-            bls_t = f2.nettoyer_num_piece(bls_t)
-            bls_tm1 = f2.nettoyer_num_piece(bls_tm1)
-
-            # Fusion sans doublons
-            df_bls = pd.merge(
-                bls_t,
-                bls_tm1[["N° Pièce", "REMARQUES"]],
-                on="N° Pièce", how="left"
-            )
-
-            df_bls.drop(columns=["Prix Revient Total"], inplace=True, errors='ignore')
-
-            st.success("✅ Fusion réussie ! Aperçu ci-dessous :")
-            st.dataframe(df_bls)
-
-            # Préparer les deux buffers
-            buffer_sans_doublon = io.BytesIO()
-            with pd.ExcelWriter(buffer_sans_doublon, engine="xlsxwriter") as writer:
-                df_bls.to_excel(writer, index=False, sheet_name="Feuil2")
-            buffer_sans_doublon.seek(0)
-
-            # Bouton de téléchargement
-            st.download_button(
-                label="📥 Télécharger la fusion",
-                data=buffer_sans_doublon,
-                file_name="fusion_bons_livraison.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+    🗂️ Avec le **registre des remarques**, enregistrez une fois le fichier complété :
+    le mois suivant, seul le fichier des nouveaux bons de livraison est à téléverser.
+    """)
 
-        except Exception as e:
-            st.error(f"Erreur pendant la fusion : {e}")
+    source = st.radio("Remarques reprises depuis", SOURCES_REMARQUES,
+                      horizontal=True, key="source_bls",
+                      help="Le registre garde les remarques des fichiers complétés "
+                           "que vous y enregistrez : seul le fichier des nouveaux "
+                           "bons de livraison est alors à téléverser.")
+    if source == SOURCES_REMARQUES[0]:
+        nom_rapport = "fusion_bls"
+        col1, col2 = st.columns(2)
+
+        with col1:
+            fichier_bls_t = st.file_uploader("📥 Fichier avec nouvelles remarques",
+                                             type=["csv", "xlsx"], key="BLS_de_ce_mois")
+        with col2:
+            fichier_bls_tm1 = st.file_uploader("📥 Fichier avec anciennes remarques",
+                                               type=["csv", "xlsx"],
+                                               key="BLS_t_m1")
+        doublons = st.selectbox(
+            "Anciens BL de plusieurs lignes", ["premier", "dernier", "erreur"],
+            format_func={**DOUBLONS, "premier": "Garder la première remarque",
+                         "dernier": "Garder la dernière remarque"}.get,
+            key="doublons_bls",
+            help="Remarque reprise pour un N° Pièce présent sur plusieurs lignes "
+                 "de l'ancien fichier ; « Refuser le fichier » arrête la fusion."
+        )
+        travail = suivre_travail(nom_rapport, fichier_bls_t, fichier_bls_tm1,
+                                 doublons=doublons)
+    else:
+        nom_rapport = "bls_registre"
+        fichier_bls_t = st.file_uploader("📥 Fichier des nouveaux bons de livraison",
+                                         type=["csv", "xlsx"], key="BLS_registre")
+        with st.expander("🗂️ Registre des remarques"):
+            afficher_registre("bls", "des bons de livraison")
+        travail = suivre_travail(nom_rapport, fichier_bls_t)
+    if travail:
+        cle, resultats, mesures_travail = travail
+        with instrumentation.collecter() as mesures:
+            try:
+                df_bls = resultats["bls"]
+
+                st.success("✅ Fusion réussie ! Aperçu ci-dessous :")
+                signaler_doublons(df_bls, "les anciens bons de livraison")
+                afficher_tableau(df_bls, cle, "bls")
+
+                # Bouton de téléchargement
+                proposer_telechargement(df_bls, cle, "fusion_bons_livraison", "Feuil2",
+                                        "📥 Télécharger la fusion")
+
+            except Exception as e:
+                st.error(f"Erreur pendant la fusion : {e}")
+        afficher_performance(nom_rapport, mesures_travail + mesures)
 
 
 with tab3:
@@ -237,43 +562,69 @@ with tab3:
 
     Assurez-vous que les colonnes sont correctement nommées dans les fichiers Excel.
     Si les noms de colonnes sont différents, vous pouvez les renommer dans le fichier Excel
-    """)
 
-    col1, col2 = st.columns(2)
+    🗂️ Avec le **registre des remarques**, enregistrez une fois le fichier complété :
+    le mois suivant, seul le nouveau fichier est à téléverser.
+    """)
 
-    with col1:
-        ancien_fichier = st.file_uploader("📥 Fichier ancien",
-                                          type=["xlsx"],
-                                          key="ancien_suivi")
-    with col2:
+    source = st.radio("Remarques reprises depuis", SOURCES_REMARQUES,
+                      horizontal=True, key="source_suivi",
+                      help="Le registre garde les remarques des fichiers complétés "
+                           "que vous y enregistrez : seul le nouveau fichier est "
+                           "alors à téléverser.")
+    if source == SOURCES_REMARQUES[0]:
+        nom_rapport = "suivi_commandes"
+        col1, col2 = st.columns(2)
+
+        with col1:
+            ancien_fichier = st.file_uploader("📥 Fichier ancien",
+                                              type=["csv", "xlsx"],
+                                              key="ancien_suivi")
+        with col2:
+            nouveau_fichier = st.file_uploader("📥 Fichier nouveau",
+                                               type=["csv", "xlsx"],
+                                               key="nouveau_suivi")
+
+        seuil = None
+        if st.checkbox(
+                "🔎 Report approché des remarques (désignations modifiées)",
+                key="report_approche",
+                help="Une ligne dont la désignation a changé reçoit la remarque de "
+                     "la ligne de même référence dont la désignation est la plus "
+                     "proche. La colonne « Confiance remarque » indique la "
+                     "similarité (1 pour une correspondance exacte)."):
+            import rapprochement
+            seuil = st.slider("Similarité minimale", 0.3, 1.0,
+                              rapprochement.SEUIL_SIMILARITE, 0.05,
+                              key="seuil_similarite")
+
+        travail = suivre_travail(nom_rapport, ancien_fichier, nouveau_fichier,
+                                 seuil=seuil)
+    else:
+        nom_rapport = "suivi_registre"
         nouveau_fichier = st.file_uploader("📥 Fichier nouveau",
-                                           type=["xlsx"],
-                                           key="nouveau_suivi")
-
-    if ancien_fichier and nouveau_fichier:
-        try:
-
-            # Traitement
-            df_resultat = f2.traiter_fichiers(ancien_fichier, nouveau_fichier)
-
-            st.success("✅ Mise à jour effectuée avec succès !")
-            st.dataframe(df_resultat)
-
-            # Export Excel
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-                df_resultat.to_excel(writer, index=False, sheet_name="Suivi commandé")
-            buffer.seek(0)
-
-            st.download_button(
-                label="📥 Télécharger le fichier mis à jour",
-                data=buffer,
-                file_name="suivi_commandes_mis_a_jour.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-        except Exception as e:
-            st.error(f"Erreur pendant le traitement : {e}")
+                                           type=["csv", "xlsx"],
+                                           key="nouveau_suivi_registre")
+        with st.expander("🗂️ Registre des remarques"):
+            afficher_registre("suivi", "de suivi de commandes")
+        travail = suivre_travail(nom_rapport, nouveau_fichier)
+    if travail:
+        cle, resultats, mesures_travail = travail
+        with instrumentation.collecter() as mesures:
+            try:
+                df_resultat = resultats["suivi"]
+
+                st.success("✅ Mise à jour effectuée avec succès !")
+                afficher_tableau(df_resultat, cle, "suivi")
+
+                # Export (généré à la demande)
+                proposer_telechargement(df_resultat, cle, "suivi_commandes_mis_a_jour",
+                                        "Suivi commandé",
+                                        "📥 Télécharger le fichier mis à jour")
+
+            except Exception as e:
+                st.error(f"Erreur pendant le traitement : {e}")
+        afficher_performance(nom_rapport, mesures_travail + mesures)
 
 
 with tab4:
@@ -292,6 +643,7 @@ with tab4:
     - `Qté Mouvement` : la quantité de mouvement
     - `Quantité` : la quantité associée à chaque mouvement (dans le fichier de mouvement)
     - `Code - Intitulé Famille` : la famille de l'article (optionnel mais recommandé)
+    - `Date` : la date du mouvement (optionnel, permet le classement XYZ)
 
     Assurez-vous que les colonnes sont correctement nommées dans les fichiers Excel.
     Si les noms de colonnes sont différents, vous pouvez les renommer dans le fichier Excel
@@ -302,64 +654,141 @@ with tab4:
     with col1:
         fichier_stock = st.file_uploader(
             "📥 Fichier de stock",
-            type=["xlsx"],
+            type=["csv", "xlsx"],
             key="fichier_stock"
         )
     with col2:
-        fichier_mouvement = st.file_uploader(
-            "📥 Fichier de mouvement",
-            type=["xlsx"],
-            key="fichier_mouvement"
+        fichiers_mouvements = st.file_uploader(
+            "📥 Fichier(s) de mouvement (plusieurs fichiers possibles, par exemple "
+            "un par mois)",
+            type=["csv", "xlsx"],
+            key="fichier_mouvement",
+            accept_multiple_files=True
         )
 
-    if fichier_stock and fichier_mouvement:
-        try:
-            mouvements = f2.lire_avec_header_auto(
-                fichier_mouvement,
-                mot_clef="Référence Article"
-            )
-            stocks = f2.lire_avec_header_auto(
-                fichier_stock,
-                mot_clef="Référence Article"
-            )
+    espace_disque = st.checkbox(
+        "💾 Espace de travail sur disque (historiques de mouvements très volumineux)",
+        key="espace_disque",
+        help="Les mouvements sont lus par blocs et leurs quantités écrites sur "
+             "disque au lieu d'être chargées en mémoire : plus lent, mais permet "
+             "de traiter des fichiers plus grands que la mémoire disponible."
+    )
 
-            df_resultat = preparer_donnees2(stocks, mouvements)
-            st.success("✅ Calcul du taux de rotation effectué avec succès !")
-            st.dataframe(df_resultat)
-
-            df_famille = groupby_famille(df_resultat)
-
-            # Préparer buffer Excel pour taux de rotation par article
-            buffer_articles = io.BytesIO()
-            with pd.ExcelWriter(buffer_articles, engine="xlsxwriter") as writer:
-                df_resultat.to_excel(writer, index=False,
-                                     sheet_name="Taux de rotation par article")
-            buffer_articles.seek(0)
-
-            # Préparer buffer Excel pour taux de rotation par famille
-            buffer_familles = io.BytesIO()
-            with pd.ExcelWriter(buffer_familles, engine="xlsxwriter") as writer:
-                df_famille.to_excel(writer, index=False,
-                                    sheet_name="Taux de rotation par famille")
-            buffer_familles.seek(0)
-
-            col_download_1, col_download_2 = st.columns(2)
-
-            with col_download_1:
-                st.download_button(
-                    label="📥 Télécharger taux de rotation par article",
-                    data=buffer_articles,
-                    file_name="taux_de_rotation_articles.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-
-            with col_download_2:
-                st.download_button(
-                    label="📥 Télécharger taux de rotation par famille",
-                    data=buffer_familles,
-                    file_name="taux_de_rotation_familles.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-
-        except Exception as e:
-            st.error(f"Erreur pendant le traitement : {e}")
+    travail = suivre_travail("rotation_mouvements", fichier_stock, fichiers_mouvements,
+                             espace_disque=espace_disque)
+    if travail:
+        cle, resultats, mesures_travail = travail
+        with instrumentation.collecter() as mesures:
+            try:
+                df_resultat = resultats["articles"]
+                hors_plage = df_resultat.attrs.get("dates_hors_plage")
+                if hors_plage:
+                    st.warning(
+                        f"⚠️ {hors_plage['nombre']} mouvement(s) daté(s) hors de la "
+                        "plage plausible, comptés dans les totaux mais pas dans les "
+                        f"sorties mensuelles : {', '.join(hors_plage['exemples'])}"
+                    )
+                st.success("✅ Calcul du taux de rotation effectué avec succès !")
+                afficher_tableau(df_resultat, cle, "articles")
+
+                # Taux pondéré (sorties totales / stock total), médiane, centiles
+                # et classes ABC/XYZ par famille, puis pour l'ensemble
+                df_famille = resultats["familles"]
+                st.markdown("#### Par famille")
+                st.dataframe(df_famille, hide_index=True)
+
+                col_download_1, col_download_2 = st.columns(2)
+
+                with col_download_1:
+                    proposer_telechargement(
+                        df_resultat, cle, "taux_de_rotation_articles",
+                        "Taux de rotation par article",
+                        "📥 Télécharger taux de rotation par article"
+                    )
+
+                with col_download_2:
+                    proposer_telechargement(
+                        df_famille, cle, "taux_de_rotation_familles",
+                        "Taux de rotation par famille",
+                        "📥 Télécharger taux de rotation par famille"
+                    )
+
+                # Les séries et l'historique relisent les fichiers téléversés
+                fichiers_presents = bool(fichier_stock and fichiers_mouvements)
+                if not espace_disque and fichiers_presents:
+                    with st.expander("📈 Évolution mensuelle (mouvements datés)"):
+                        afficher_evolution("series_mouvements", fichier_stock,
+                                           fichiers_mouvements)
+
+                # Historique mensuel : les mouvements de chaque mois sont agrégés une
+                # fois pour toutes, les fenêtres se calculent depuis les agrégats
+                with st.expander("📅 Historique mensuel (12 mois glissants, depuis "
+                                 "janvier, 3 ans)"):
+                    st.markdown("""
+                    Ajoutez chaque mois les mouvements du mois (colonne `Date` requise)
+                    et l'état de stock correspondant : le taux de rotation sur une
+                    fenêtre est ensuite calculé à partir de l'historique, sans
+                    recharger les mouvements des mois précédents.
+                    """)
+                    import agregats
+
+                    # Un historique par site ou société : un ajout ne modifie
+                    # pas les fenêtres des autres utilisateurs
+                    nom_historique = st.selectbox(
+                        "Historique", agregats.historiques(), index=None,
+                        accept_new_options=True, key="nom_historique",
+                        placeholder="Choisir ou saisir un nom (site, société…)"
+                    )
+                    if not nom_historique:
+                        st.info("ℹ️ Choisissez l'historique à consulter ou compléter.")
+                    else:
+                        dossier = agregats.dossier_historique(nom_historique)
+                        remplacer = st.checkbox(
+                            "Remplacer les mois déjà enregistrés",
+                            key="remplacer_historique",
+                            help="Sans cette case, l'ajout est refusé si l'un des "
+                                 "mois des fichiers est déjà dans l'historique."
+                        )
+                        # L'ajout est calculé en arrière-plan, une fois demandé
+                        demande = (nom_historique, remplacer)
+                        if fichiers_presents and st.button(
+                                "➕ Ajouter ces fichiers à l'historique",
+                                key="ajout_historique"):
+                            st.session_state["demande_historique"] = demande
+                        if (fichiers_presents and
+                                st.session_state.get("demande_historique") == demande):
+                            ajout = suivre_travail(
+                                "historique_mouvements", fichier_stock,
+                                fichiers_mouvements, historique=nom_historique,
+                                remplacer=remplacer
+                            )
+                            if ajout:
+                                mois = ajout[1]["mois"]["Mois"].tolist()
+                                if mois:
+                                    st.success(f"✅ Mois ajoutés : {', '.join(mois)} "
+                                               f"(état de stock enregistré pour "
+                                               f"{mois[-1]})")
+                                else:
+                                    st.warning("Aucune sortie dans ce fichier de "
+                                               "mouvements.")
+
+                        mois_sorties, mois_stocks = agregats.mois_disponibles(dossier)
+                        if mois_stocks:
+                            fin = st.selectbox("Dernier mois", mois_sorties[::-1],
+                                               key="fin_historique")
+                            choix = st.radio("Fenêtre", list(agregats.FENETRES),
+                                             horizontal=True, key="fenetre_historique")
+                            debut, fin = agregats.fenetre(fin,
+                                                          agregats.FENETRES[choix])
+                            st.caption(f"Période : {debut} → {fin}")
+                            st.dataframe(agregats.rotation_periode(debut, fin,
+                                                                   dossier))
+
+            except Exception as e:
+                st.error(f"Erreur pendant le traitement : {e}")
+        afficher_performance("rotation_mouvements", mesures_travail + mesures)
+
+
+# Une fois la page envoyée : chargement des modules de calcul et démarrage des
+# processus de calcul en tâche de fond (une seule fois par serveur)
+prechauffage.lancer()
@@ -0,0 +1,94 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import mesurer
+
+
+class ValeursNonConverties(UserWarning):
+    """Avertissement émis quand des cellules ne peuvent pas être converties en nombre."""
+
+
+def _convertir_valeur(valeur):
+    """
+    Convertit une cellule au format français (ex. " 1 688,468", "(12,5)") en float.
+    Args:
+        valeur: La valeur brute de la cellule (texte ou nombre).
+    Returns:
+        float ou None: Le nombre, ou None si la cellule n'est pas convertible.
+    """
+    if isinstance(valeur, (int, float, np.number)) and not isinstance(valeur, bool):
+        return float(valeur)
+
+    # Supprime tous les espaces : classiques, insécables (\xa0,  ), tabulations
+    texte = "".join(str(valeur).split())
+    if texte == "":
+        return 0.0  # cellule vide => 0
+
+    negatif = texte.startswith("(") and texte.endswith(")")
+    if negatif:
+        texte = texte[1:-1]
+
+    if "," in texte:
+        if "." in texte and texte.rfind(".") > texte.rfind(","):
+            texte = texte.replace(",", "")  # 1,234.56 : virgule = milliers
+        else:
+            texte = texte.replace(".", "").replace(",", ".")  # 1.234,56 ou 12,5
+
+    try:
+        nombre = float(texte)
+    except ValueError:
+        return None
+    return -nombre if negatif else nombre
+
+
+@mesurer
+def convertir_nombres(col):
+    """
+    Convertit une colonne de nombres au format français en float, en une passe :
+    chaque valeur distincte n'est analysée qu'une fois puis redistribuée.
+    Gère les séparateurs de milliers (espaces, insécables), la virgule décimale,
+    les cellules vides (=> 0) et les négatifs entre parenthèses. Les colonnes
+    déjà numériques sont seulement converties en float.
+    Args:
+        col (pd.Series): La colonne à convertir.
+    Returns:
+        tuple: (pd.Series des valeurs converties en float, NaN pour les cellules
+            non convertibles ; pd.Series des valeurs brutes non convertibles)
+    """
+    if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        return col.astype(float), col.iloc[:0]
+
+    # Valeurs manquantes => code -1, qui pointe sur le NaN ajouté en fin de tableau
+    codes, uniques = pd.factorize(col)
+    nombres = [_convertir_valeur(v) for v in uniques]
+    invalides = np.array([n is None for n in nombres] + [False])
+    valeurs = np.array(
+        [np.nan if n is None else n for n in nombres] + [np.nan], dtype=float
+    )
+
+    serie = pd.Series(valeurs[codes], index=col.index, name=col.name)
+    return serie, col[invalides[codes]]
+
+
+def nettoyer_et_convertir(col):
+    """
+    Nettoie une colonne de données en supprimant les espaces (y compris insécables),
+    remplaçant les virgules par des points, et convertissant en float.
+    Les cellules non convertibles deviennent NaN et sont signalées par un
+    avertissement `ValeursNonConverties` au lieu de lever une erreur.
+    Args:
+        col (pd.Series): La colonne à nettoyer et convertir.
+    Returns:
+        pd.Series: La colonne nettoyée et convertie en float.
+    """
+    serie, invalides = convertir_nombres(col)
+    if len(invalides):
+        warnings.warn(
+            f"{len(invalides)} valeur(s) non convertible(s) dans '{col.name}' "
+            f"(ex. : {', '.join(map(repr, invalides.unique()[:5]))})",
+            ValeursNonConverties,
+            stacklevel=2,
+        )
+    return serie
@@ -0,0 +1,115 @@
+import io
+import os
+import threading
+
+import instrumentation
+
+
+# Préchauffage : après le premier affichage de la page, un thread charge les
+# modules de calcul et fait passer un jeu de données minimal par les rapports,
+# les graphiques et l'export (premiers appels de pandas, pyarrow, matplotlib,
+# xlsxwriter). Les processus de `travaux` sont démarrés et préchauffés de la
+# même façon : le premier rapport d'un utilisateur ne paie ni les imports ni
+# le lancement des processus. AUTOREPORTING_PRECHAUFFAGE=0 le désactive.
+ACTIF = os.environ.get("AUTOREPORTING_PRECHAUFFAGE", "1") != "0"
+
+# Fichiers du jeu minimal (CSV) : nom -> lignes
+JEU_MINIMAL = {
+    "stocks": [
+        "Référence Article;Désignation Article;Code - Intitulé Famille;Qté Stock Réel",
+        "A1;Article 1;F1 - Famille 1;10",
+        "A2;Article 2;F2 - Famille 2;4",
+    ],
+    "ventes": [
+        "Référence Article;Désignation Article;Qté Vendues;Chiffre d'affaires HT;Date",
+        "A1;Article 1;3;30,5;15/01/2024",
+        "A2;Article 2;1;12;10/02/2024",
+    ],
+    "mouvements": [
+        "Référence Article;Désignation Article;Code - Intitulé Famille;Quantité;Date",
+        "A1;Article 1;F1 - Famille 1;-3;15/01/2024",
+        "A2;Article 2;F2 - Famille 2;-1;10/02/2024",
+        "A1;Article 1;F1 - Famille 1;5;12/02/2024",
+    ],
+    "bls_nouveaux": [
+        "N° Compte Client;N° Pièce;Prix Revient Total",
+        "C1;BL001;10",
+    ],
+    "bls_anciens": [
+        "N° Compte Client;N° Pièce;Prix Revient Total;REMARQUES",
+        "C1;BL001;10;livré",
+    ],
+    "suivi_ancien": [
+        "N° Pièce;Référence;Désignation;Remarques",
+        "BC001;A1;Article 1;à relancer",
+    ],
+    "suivi_nouveau": [
+        "N° Pièce;Référence;Désignation",
+        "BC001;A1;Article 1",
+    ],
+}
+
+_lance = False
+_verrou = threading.Lock()
+
+
+def fichier_minimal(nom):
+    """Un fichier du jeu minimal, en mémoire, comme un fichier téléversé."""
+    fichier = io.BytesIO("\n".join(JEU_MINIMAL[nom]).encode("utf-8"))
+    fichier.name = f"{nom}.csv"
+    return fichier
+
+
+def prechauffer_rapports():
+    """Calcule chaque rapport de `rapports.RAPPORTS` sur le jeu minimal."""
+    import rapports
+
+    for nom, rapport in rapports.RAPPORTS.items():
+        rapports.executer(nom, *[fichier_minimal(e) for e in rapport["entrees"]])
+
+
+def prechauffer_affichage():
+    """Ce que l'app calcule elle-même : séries mensuelles, graphiques, export et
+    index de la visionneuse."""
+    import export
+    import graphiques
+    import rapports
+    import series_temporelles
+    import visionneuse
+
+    series = rapports.series_mouvements(fichier_minimal("stocks"),
+                                        fichier_minimal("mouvements"))
+    df = series_temporelles.rotation_periode(series)
+    graphiques.barres_png(df, "Taux de rotation", "Désignation Article", "", "")
+    export.exporter_excel(df, "Feuil1")
+    visionneuse.ordre(df, "Taux de rotation")
+
+
+def prechauffer_processus():
+    """Exécuté dans chaque processus de calcul au démarrage du serveur."""
+    with instrumentation.etape("prechauffage"):
+        prechauffer_rapports()
+
+
+def _prechauffer():
+    import travaux
+
+    with instrumentation.etape("prechauffage"):
+        travaux.prechauffer(prechauffer_processus)
+        prechauffer_affichage()
+
+
+def lancer():
+    """
+    Lance le préchauffage en tâche de fond, une seule fois par serveur (les
+    exécutions suivantes du script n'ont aucun effet).
+    Returns:
+        bool: True si le préchauffage vient d'être lancé.
+    """
+    global _lance
+    with _verrou:
+        if _lance or not ACTIF:
+            return False
+        _lance = True
+    threading.Thread(target=_prechauffer, name="prechauffage", daemon=True).start()
+    return True
@@ -0,0 +1,358 @@
+# Les rapports de l'application, indépendants de Streamlit : chacun prend
+# les fichiers d'entrée (chemins ou fichiers Streamlit) et renvoie ses résultats
+# sous forme de dictionnaire {clé: DataFrame}. Les ventes et les mouvements
+# peuvent être répartis sur plusieurs fichiers (une liste, concaténée).
+import os
+import zipfile
+
+import pandas as pd
+
+from agregats import (
+    COLONNE_DATE, ajouter_mouvements, dossier_historique, sorties_mensuelles
+)
+from fonctions import (
+    preparer_donnees, preparer_donnees2, preparer_donnees_flux,
+    COLONNES_STOCKS, COLONNES_VENTES, COLONNES_STOCKS2, COLONNES_MOUVEMENTS
+)
+from espace_disque import preparer_donnees2_disque
+from instrumentation import mesurer
+import fonctions2 as f2
+from ingestion import charger, cle_contenu, en_liste, precharger
+import remarques
+from schemas import ALIAS_REMARQUES, SchemaInvalide, controler
+from series_temporelles import series_rotation
+from statistiques import classer_articles, statistiques_rotation
+
+
+# Paramètres de lecture de chaque fichier d'entrée (voir `charger_extrait`)
+LECTURE_STOCKS = {"mot_clef": "Référence Article", "colonnes": COLONNES_STOCKS}
+LECTURE_VENTES = {"mot_clef": "Référence Article", "colonnes": COLONNES_VENTES}
+# Les bons de livraison et le suivi de commandes sont rendus à l'utilisateur :
+# aucune colonne n'est normalisée à la lecture (les clés sont construites à
+# part, voir `nettoyer_num_piece` et `construire_cle`)
+LECTURE_BLS = {"sheet_name": "Feuil2", "mot_clef": "N° Compte Client",
+               "normalisees": []}
+LECTURE_SUIVI_ANCIEN = {"colonnes": f2.COLONNES_SUIVI_ANCIEN, "normalisees": []}
+LECTURE_SUIVI_NOUVEAU = {"normalisees": []}
+LECTURE_VENTES_DATEES = {"mot_clef": "Référence Article",
+                         "colonnes": COLONNES_VENTES + [COLONNE_DATE]}
+LECTURE_STOCKS2 = {"mot_clef": "Référence Article", "colonnes": COLONNES_STOCKS2}
+# La date (facultative) permet le classement XYZ des articles
+LECTURE_MOUVEMENTS = {"mot_clef": "Référence Article",
+                      "colonnes": COLONNES_MOUVEMENTS + [COLONNE_DATE]}
+
+# Schéma de chaque fichier d'entrée, contrôlé avant sa lecture (voir
+# `verifier`) : colonnes obligatoires et types attendus. La feuille et le mot
+# clé de la ligne d'en-tête sont ceux de sa lecture.
+SCHEMA_STOCKS = {"libelle": "stocks", "lecture": LECTURE_STOCKS,
+                 "obligatoires": COLONNES_STOCKS,
+                 "types": {"Qté Stock Réel": "nombre"}}
+SCHEMA_VENTES = {"libelle": "ventes", "lecture": LECTURE_VENTES,
+                 "obligatoires": COLONNES_VENTES,
+                 "types": {"Qté Vendues": "nombre", "Chiffre d'affaires HT": "nombre"}}
+SCHEMA_VENTES_DATEES = {**SCHEMA_VENTES, "lecture": LECTURE_VENTES_DATEES,
+                        "obligatoires": COLONNES_VENTES + [COLONNE_DATE],
+                        "types": {**SCHEMA_VENTES["types"], COLONNE_DATE: "date"}}
+SCHEMA_BLS = {"libelle": "bons de livraison", "lecture": LECTURE_BLS,
+              "obligatoires": ["N° Pièce"]}
+SCHEMA_BLS_ANCIENS = {**SCHEMA_BLS, "libelle": "anciens bons de livraison",
+                      "obligatoires": ["N° Pièce", "REMARQUES"],
+                      "alias": {"REMARQUES": ALIAS_REMARQUES}}
+SCHEMA_SUIVI_ANCIEN = {"libelle": "ancien suivi de commandes",
+                       "lecture": LECTURE_SUIVI_ANCIEN,
+                       "obligatoires": f2.COLONNES_SUIVI_ANCIEN}
+SCHEMA_SUIVI_NOUVEAU = {"libelle": "nouveau suivi de commandes",
+                        "lecture": LECTURE_SUIVI_NOUVEAU,
+                        "obligatoires": ["Référence", "Désignation"]}
+SCHEMA_STOCKS2 = {"libelle": "stocks", "lecture": LECTURE_STOCKS2,
+                  "obligatoires": ["Référence Article", "Désignation Article",
+                                   "Code - Intitulé Famille", "Qté Stock Réel"],
+                  "types": {"Qté Stock Réel": "nombre"}}
+SCHEMA_MOUVEMENTS = {"libelle": "mouvements", "lecture": LECTURE_MOUVEMENTS,
+                     "obligatoires": COLONNES_MOUVEMENTS,
+                     "types": {"Quantité": "nombre", COLONNE_DATE: "date"}}
+SCHEMA_MOUVEMENTS_DATES = {**SCHEMA_MOUVEMENTS,
+                           "obligatoires": COLONNES_MOUVEMENTS + [COLONNE_DATE]}
+
+
+def rotation_ventes(fichier_stocks, fichier_ventes, taille_bloc=None,
+                    doublons="somme"):
+    """
+    Taux de rotation par article à partir des stocks et des ventes. Si
+    `taille_bloc` est donné, les ventes sont lues et agrégées par blocs (leurs
+    doublons sont alors forcément sommés). `doublons` : traitement des ventes
+    d'une même référence (voir `jointures.POLITIQUES`).
+    """
+    stocks = charger(fichier_stocks, **LECTURE_STOCKS)
+    if taille_bloc:
+        if doublons != "somme":
+            raise ValueError("La lecture des ventes par blocs somme les ventes "
+                             "d'une même référence (doublons : 'somme' uniquement)")
+        df_final = preparer_donnees_flux(stocks, fichier_ventes, taille_bloc)
+    else:
+        df_final = preparer_donnees(
+            stocks, charger(fichier_ventes, **LECTURE_VENTES), doublons,
+            cle_ventes=cle_contenu(fichier_ventes, **LECTURE_VENTES)
+        )
+    return {"taux_rotation": df_final}
+
+
+def fusion_bls(fichier_bls_t, fichier_bls_tm1, doublons="premier"):
+    """
+    Report des remarques des anciens bons de livraison sur les nouveaux.
+    `doublons` : remarque retenue pour un BL de plusieurs lignes.
+    """
+    df_bls = f2.fusionner_bls(
+        charger(fichier_bls_t, **LECTURE_BLS),
+        charger(fichier_bls_tm1, **LECTURE_BLS),
+        doublons, cle_anciens=cle_contenu(fichier_bls_tm1, **LECTURE_BLS)
+    )
+    return {"bls": df_bls}
+
+
+def suivi_commandes(ancien_fichier, nouveau_fichier, seuil=None):
+    """
+    Report des remarques de l'ancien suivi de commandes sur le nouveau. Avec
+    `seuil`, les lignes dont la désignation a changé sont rapprochées par
+    similarité (voir `fonctions2.reporter_remarques`).
+    """
+    df_resultat = f2.reporter_remarques(
+        charger(ancien_fichier, **LECTURE_SUIVI_ANCIEN),
+        charger(nouveau_fichier, **LECTURE_SUIVI_NOUVEAU),
+        seuil=seuil
+    )
+    return {"suivi": df_resultat}
+
+
+def bls_registre(fichier_bls_t):
+    """Nouveaux bons de livraison annotés depuis le registre des remarques."""
+    return {"bls": remarques.annoter_bls(charger(fichier_bls_t, **LECTURE_BLS))}
+
+
+def suivi_registre(nouveau_fichier):
+    """Nouveau suivi de commandes annoté depuis le registre des remarques."""
+    return {"suivi": remarques.annoter_suivi(
+        charger(nouveau_fichier, **LECTURE_SUIVI_NOUVEAU)
+    )}
+
+
+def rotation_mouvements(fichier_stock, fichier_mouvement, espace_disque=False):
+    """
+    Taux de rotation par article (avec classes ABC, et XYZ si les mouvements
+    sont datés) et statistiques par famille à partir des mouvements. Avec
+    `espace_disque`, les mouvements passent par un espace de travail sur disque
+    au lieu d'être chargés en mémoire.
+    """
+    stocks = charger(fichier_stock, **LECTURE_STOCKS2)
+    if espace_disque:
+        df_resultat, mensuelles = preparer_donnees2_disque(stocks, fichier_mouvement)
+    else:
+        mouvements = charger(fichier_mouvement, **LECTURE_MOUVEMENTS)
+        df_resultat = preparer_donnees2(stocks, mouvements)
+        mensuelles = (sorties_mensuelles(mouvements)
+                      if COLONNE_DATE in mouvements.columns else None)
+    df_resultat = classer_articles(df_resultat, mensuelles)
+    return {"articles": df_resultat, "familles": statistiques_rotation(df_resultat)}
+
+
+def series_mouvements(fichier_stock, fichier_mouvement):
+    """
+    Séries mensuelles (sorties, stock moyen) par article à partir des
+    mouvements datés (voir `series_rotation`).
+    """
+    return series_rotation(charger(fichier_stock, **LECTURE_STOCKS2),
+                           charger(fichier_mouvement, **LECTURE_MOUVEMENTS))
+
+
+def series_ventes(fichier_stocks, fichier_ventes):
+    """
+    Séries mensuelles (sorties, stock moyen) par article à partir des ventes
+    datées, le stock étant supposé constant (voir `series_rotation`).
+    """
+    return series_rotation(charger(fichier_stocks, **LECTURE_STOCKS),
+                           charger(fichier_ventes, **LECTURE_VENTES_DATEES),
+                           colonne_quantite="Qté Vendues", ventes=True)
+
+
+def historique_mouvements(fichier_stock, fichier_mouvement, historique,
+                          remplacer=False):
+    """
+    Ajoute à un historique mensuel (voir `agregats`) les sorties des
+    mouvements datés et l'état de stock, enregistré pour le dernier de leurs
+    mois. Avec `remplacer`, les mois déjà enregistrés sont remplacés ; sinon
+    l'ajout est refusé (`agregats.MoisDejaEnregistres`) et rien n'est écrit.
+    """
+    mois = ajouter_mouvements(charger(fichier_mouvement, **LECTURE_MOUVEMENTS),
+                              dossier=dossier_historique(historique),
+                              remplacer=remplacer,
+                              stocks=charger(fichier_stock, **LECTURE_STOCKS2))
+    return {"mois": pd.DataFrame({"Mois": mois})}
+
+
+# Pour chaque rapport : la fonction, les fichiers d'entrée attendus (préfixes des
+# noms de fichiers, dans l'ordre des arguments), leurs paramètres de lecture et
+# leurs schémas, les options acceptées (avec, pour celles qui lisent un fichier
+# en flux, l'index de son emplacement, qui n'est alors pas préchargé) et les
+# sorties (clé du résultat -> (nom du fichier Excel, nom de la feuille)). Les
+# rapports qui lisent le registre des remarques ne sont pas générés par défaut
+# en lot ("par_defaut").
+RAPPORTS = {
+    "rotation_ventes": {
+        "fonction": rotation_ventes,
+        "entrees": ["stocks", "ventes"],
+        "lectures": [LECTURE_STOCKS, LECTURE_VENTES],
+        "schemas": [SCHEMA_STOCKS, SCHEMA_VENTES],
+        "options": ["taille_bloc", "doublons"],
+        "flux": {"taille_bloc": 1},
+        "sorties": {
+            "taux_rotation": ("résultat_taux_rotation.xlsx", "Taux de rotation"),
+        },
+    },
+    "fusion_bls": {
+        "fonction": fusion_bls,
+        "entrees": ["bls_nouveaux", "bls_anciens"],
+        "lectures": [LECTURE_BLS, LECTURE_BLS],
+        "schemas": [SCHEMA_BLS, SCHEMA_BLS_ANCIENS],
+        "options": ["doublons"],
+        "sorties": {
+            "bls": ("fusion_bons_livraison.xlsx", "Feuil2"),
+        },
+    },
+    "suivi_commandes": {
+        "fonction": suivi_commandes,
+        "entrees": ["suivi_ancien", "suivi_nouveau"],
+        "lectures": [LECTURE_SUIVI_ANCIEN, LECTURE_SUIVI_NOUVEAU],
+        "schemas": [SCHEMA_SUIVI_ANCIEN, SCHEMA_SUIVI_NOUVEAU],
+        "options": ["seuil"],
+        "sorties": {
+            "suivi": ("suivi_commandes_mis_a_jour.xlsx", "Suivi commandé"),
+        },
+    },
+    "bls_registre": {
+        "fonction": bls_registre,
+        "par_defaut": False,
+        "entrees": ["bls_nouveaux"],
+        "lectures": [LECTURE_BLS],
+        "schemas": [SCHEMA_BLS],
+        "sorties": {
+            "bls": ("bons_livraison_annotes.xlsx", "Feuil2"),
+        },
+    },
+    "suivi_registre": {
+        "fonction": suivi_registre,
+        "par_defaut": False,
+        "entrees": ["suivi_nouveau"],
+        "lectures": [LECTURE_SUIVI_NOUVEAU],
+        "schemas": [SCHEMA_SUIVI_NOUVEAU],
+        "sorties": {
+            "suivi": ("suivi_commandes_annote.xlsx", "Suivi commandé"),
+        },
+    },
+    "rotation_mouvements": {
+        "fonction": rotation_mouvements,
+        "entrees": ["stocks", "mouvements"],
+        "lectures": [LECTURE_STOCKS2, LECTURE_MOUVEMENTS],
+        "schemas": [SCHEMA_STOCKS2, SCHEMA_MOUVEMENTS],
+        "options": ["espace_disque"],
+        "flux": {"espace_disque": 1},
+        "sorties": {
+            "articles": ("taux_de_rotation_articles.xlsx",
+                         "Taux de rotation par article"),
+            "familles": ("taux_de_rotation_familles.xlsx",
+                         "Taux de rotation par famille"),
+        },
+    },
+}
+
+
+# Calculs lancés en arrière-plan par l'application (voir `travaux`) sans être
+# générés en lot : mêmes clés que `RAPPORTS`, sans sorties Excel
+CALCULS = {
+    "series_mouvements": {
+        "fonction": series_mouvements,
+        "entrees": ["stocks", "mouvements"],
+        "lectures": [LECTURE_STOCKS2, LECTURE_MOUVEMENTS],
+        "schemas": [SCHEMA_STOCKS2, SCHEMA_MOUVEMENTS_DATES],
+    },
+    "series_ventes": {
+        "fonction": series_ventes,
+        "entrees": ["stocks", "ventes"],
+        "lectures": [LECTURE_STOCKS, LECTURE_VENTES_DATEES],
+        "schemas": [SCHEMA_STOCKS, SCHEMA_VENTES_DATEES],
+    },
+    "historique_mouvements": {
+        "fonction": historique_mouvements,
+        "entrees": ["stocks", "mouvements"],
+        "lectures": [LECTURE_STOCKS2, LECTURE_MOUVEMENTS],
+        "schemas": [SCHEMA_STOCKS2, SCHEMA_MOUVEMENTS_DATES],
+        "options": ["historique", "remplacer"],
+    },
+}
+
+
+def calcul(nom):
+    """La description d'un rapport de `RAPPORTS` ou d'un calcul de `CALCULS`."""
+    return RAPPORTS[nom] if nom in RAPPORTS else CALCULS[nom]
+
+
+def verifier_fichier(fichier, schema):
+    """
+    Contrôle un fichier d'entrée selon son schéma, sur sa seule ligne
+    d'en-tête et ses premières lignes (voir `schemas.controler`).
+    Returns:
+        list: Les problèmes trouvés, chacun précédé du nom du fichier.
+    """
+    lecture = schema["lecture"]
+    nom = fichier if isinstance(fichier, str) else getattr(fichier, "name", "")
+    prefixe = f"Fichier « {os.path.basename(nom)} » ({schema['libelle']}) : "
+    try:
+        entetes, lignes = f2.lire_entete(fichier, lecture.get("sheet_name", 0),
+                                         lecture.get("mot_clef", "N° Pièce"))
+    except (ValueError, KeyError, OSError, zipfile.BadZipFile) as e:
+        return [prefixe + str(e)]
+    return [prefixe + probleme for probleme in controler(entetes, lignes, schema)]
+
+
+@mesurer
+def verifier(nom, *fichiers):
+    """
+    Contrôle les fichiers d'entrée d'un rapport de `RAPPORTS` (ou d'un calcul
+    de `CALCULS`) avant leur lecture complète : feuille, ligne d'en-tête,
+    colonnes obligatoires et types.
+    Args:
+        nom (str): Le nom du rapport.
+        fichiers: Les fichiers de chaque emplacement.
+    Returns:
+        list: Les problèmes trouvés (vide si les fichiers sont conformes).
+    """
+    schemas = calcul(nom)["schemas"]
+    return [probleme
+            for emplacement, schema in zip(fichiers, schemas)
+            for fichier in en_liste(emplacement)
+            for probleme in verifier_fichier(fichier, schema)]
+
+
+def executer(nom, *fichiers, **options):
+    """
+    Calcule un rapport de `RAPPORTS` (ou un calcul de `CALCULS`) : ses
+    fichiers sont d'abord contrôlés (voir `verifier`), puis lus en parallèle,
+    sauf ceux qu'une option fait lire en flux.
+    Args:
+        nom (str): Le nom du rapport.
+        fichiers: Les fichiers de chaque emplacement (un fichier, ou une liste
+            pour les emplacements qui en acceptent plusieurs).
+        options: Les options du rapport (par exemple `espace_disque=True`).
+    Returns:
+        dict: Les résultats du rapport.
+    """
+    problemes = verifier(nom, *fichiers)
+    if problemes:
+        raise SchemaInvalide("\n".join(problemes))
+
+    rapport = calcul(nom)
+    en_flux = {i for option, i in rapport.get("flux", {}).items()
+               if options.get(option)}
+    prechargees = [i for i in range(len(fichiers)) if i not in en_flux]
+    precharger([fichiers[i] for i in prechargees],
+               [rapport["lectures"][i] for i in prechargees])
+    return rapport["fonction"](*fichiers, **options)
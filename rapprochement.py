@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import etape, mesurer
+
+
+# Rapprochement approché des lignes de suivi de commandes : les candidats d'une
+# ligne sont les lignes de même référence normalisée (blocs), comparées sur les
+# n-grammes de leur désignation. Les paires candidates sont celles d'un même bloc
+# qui partagent un des n-grammes les plus rares de la désignation (filtrage par
+# préfixe, sans perte au seuil demandé) ; les n-grammes trop fréquents dans le
+# bloc n'en génèrent pas, d'où un coût proche du linéaire même pour un gros bloc.
+
+# Similarité minimale (indice de Jaccard des n-grammes) pour reporter une remarque
+SEUIL_SIMILARITE = 0.6
+
+# Longueur des n-grammes de caractères
+TAILLE_NGRAMME = 3
+
+# Nombre maximal de désignations candidates d'un bloc qui contiennent un
+# n-gramme pour qu'il génère des paires (au-delà, il distingue mal les candidats)
+FREQUENCE_MAX_NGRAMME = 50
+
+# Texte stocké par Arrow : découpage des n-grammes vectorisé
+TYPE_TEXTE = "string[pyarrow]"
+
+
+def ngrammes(textes, n=TAILLE_NGRAMME):
+    """
+    Index des n-grammes : une ligne par texte et n-gramme distinct (les textes
+    sont entourés d'un espace, un texte court donne un seul n-gramme). Les
+    n-grammes sont extraits colonne par colonne (un découpage vectorisé par
+    décalage), sans boucle sur les textes.
+    Args:
+        textes (sequence): Les textes.
+        n (int): La longueur des n-grammes.
+    Returns:
+        pd.DataFrame: Colonnes `position` (du texte) et `ngramme`.
+    """
+    textes = " " + pd.Series(textes, dtype=object).astype(str).astype(TYPE_TEXTE) + " "
+    longueurs = textes.str.len()
+    longueur_max = int(longueurs.max()) if len(longueurs) else n
+    morceaux = []
+    for decalage in range(max(longueur_max - n + 1, 1)):
+        selection = textes[(longueurs >= decalage + n) | (decalage == 0)]
+        morceaux.append(pd.DataFrame({
+            "position": selection.index,
+            "ngramme": selection.str.slice(decalage, decalage + n),
+        }))
+    return pd.concat(morceaux, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def _index_bloc(references, designations):
+    """Index des n-grammes de chaque (référence, désignation), avec sa référence
+    et son nombre de n-grammes distincts."""
+    index = ngrammes(designations)
+    index["reference"] = references.take(index["position"].to_numpy())
+    tailles = index.groupby("position").size().to_numpy()
+    return index, tailles
+
+
+def _prefixe(index, tailles, seuil):
+    """
+    Les n-grammes de chaque désignation qui suffisent à trouver ses candidats :
+    deux ensembles dont l'indice de Jaccard atteint `seuil` ont un n-gramme
+    commun parmi leurs |x| - ⌈seuil·|x|⌉ + 1 premiers, dans un même ordre (ici
+    du plus rare au plus fréquent dans le bloc).
+    Args:
+        index (pd.DataFrame): L'index des n-grammes, avec leur `frequence`.
+        tailles (np.ndarray): Le nombre de n-grammes de chaque désignation.
+        seuil (float): La similarité minimale.
+    Returns:
+        pd.DataFrame: Les lignes de `index` retenues.
+    """
+    index = index.sort_values(["position", "frequence", "ngramme"], kind="stable")
+    rangs = index.groupby("position", sort=False).cumcount().to_numpy()
+    tailles = tailles[index["position"].to_numpy()]
+    # Tolérance : seuil·|x| calculé en flottants (0.6 × 5 = 3.0000000000000004)
+    longueurs = tailles - np.ceil(seuil * tailles - 1e-9) + 1
+    return index[rangs < longueurs]
+
+
+@mesurer
+def apparier(anciens, nouveaux, seuil=SEUIL_SIMILARITE):
+    """
+    Associe chaque ligne de `nouveaux` à la ligne de `anciens` de même référence
+    dont la désignation est la plus proche, si la similarité atteint `seuil`.
+    Les couples (référence, désignation) identiques ne sont évalués qu'une fois.
+    Args:
+        anciens (pd.DataFrame): Les candidats, colonnes `reference` et
+            `designation` normalisées.
+        nouveaux (pd.DataFrame): Les lignes à rapprocher, mêmes colonnes.
+        seuil (float): La similarité minimale, entre 0 et 1.
+    Returns:
+        pd.DataFrame: Pour chaque ligne rapprochée (index de `nouveaux`), la
+        position de son candidat dans `anciens` (`position`) et la similarité.
+    """
+    vide = pd.DataFrame({"position": pd.Series(dtype="int64"),
+                         "similarite": pd.Series(dtype="float64")})
+
+    # Blocs : seules les références présentes des deux côtés ont des candidats
+    colonnes = ["reference", "designation"]
+    nouveaux = nouveaux.loc[nouveaux["reference"].isin(anciens["reference"]),
+                            colonnes].dropna()
+    anciens = anciens[colonnes].reset_index(drop=True)
+    anciens = anciens[anciens["reference"].isin(nouveaux["reference"])].dropna()
+    if nouveaux.empty or anciens.empty:
+        return vide
+
+    with etape("index_ngrammes", len(anciens) + len(nouveaux)):
+        groupes = nouveaux.groupby(colonnes, sort=False).ngroup().to_numpy()
+        uniques = nouveaux.drop_duplicates(colonnes)
+        index_nouveaux, tailles_nouveaux = _index_bloc(
+            uniques["reference"].to_numpy(), uniques["designation"].to_numpy()
+        )
+        index_anciens, tailles_anciens = _index_bloc(
+            anciens["reference"].to_numpy(), anciens["designation"].to_numpy()
+        )
+        # Références et n-grammes remplacés par des codes entiers communs
+        # aux deux index, plus rapides à joindre que des chaînes
+        for colonne in ["reference", "ngramme"]:
+            codes, _ = pd.factorize(pd.concat([index_nouveaux[colonne],
+                                               index_anciens[colonne]]))
+            index_nouveaux[colonne] = codes[:len(index_nouveaux)]
+            index_anciens[colonne] = codes[len(index_nouveaux):]
+
+    with etape("similarites") as mesure:
+        # Paires candidates : un n-gramme commun parmi les plus rares de chaque
+        # désignation, hors n-grammes présents dans trop de désignations du bloc
+        frequences = (index_anciens.groupby(["reference", "ngramme"]).size()
+                      .rename("frequence").reset_index())
+        index_nouveaux = index_nouveaux.merge(frequences, how="left",
+                                              on=["reference", "ngramme"])
+        index_nouveaux["frequence"] = index_nouveaux["frequence"].fillna(0)
+        index_anciens = index_anciens.merge(frequences, on=["reference", "ngramme"])
+        prefixe_anciens = _prefixe(index_anciens, tailles_anciens, seuil)
+        prefixe_anciens = prefixe_anciens[
+            prefixe_anciens["frequence"] <= FREQUENCE_MAX_NGRAMME
+        ]
+        candidats = (_prefixe(index_nouveaux, tailles_nouveaux, seuil)
+                     .merge(prefixe_anciens, on=["reference", "ngramme"],
+                            suffixes=("_nouveau", "_ancien"))
+                     [["position_nouveau", "position_ancien"]]
+                     .drop_duplicates())
+        mesure["paires"] = len(candidats)
+
+        # n-grammes communs de chaque paire candidate, sur les désignations entières
+        communs = (
+            candidats
+            .merge(index_nouveaux[["position", "ngramme"]]
+                   .rename(columns={"position": "position_nouveau"}),
+                   on="position_nouveau")
+            .merge(index_anciens[["position", "ngramme"]]
+                   .rename(columns={"position": "position_ancien"}),
+                   on=["position_ancien", "ngramme"])
+            .groupby(["position_nouveau", "position_ancien"])
+            .size().rename("communs").reset_index()
+        )
+
+        # Indice de Jaccard : n-grammes communs / n-grammes de l'un ou l'autre
+        union = (tailles_nouveaux[communs["position_nouveau"].to_numpy()]
+                 + tailles_anciens[communs["position_ancien"].to_numpy()]
+                 - communs["communs"].to_numpy())
+        communs["similarite"] = communs["communs"].to_numpy() / union
+
+        # Meilleur candidat de chaque désignation (le premier en cas d'égalité)
+        meilleurs = (communs[communs["similarite"] >= seuil]
+                     .sort_values(["similarite", "position_ancien"],
+                                  ascending=[False, True], kind="stable")
+                     .drop_duplicates("position_nouveau")
+                     .set_index("position_nouveau"))
+        if meilleurs.empty:
+            return vide
+
+        retenus = meilleurs.reindex(groupes)
+        trouves = retenus["similarite"].notna().to_numpy()
+        resultat = pd.DataFrame({
+            "position": anciens.index.to_numpy().take(
+                retenus["position_ancien"].to_numpy()[trouves].astype("int64")
+            ),
+            "similarite": retenus["similarite"].to_numpy()[trouves],
+        }, index=nouveaux.index[trouves])
+        mesure["lignes_sortie"] = len(resultat)
+    return resultat
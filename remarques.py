@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from fonctions2 import colonne_remarques, construire_cle, normaliser_texte
+from instrumentation import etape, mesurer
+
+
+# Registre des remarques : les remarques saisies dans les fichiers exportés
+# (bons de livraison, suivi de commandes) sont enregistrées dans une table
+# SQLite, indexée par registre et par clé normalisée. Un nouvel extrait est
+# annoté par une recherche dans ce registre, sans téléverser l'ancien fichier.
+
+DOSSIER_REMARQUES = os.environ.get("AUTOREPORTING_REMARQUES", ".remarques")
+
+# Registres : bons de livraison (clé : N° Pièce normalisé) et suivi de
+# commandes (clé : Référence + Désignation, voir `construire_cle`)
+BLS = "bls"
+SUIVI = "suivi"
+
+# Colonne des remarques de chaque registre
+COLONNES_REMARQUES = {BLS: "REMARQUES", SUIVI: "Remarques"}
+
+
+def _connexion(dossier=DOSSIER_REMARQUES):
+    os.makedirs(dossier, exist_ok=True)
+    connexion = sqlite3.connect(os.path.join(dossier, "remarques.sqlite"),
+                                timeout=30, isolation_level=None)
+    connexion.execute("PRAGMA journal_mode=WAL")
+    connexion.execute("""
+        CREATE TABLE IF NOT EXISTS remarques (
+            registre TEXT NOT NULL,
+            cle TEXT NOT NULL,
+            remarque TEXT NOT NULL,
+            maj REAL NOT NULL,
+            PRIMARY KEY (registre, cle)
+        ) WITHOUT ROWID
+    """)
+    return connexion
+
+
+def cles_bls(bls):
+    """Clé des bons de livraison : le N° Pièce normalisé (voir `nettoyer_num_piece`)."""
+    return normaliser_texte(bls["N° Pièce"], tous_espaces=False)
+
+
+def _remarques_par_cle(cles, remarques, conserver):
+    """
+    Une remarque par clé : la première ou la dernière remarque non vide
+    (`conserver`), ou None si la clé n'en a aucune.
+    """
+    texte = remarques.astype("string").str.strip()
+    df = pd.DataFrame({"cle": cles.to_numpy(),
+                       "remarque": texte.where(texte != "").to_numpy()})
+    df = df[df["cle"].notna()]
+    groupes = df.groupby("cle", sort=False)["remarque"]
+    par_cle = groupes.first() if conserver == "premier" else groupes.last()
+    return par_cle.astype(object).where(par_cle.notna(), None)
+
+
+@mesurer
+def enregistrer(registre, cles, remarques, conserver="dernier",
+                dossier=DOSSIER_REMARQUES):
+    """
+    Enregistre en une transaction les remarques d'un fichier exporté : chaque
+    remarque remplace celle de sa clé, une clé sans remarque (remarque
+    effacée) est retirée du registre.
+    Args:
+        registre (str): `BLS` ou `SUIVI`.
+        cles (pd.Series): Les clés normalisées de chaque ligne.
+        remarques (pd.Series): Les remarques de chaque ligne.
+        conserver (str): "premier" ou "dernier" : remarque retenue pour une clé
+            présente sur plusieurs lignes.
+        dossier (str): Le dossier du registre.
+    Returns:
+        tuple: (nombre de remarques enregistrées, nombre de remarques retirées)
+    """
+    par_cle = _remarques_par_cle(cles, remarques, conserver)
+    a_retirer = par_cle[par_cle.isna()].index
+    a_enregistrer = par_cle.dropna()
+
+    maj = time.time()
+    connexion = _connexion(dossier)
+    try:
+        connexion.execute("BEGIN")
+        connexion.executemany(
+            "INSERT INTO remarques (registre, cle, remarque, maj) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (registre, cle) "
+            "DO UPDATE SET remarque = excluded.remarque, maj = excluded.maj",
+            ((registre, str(cle), str(remarque), maj)
+             for cle, remarque in a_enregistrer.items())
+        )
+        retirees = connexion.executemany(
+            "DELETE FROM remarques WHERE registre = ? AND cle = ?",
+            ((registre, str(cle)) for cle in a_retirer)
+        ).rowcount
+        connexion.execute("COMMIT")
+    except BaseException:
+        connexion.execute("ROLLBACK")
+        raise
+    finally:
+        connexion.close()
+    return len(a_enregistrer), max(retirees, 0)
+
+
+@mesurer
+def rechercher(registre, cles, dossier=DOSSIER_REMARQUES):
+    """
+    Remarque enregistrée de chaque clé : les clés distinctes sont placées
+    dans une table temporaire, jointe au registre par sa clé primaire.
+    Args:
+        registre (str): `BLS` ou `SUIVI`.
+        cles (pd.Series): Les clés normalisées.
+        dossier (str): Le dossier du registre.
+    Returns:
+        pd.Series: La remarque de chaque ligne de `cles` (vide si la clé n'est
+        pas dans le registre).
+    """
+    distinctes = cles.dropna().unique()
+    connexion = _connexion(dossier)
+    try:
+        connexion.execute("CREATE TEMP TABLE recherche (cle TEXT PRIMARY KEY)")
+        connexion.executemany("INSERT OR IGNORE INTO recherche VALUES (?)",
+                              ((str(cle),) for cle in distinctes))
+        trouvees = connexion.execute(
+            "SELECT r.cle, r.remarque FROM recherche AS t "
+            "JOIN remarques AS r ON r.registre = ? AND r.cle = t.cle",
+            (registre,)
+        ).fetchall()
+    finally:
+        connexion.close()
+    correspondance = pd.Series(dict(trouvees), dtype=object)
+    return cles.astype(object).map(correspondance)
+
+
+def nb_remarques(dossier=DOSSIER_REMARQUES):
+    """
+    Returns:
+        dict: Le nombre de remarques enregistrées dans chaque registre.
+    """
+    connexion = _connexion(dossier)
+    try:
+        lignes = connexion.execute(
+            "SELECT registre, COUNT(*) FROM remarques GROUP BY registre"
+        ).fetchall()
+    finally:
+        connexion.close()
+    return {registre: lignes_registre for registre, lignes_registre in lignes}
+
+
+def enregistrer_bls(bls, dossier=DOSSIER_REMARQUES):
+    """
+    Enregistre les remarques d'un fichier de bons de livraison exporté : la
+    colonne `REMARQUES` (voir `colonne_remarques`), obligatoire : un fichier
+    sans remarques est refusé (ValueError). Un BL de plusieurs lignes garde
+    sa première remarque non vide.
+    """
+    bls.columns = bls.columns.str.strip()
+    colonne = colonne_remarques(bls.columns, COLONNES_REMARQUES[BLS])
+    return enregistrer(BLS, cles_bls(bls), bls[colonne], conserver="premier",
+                       dossier=dossier)
+
+
+def enregistrer_suivi(suivi, dossier=DOSSIER_REMARQUES):
+    """
+    Enregistre les remarques d'un fichier de suivi de commandes exporté (la
+    dernière occurrence d'une clé l'emporte, comme dans `reporter_remarques`).
+    La colonne `Remarques` est obligatoire.
+    """
+    suivi.columns = suivi.columns.str.strip()
+    colonne = colonne_remarques(suivi.columns, COLONNES_REMARQUES[SUIVI])
+    return enregistrer(SUIVI, construire_cle(suivi), suivi[colonne], dossier=dossier)
+
+
+@mesurer
+def annoter_bls(bls_t, dossier=DOSSIER_REMARQUES):
+    """
+    Ajoute aux nouveaux bons de livraison la colonne `REMARQUES` du registre
+    (même format que `fusionner_bls`).
+    """
+    bls_t.columns = bls_t.columns.str.strip()
+    bls_t["N° Pièce"] = cles_bls(bls_t)
+    with etape("recherche_remarques", len(bls_t)):
+        bls_t[COLONNES_REMARQUES[BLS]] = rechercher(BLS, bls_t["N° Pièce"], dossier)
+    return bls_t.drop(columns=["Prix Revient Total"], errors="ignore")
+
+
+@mesurer
+def annoter_suivi(suivi, dossier=DOSSIER_REMARQUES):
+    """
+    Ajoute au nouveau suivi de commandes la colonne `Remarques` du registre
+    (même format que `reporter_remarques`).
+    """
+    suivi.columns = suivi.columns.str.strip()
+    with etape("recherche_remarques", len(suivi)):
+        suivi[COLONNES_REMARQUES[SUIVI]] = rechercher(SUIVI, construire_cle(suivi),
+                                                      dossier)
+    return suivi
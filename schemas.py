@@ -0,0 +1,164 @@
+import difflib
+import re
+import unicodedata
+
+
+# Contrôle préalable des fichiers d'entrée : chaque emplacement d'un rapport a
+# un schéma (colonnes obligatoires, types attendus, feuille et ligne d'en-tête
+# de sa lecture), vérifié sur la seule ligne d'en-tête et quelques lignes de
+# données avant la lecture complète du fichier.
+
+# Noms de colonnes connus. Un en-tête qui ne diffère d'un de ces noms que par
+# la casse, les accents ou les espaces (ou qui est un de ses alias) est
+# renommé à la lecture.
+NOMS_CANONIQUES = [
+    "Référence Article", "Désignation Article", "Code - Intitulé Famille",
+    "Qté Stock Réel", "Qté Vendues", "Chiffre d'affaires HT", "Quantité", "Date",
+    "N° Pièce", "N° Compte Client", "Prix Revient Total", "Référence", "Désignation",
+]
+
+ALIAS = {
+    "Qté Stock Réel": ["Quantité Stock Réel", "Qté Réelle"],
+    "Qté Vendues": ["Qté Vendue", "Quantité Vendue", "Quantités Vendues"],
+    "Chiffre d'affaires HT": ["CA HT", "Chiffre d'affaire HT"],
+    "Code - Intitulé Famille": ["Code-Intitulé Famille", "Code - Intitulé de Famille"],
+    "N° Pièce": ["No Pièce", "N° de Pièce", "Numéro de Pièce"],
+}
+
+# Autres noms acceptés pour la colonne des remarques d'un fichier exporté
+# (comparés sans casse, accents ni espaces superflus, voir `cle_nom`)
+ALIAS_REMARQUES = ["Remarque", "Commentaires", "Commentaire"]
+
+# Nombre de lignes de données examinées pour contrôler les types
+NB_LIGNES_EXEMPLE = 20
+
+# Nombre de colonnes proches citées pour une colonne manquante
+NB_SUGGESTIONS = 3
+
+# Nombre en cellule texte (format français ou non, négatif entre parenthèses)
+_NOMBRE = re.compile(r"^\(?[-+]?[\d\s\xa0 .,]*\d[\d\s\xa0 .,]*\)?$")
+
+
+class SchemaInvalide(ValueError):
+    """Fichier d'entrée refusé par le contrôle préalable."""
+
+
+def cle_nom(nom):
+    """Forme comparable d'un nom de colonne : sans accents, casse ni espaces
+    superflus."""
+    texte = unicodedata.normalize("NFKD", str(nom))
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return " ".join(texte.split()).casefold()
+
+
+_CANONIQUES = {cle_nom(nom): nom for nom in NOMS_CANONIQUES}
+_CANONIQUES.update({cle_nom(alias): nom for nom, alias_nom in ALIAS.items()
+                    for alias in alias_nom})
+
+
+def nom_canonique(nom):
+    """
+    Nom d'une colonne lue : le nom connu qui lui correspond (voir
+    `NOMS_CANONIQUES` et `ALIAS`), sinon le nom sans espaces de bord.
+    """
+    nom = str(nom).strip()
+    return _CANONIQUES.get(cle_nom(nom), nom)
+
+
+def noms_canoniques(entetes):
+    """
+    Noms des colonnes d'une ligne d'en-tête (voir `nom_canonique`). Un nom
+    déjà présent tel quel, ou déjà donné à une colonne précédente, n'est pas
+    donné une seconde fois : la colonne garde son nom d'origine.
+    Args:
+        entetes (list): Les noms lus sur la ligne d'en-tête.
+    Returns:
+        list: Les noms des colonnes.
+    """
+    bruts = [str(e).strip() for e in entetes]
+    pris = set(bruts)
+    noms = []
+    for brut in bruts:
+        nom = nom_canonique(brut)
+        if nom != brut and nom not in pris:
+            pris.add(nom)
+            noms.append(nom)
+        else:
+            noms.append(brut)
+    return noms
+
+
+def _est_nombre(valeur):
+    if isinstance(valeur, bool):
+        return False
+    if isinstance(valeur, (int, float)):
+        return True
+    return bool(_NOMBRE.match(str(valeur).strip()))
+
+
+def _est_date(valeur):
+    if hasattr(valeur, "year"):
+        return True
+    return bool(re.match(r"^\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}", str(valeur).strip()))
+
+
+# Contrôle de chaque type : (fonction, description pour les messages)
+TYPES = {
+    "nombre": (_est_nombre, "des nombres"),
+    "date": (_est_date, "des dates"),
+}
+
+
+def _manquante(nom, entetes):
+    message = f"'{nom}'"
+    proches = difflib.get_close_matches(
+        cle_nom(nom), [cle_nom(e) for e in entetes], n=NB_SUGGESTIONS, cutoff=0.6
+    )
+    if proches:
+        correspondance = {cle_nom(e): e for e in entetes}
+        message += (" (colonne proche : "
+                    + ", ".join(f"'{correspondance[p]}'" for p in proches) + ")")
+    return message
+
+
+def controler(entetes, lignes, schema):
+    """
+    Contrôle une ligne d'en-tête et des lignes d'exemple selon un schéma.
+    Args:
+        entetes (list): Les noms de colonnes lus (avant renommage).
+        lignes (list): Les premières lignes de données (listes de valeurs).
+        schema (dict): Le schéma de l'emplacement (voir `rapports.RAPPORTS`) :
+            "obligatoires" (colonnes), "types" (colonne -> clé de `TYPES`) et
+            "alias" (colonne -> autres noms acceptés, casse comprise).
+    Returns:
+        list: Les problèmes trouvés (vide si le fichier est conforme).
+    """
+    noms = noms_canoniques(entetes)
+    cles_noms = {cle_nom(nom) for nom in noms}
+    problemes = []
+
+    def presente(colonne):
+        return colonne in noms or any(
+            cle_nom(nom) in cles_noms
+            for nom in [colonne] + schema.get("alias", {}).get(colonne, [])
+        )
+
+    manquantes = [c for c in schema.get("obligatoires", []) if not presente(c)]
+    if manquantes:
+        problemes.append(
+            "colonne(s) manquante(s) : "
+            + ", ".join(_manquante(c, [str(e) for e in entetes if str(e).strip()])
+                        for c in manquantes)
+        )
+
+    for colonne, type_attendu in schema.get("types", {}).items():
+        if colonne not in noms:
+            continue
+        position = noms.index(colonne)
+        valeurs = [ligne[position] for ligne in lignes
+                   if position < len(ligne) and str(ligne[position]).strip() != ""]
+        est_valide, description = TYPES[type_attendu]
+        if valeurs and not any(est_valide(v) for v in valeurs):
+            problemes.append(f"la colonne '{colonne}' devrait contenir "
+                             f"{description} (valeur lue : '{valeurs[0]}')")
+    return problemes
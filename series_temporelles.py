@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+from agregats import COLONNE_DATE, mois_de
+from fonctions2 import reference_texte
+from instrumentation import etape, mesurer
+
+
+# Séries mensuelles du taux de rotation. Les lignes datées (mouvements, ou
+# ventes) sont agrégées en un seul groupby par article et par mois, puis mises
+# sous forme de tableaux article x mois : sorties, sorties cumulées, stock de
+# début, de fin et moyen. Une période quelconque se calcule ensuite à partir de
+# ces tableaux, sans revenir aux lignes.
+
+COLONNE_FAMILLE = "Code - Intitulé Famille"
+SANS_FAMILLE = "(Sans famille)"
+ENSEMBLE = "(Ensemble)"
+
+
+def _mois_complets(mois):
+    """Tous les mois de la plage couverte par `mois` ("AAAA-MM"), dans l'ordre."""
+    if len(mois) == 0:
+        return pd.Index([], dtype=object)
+    plage = pd.period_range(min(mois), max(mois), freq="M")
+    return pd.Index(plage.strftime("%Y-%m"))
+
+
+@mesurer
+def series_rotation(stocks, lignes, colonne_quantite="Quantité", ventes=False):
+    """
+    Calcule, pour chaque article et chaque mois, les sorties, les sorties
+    cumulées et le stock moyen, en une passe sur les lignes datées.
+
+    Le stock de fin de mois est reconstitué à rebours à partir de l'état de
+    stock (supposé être celui de la fin du dernier mois) et des mouvements
+    nets des mois suivants. Avec des ventes (`ventes=True`), les entrées ne
+    sont pas connues : le stock est supposé constant sur la période.
+
+    Args:
+        stocks (pd.DataFrame): Données de stock (état à la fin de la période).
+        lignes (pd.DataFrame): Mouvements (quantités signées, sorties
+            négatives) ou ventes (quantités vendues positives), datés.
+        colonne_quantite (str): La colonne des quantités.
+        ventes (bool): `lignes` sont des ventes.
+
+    Returns:
+        dict: "sorties", "stock_debut", "stock_fin", "stock_moyen" (tableaux
+        article x mois, index Référence Article) et "articles" (Désignation
+        Article et famille de chaque article).
+    """
+    if COLONNE_DATE not in lignes.columns:
+        raise ValueError(f"La colonne '{COLONNE_DATE}' est nécessaire pour "
+                         "calculer l'évolution mensuelle")
+
+    with etape("agregation_mensuelle", len(lignes)):
+        quantites = lignes[colonne_quantite]
+        sorties = quantites.clip(lower=0) if ventes else -quantites.clip(upper=0)
+        refs_lignes = reference_texte(lignes["Référence Article"])
+        mensuel = (
+            pd.DataFrame({
+                "Référence Article": refs_lignes,
+                "Mois": mois_de(lignes[COLONNE_DATE]),
+                "net": -quantites if ventes else quantites,
+                "sorties": sorties,
+            })
+            .groupby(["Référence Article", "Mois"], sort=False)
+            .sum()
+        )
+
+    references = reference_texte(stocks["Référence Article"])
+    stock_final = (pd.Series(stocks["Qté Stock Réel"].to_numpy(), index=references)
+                   .groupby(level=0).sum())
+    articles = stock_final.index.union(mensuel.index.get_level_values(0).unique())
+    mois = _mois_complets(mensuel.index.get_level_values(1).unique())
+
+    def tableau(colonne):
+        return (mensuel[colonne].unstack(fill_value=0)
+                .reindex(index=articles, columns=mois, fill_value=0))
+
+    sorties = tableau("sorties")
+    final = stock_final.reindex(articles).to_numpy()[:, None]
+    if ventes:
+        stock_fin = pd.DataFrame(np.repeat(final, len(mois), axis=1),
+                                 index=articles, columns=mois)
+        stock_debut = stock_fin
+    else:
+        # Fin du mois m = stock final - mouvements nets des mois suivants
+        net = tableau("net")
+        apres = net.to_numpy().sum(axis=1)[:, None] - net.to_numpy().cumsum(axis=1)
+        stock_fin = pd.DataFrame(final - apres, index=articles, columns=mois)
+        stock_debut = stock_fin - net
+
+    # Libellés : ceux de l'état de stock, sinon ceux des lignes
+    libelles = pd.DataFrame(index=articles)
+    for colonne in ["Désignation Article", COLONNE_FAMILLE]:
+        candidats = [
+            pd.Series(source[colonne].astype(object).to_numpy(), index=refs)
+            .dropna().groupby(level=0).first()
+            for source, refs in [(stocks, references),
+                                 (lignes, refs_lignes)]
+            if colonne in source.columns
+        ]
+        libelles[colonne] = (pd.concat(candidats).groupby(level=0).first()
+                             .reindex(articles) if candidats else np.nan)
+
+    for df in (sorties, stock_debut, stock_fin):
+        df.index.name = "Référence Article"
+    return {
+        "sorties": sorties,
+        "stock_debut": stock_debut,
+        "stock_fin": stock_fin,
+        "stock_moyen": (stock_debut + stock_fin) / 2,
+        "articles": libelles,
+    }
+
+
+def _taux(sorties, stock_moyen):
+    taux = sorties / stock_moyen
+    return taux.replace([np.inf, -np.inf], np.nan)
+
+
+def evolution(series, debut=None, fin=None, par="article"):
+    """
+    Évolution mensuelle sur une période, par article, par famille ou pour
+    l'ensemble : sorties du mois, sorties cumulées depuis le début de la
+    période, stock moyen et taux de rotation du mois.
+    Args:
+        series (dict): Le résultat de `series_rotation`.
+        debut (str, optional): Le premier mois ("AAAA-MM").
+        fin (str, optional): Le dernier mois ("AAAA-MM").
+        par (str): "article", "famille" ou "ensemble".
+    Returns:
+        pd.DataFrame: Une ligne par groupe et par mois.
+    """
+    sorties = series["sorties"].loc[:, debut:fin]
+    stock_moyen = series["stock_moyen"].loc[:, debut:fin]
+    # Taux d'un groupe : sorties des articles au stock connu / stock total
+    ponderees = sorties.where(stock_moyen.notna(), 0)
+    if par in ("famille", "ensemble"):
+        if par == "famille":
+            groupes = (series["articles"][COLONNE_FAMILLE].astype(object)
+                       .fillna(SANS_FAMILLE).rename("Famille"))
+        else:
+            groupes = pd.Series(ENSEMBLE, index=sorties.index, name="Ensemble")
+        sorties = sorties.groupby(groupes).sum()
+        ponderees = ponderees.groupby(groupes).sum()
+        stock_moyen = stock_moyen.groupby(groupes).sum(min_count=1)
+
+    resultat = pd.DataFrame({
+        "Qté Sortie": sorties.stack(future_stack=True),
+        "Qté Sortie cumulée": sorties.cumsum(axis=1).stack(future_stack=True),
+        "Stock moyen": stock_moyen.stack(future_stack=True),
+        "Taux de rotation": _taux(ponderees, stock_moyen).stack(future_stack=True),
+    })
+    resultat.index.names = [sorties.index.name, "Mois"]
+    return resultat.reset_index()
+
+
+def rotation_periode(series, debut=None, fin=None):
+    """
+    Taux de rotation par article sur une période, à partir des séries :
+    sorties de la période rapportées au stock moyen de la période.
+    Args:
+        series (dict): Le résultat de `series_rotation`.
+        debut (str, optional): Le premier mois ("AAAA-MM").
+        fin (str, optional): Le dernier mois ("AAAA-MM").
+    Returns:
+        pd.DataFrame: Référence Article, libellés, Qté Sortie, Stock moyen et
+        Taux de rotation.
+    """
+    sorties = series["sorties"].loc[:, debut:fin].sum(axis=1)
+    stock_moyen = series["stock_moyen"].loc[:, debut:fin].mean(axis=1)
+    resultat = series["articles"].assign(**{
+        "Qté Sortie": sorties,
+        "Stock moyen": stock_moyen,
+        "Taux de rotation": _taux(sorties, stock_moyen),
+    })
+    resultat.index.name = "Référence Article"
+    return resultat.reset_index()
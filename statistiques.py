@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import mesurer
+
+
+# Classes ABC : part cumulée des sorties (articles triés par sorties
+# décroissantes) atteinte avant l'article
+SEUILS_ABC = {"A": 0.80, "B": 0.95}
+
+# Classes XYZ : coefficient de variation des sorties mensuelles
+SEUILS_XYZ = {"X": 0.5, "Y": 1.0}
+
+# Centiles du taux de rotation calculés à chaque niveau
+CENTILES = [0.25, 0.75, 0.90]
+
+# Niveaux d'agrégation, du plus fin au plus large (chaque niveau regroupe
+# les articles selon les colonnes qui le précèdent)
+HIERARCHIE = ["Code - Intitulé Famille"]
+
+# Libellés des colonnes de la hiérarchie dans le résultat
+LIBELLES = {"Code - Intitulé Famille": "Famille"}
+
+SANS_FAMILLE = "(Sans famille)"
+ENSEMBLE = "(Ensemble)"
+
+
+def classes_abc(sorties, seuils=SEUILS_ABC):
+    """
+    Classe les articles selon leur part des sorties : les articles qui font
+    ensemble les premiers 80 % des sorties sont en A, les 15 % suivants en B,
+    les autres (et ceux sans sortie) en C.
+    Args:
+        sorties (pd.Series): Les quantités sorties par article.
+        seuils (dict): Part cumulée maximale atteinte avant un article de
+            chaque classe.
+    Returns:
+        pd.Series: La classe de chaque article ("A", "B" ou "C").
+    """
+    valeurs = sorties.fillna(0).clip(lower=0)
+    total = valeurs.sum()
+    ordre = valeurs.sort_values(ascending=False, kind="stable")
+    if total > 0:
+        part_avant = (ordre.cumsum() - ordre) / total
+    else:
+        part_avant = pd.Series(1.0, index=ordre.index)
+
+    classes = np.select(
+        [(part_avant < seuils["A"]) & (ordre > 0),
+         (part_avant < seuils["B"]) & (ordre > 0)],
+        ["A", "B"], default="C"
+    )
+    return pd.Series(classes, index=ordre.index).reindex(sorties.index)
+
+
+def classes_xyz(sorties_mensuelles, seuils=SEUILS_XYZ):
+    """
+    Classe les articles selon la régularité de leurs sorties mensuelles
+    (coefficient de variation sur tous les mois présents, les mois sans
+    sortie comptant pour zéro) : X régulier, Y variable, Z irrégulier.
+    Args:
+        sorties_mensuelles (pd.DataFrame): Référence Article, Mois et Qté Sortie
+            (voir `agregats.sorties_mensuelles`).
+        seuils (dict): Coefficient de variation maximal de chaque classe.
+    Returns:
+        pd.Series: La classe de chaque article ayant des sorties, indexée par
+        Référence Article.
+    """
+    nb_mois = sorties_mensuelles["Mois"].nunique()
+    qte = sorties_mensuelles["Qté Sortie"]
+    sommes = (
+        sorties_mensuelles.assign(carres=qte * qte)
+        .groupby("Référence Article", observed=True)[["Qté Sortie", "carres"]]
+        .sum()
+    )
+    # Moments calculés sans tableau article x mois : les mois sans sortie
+    # n'ajoutent rien aux sommes
+    moyenne = sommes["Qté Sortie"] / nb_mois
+    variance = (sommes["carres"] / nb_mois - moyenne ** 2).clip(lower=0)
+    cv = np.sqrt(variance) / moyenne.where(moyenne > 0)
+
+    classes = np.select([cv <= seuils["X"], cv <= seuils["Y"]], ["X", "Y"],
+                        default="Z")
+    return pd.Series(classes, index=sommes.index).where(cv.notna())
+
+
+@mesurer
+def classer_articles(df_article, sorties_mensuelles=None):
+    """
+    Ajoute les classes ABC (et XYZ si les sorties mensuelles sont connues) au
+    résultat de `preparer_donnees2`.
+    Args:
+        df_article (pd.DataFrame): Le taux de rotation par article.
+        sorties_mensuelles (pd.DataFrame, optional): Les sorties par article et
+            par mois.
+    Returns:
+        pd.DataFrame: `df_article` avec les colonnes Classe ABC (et Classe XYZ).
+    """
+    df_article["Classe ABC"] = classes_abc(df_article["Qté Sortie"])
+    if sorties_mensuelles is not None:
+        xyz = classes_xyz(sorties_mensuelles)
+        df_article["Classe XYZ"] = df_article["Référence Article"].map(xyz)
+    return df_article
+
+
+def _empiler_niveaux(df, hierarchie):
+    """
+    Répète les articles une fois par niveau : au niveau k, les colonnes de
+    la hiérarchie au-delà de k valent `ENSEMBLE`. Un seul groupby sur le
+    résultat calcule alors tous les niveaux.
+    """
+    cles = df[hierarchie].astype(object).fillna(SANS_FAMILLE)
+    niveaux = []
+    for k in range(len(hierarchie), -1, -1):
+        niveau = cles.copy()
+        niveau[hierarchie[k:]] = ENSEMBLE
+        niveau["Niveau"] = (LIBELLES.get(hierarchie[k - 1], hierarchie[k - 1])
+                            if k else ENSEMBLE)
+        niveaux.append(pd.concat([niveau, df.drop(columns=hierarchie)], axis=1))
+    return pd.concat(niveaux, ignore_index=True)
+
+
+@mesurer
+def statistiques_rotation(df_article, hierarchie=HIERARCHIE, centiles=CENTILES):
+    """
+    Statistiques du taux de rotation par famille et pour l'ensemble des
+    articles, en un seul groupby sur les articles :
+    - taux pondéré (sorties totales / stock total, articles au stock connu)
+    - moyenne, médiane et centiles du taux par article
+    - nombre d'articles de chaque classe ABC (et XYZ)
+    Chaque niveau se calcule à partir des articles, jamais des mouvements.
+
+    Args:
+        df_article (pd.DataFrame): Le résultat de `preparer_donnees2`, classé
+            par `classer_articles`.
+        hierarchie (list): Les colonnes de regroupement, de la plus fine à la
+            plus large.
+        centiles (list): Les centiles du taux de rotation.
+
+    Returns:
+        pd.DataFrame: Une ligne par groupe et par niveau (Niveau, colonnes de
+        `hierarchie`, Nb articles, quantités, taux et effectifs par classe).
+    """
+    colonnes = ["Référence Article", "Qté Stock Réel", "Qté Sortie",
+                "Taux de rotation"]
+    df = df_article[hierarchie + colonnes].copy()
+
+    # Le taux pondéré ne retient que les sorties des articles au stock connu
+    df["Qté Sortie pondérée"] = df["Qté Sortie"].where(df["Qté Stock Réel"].notna())
+    agregations = {
+        "Nb articles": ("Référence Article", "size"),
+        "Qté Stock Réel": ("Qté Stock Réel", "sum"),
+        "Qté Sortie": ("Qté Sortie", "sum"),
+        "Qté Sortie pondérée": ("Qté Sortie pondérée", "sum"),
+        "Taux rotation moyen": ("Taux de rotation", "mean"),
+        "Taux rotation médian": ("Taux de rotation", "median"),
+    }
+    for colonne_classe in ["Classe ABC", "Classe XYZ"]:
+        if colonne_classe in df_article.columns:
+            for classe in sorted(df_article[colonne_classe].dropna().unique()):
+                nom = f"Nb articles {classe}"
+                df[nom] = (df_article[colonne_classe] == classe).astype("int64")
+                agregations[nom] = (nom, "sum")
+
+    empile = _empiler_niveaux(df, hierarchie)
+    groupes = empile.groupby(["Niveau"] + hierarchie, sort=False)
+    resultat = groupes.agg(**agregations)
+
+    taux = groupes["Taux de rotation"].quantile(centiles).unstack()
+    taux.columns = [f"Taux rotation P{round(c * 100)}" for c in taux.columns]
+    position = resultat.columns.get_loc("Taux rotation médian") + 1
+    for i, colonne in enumerate(taux.columns):
+        resultat.insert(position + i, colonne, taux[colonne])
+
+    resultat.insert(3, "Taux rotation pondéré",
+                    resultat.pop("Qté Sortie pondérée")
+                    / resultat["Qté Stock Réel"].where(resultat["Qté Stock Réel"] > 0))
+    resultat = resultat.reset_index()
+
+    # Familles par ordre alphabétique, puis l'ensemble
+    resultat["_ensemble"] = resultat["Niveau"] == ENSEMBLE
+    resultat = (resultat.sort_values(["_ensemble"] + hierarchie, kind="stable")
+                .drop(columns="_ensemble").reset_index(drop=True))
+    return resultat.rename(columns=LIBELLES)
@@ -0,0 +1,50 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+from agregats import (
+    MoisDejaEnregistres, ajouter_mouvements, ajouter_stock, mois_disponibles
+)
+
+
+STOCKS = pd.DataFrame({
+    "Référence Article": ["A"], "Désignation Article": ["Vis"],
+    "Code - Intitulé Famille": ["F1"], "Qté Stock Réel": [10],
+})
+
+
+def mouvements(*mois):
+    return pd.DataFrame({
+        "Référence Article": ["A"] * len(mois),
+        "Désignation Article": ["Vis"] * len(mois),
+        "Code - Intitulé Famille": ["F1"] * len(mois),
+        "Quantité": [-1] * len(mois),
+        "Date": pd.to_datetime([f"{m}-15" for m in mois]),
+    })
+
+
+def test_conflit_sur_le_stock_rien_n_est_ecrit(tmp_path):
+    ajouter_stock(STOCKS, "2025-02", dossier=tmp_path)
+
+    with pytest.raises(MoisDejaEnregistres) as erreur:
+        ajouter_mouvements(mouvements("2025-01", "2025-02"), dossier=tmp_path,
+                           stocks=STOCKS)
+    assert erreur.value.mois == ["2025-02"]
+    assert mois_disponibles(tmp_path) == ([], ["2025-02"])
+
+    assert ajouter_mouvements(mouvements("2025-01", "2025-02"), dossier=tmp_path,
+                              stocks=STOCKS, remplacer=True) == ["2025-01", "2025-02"]
+    assert mois_disponibles(tmp_path) == (["2025-01", "2025-02"], ["2025-02"])
+
+
+def _ajouter(dossier, mois):
+    return ajouter_mouvements(mouvements(mois), dossier=dossier, stocks=STOCKS)
+
+
+def test_ajouts_simultanes(tmp_path):
+    tous = [f"2024-{m:02d}" for m in range(1, 13)]
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(_ajouter, [tmp_path] * len(tous), tous))
+    assert mois_disponibles(tmp_path) == (tous, tous)
@@ -0,0 +1,26 @@
+from espace_disque import ecrire_mouvements, sorties_depuis_espace
+
+
+def test_sorties_mensuelles_creuses(tmp_path):
+    fichier = tmp_path / "mouvements.csv"
+    fichier.write_text(
+        "Date;Référence Article;Désignation Article;Quantité\n"
+        "2025-01-10;A;Vis;-2\n"
+        "2025-01-20;A;Vis;-1\n"
+        "2025-03-05;B;Ecrou;-4\n"
+        "1900-01-01;B;Ecrou;-5\n"
+        "2025-03-06;A;Vis;6\n",
+        encoding="utf-8"
+    )
+    espace = ecrire_mouvements(str(fichier), str(tmp_path), taille_bloc=2)
+    assert espace["dates_hors_plage"] == {"nombre": 1, "exemples": ["1900-01-01"]}
+
+    somme_neg, mensuelles = sorties_depuis_espace(espace, taille_tranche=2)
+    assert somme_neg["Qté Sortie"].tolist() == [3, 9]
+    # Une ligne par (article, mois) ayant des sorties ; la date hors plage
+    # compte dans le total de B, pas dans ses mois
+    assert mensuelles.to_dict("list") == {
+        "Référence Article": ["A", "B"],
+        "Mois": ["2025-01", "2025-03"],
+        "Qté Sortie": [3, 4],
+    }
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from extraits import normaliser_extrait
+
+
+def brut():
+    return pd.DataFrame({
+        " N° Pièce ": [" bl1", "BL2"],
+        "Quantité": ["1 200,5", "3"],
+        "Désignation Article": ["vis ", 4],
+    })
+
+
+def test_extrait_normalise():
+    df = normaliser_extrait(brut())
+    assert df["N° Pièce"].tolist() == ["BL1", "BL2"]
+    assert df["Quantité"].tolist() == [1200.5, 3.0]
+    assert df["Désignation Article"].tolist() == ["vis ", "4"]
+
+
+def test_colonnes_gardees_telles_que_lues():
+    df = normaliser_extrait(brut(), normalisees=["Quantité"])
+    assert list(df.columns) == ["N° Pièce", "Quantité", "Désignation Article"]
+    assert df["N° Pièce"].tolist() == [" bl1", "BL2"]
+    assert df["Quantité"].tolist() == [1200.5, 3.0]
+    assert df["Désignation Article"].tolist() == ["vis ", 4]
+
+    assert normaliser_extrait(brut(), normalisees=[])["Quantité"].tolist() == [
+        "1 200,5", "3"
+    ]
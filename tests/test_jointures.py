@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+import jointures
+from jointures import joindre_gauche
+
+
+GAUCHE = pd.DataFrame({"cle": ["A", "B", "C"]})
+DROITE = pd.DataFrame({"cle": ["A", "A", "B"], "qte": [1, 2, 5]})
+
+
+def test_une_ligne_par_ligne_de_gauche():
+    resultat = joindre_gauche(GAUCHE, DROITE, "cle")
+    assert resultat["qte"].tolist()[:2] == [3, 5]
+    assert pd.isna(resultat["qte"].iloc[2])
+    assert resultat.attrs["jointure"]["cles_en_double"] == 1
+    assert resultat.attrs["jointure"]["sans_correspondance"] == 1
+
+    with pytest.raises(ValueError, match="en double"):
+        joindre_gauche(GAUCHE, DROITE, "cle", politique="erreur")
+
+
+def test_table_indexee_reutilisee(monkeypatch):
+    appels = []
+    indexer = jointures.indexer
+
+    def indexer_compte(*args):
+        appels.append(args)
+        return indexer(*args)
+
+    monkeypatch.setattr(jointures, "indexer", indexer_compte)
+
+    for gauche in (GAUCHE, GAUCHE.iloc[::-1]):
+        resultat = joindre_gauche(gauche, DROITE, "cle", politique="dernier",
+                                  cle_cache=("test_table_indexee",))
+    assert resultat["qte"].tolist()[1:] == [5, 2]
+    assert len(appels) == 1
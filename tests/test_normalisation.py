@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from fonctions2 import (
+    TYPE_TEXTE, construire_cle, normaliser_designation, normaliser_texte
+)
+
+
+VALEURS = [" a b ", "a\xa0b", "a\u202fb", "a\tb\u3000", "bl\xa01 ", None, "x  y"]
+
+
+@pytest.mark.parametrize("tous_espaces", [True, False])
+def test_memes_cles_arrow_et_objet(tous_espaces):
+    objet = normaliser_texte(pd.Series(VALEURS, dtype=object), tous_espaces)
+    arrow = normaliser_texte(pd.Series(VALEURS, dtype=TYPE_TEXTE), tous_espaces)
+
+    assert objet.isna().tolist() == arrow.isna().tolist()
+    assert objet.dropna().tolist() == arrow.dropna().tolist()
+
+
+def test_espaces_retires():
+    serie = pd.Series(VALEURS, dtype=object)
+    assert normaliser_texte(serie).tolist()[:5] == ["AB"] * 4 + ["BL1"]
+    assert normaliser_texte(serie, tous_espaces=False).tolist()[:5] == [
+        "A B", "AB", "AB", "A\tB", "BL1"
+    ]
+    designations = normaliser_designation(pd.Series(VALEURS, dtype=TYPE_TEXTE))
+    assert designations.tolist()[6] == "X Y"
+
+
+def test_cle_valeur_manquante():
+    df = pd.DataFrame({"Référence": ["r1", None], "Désignation": [None, "vis"]})
+    assert construire_cle(df).tolist() == ["R1__", "__VIS"]
+    arrow = df.astype(TYPE_TEXTE)
+    assert construire_cle(arrow).tolist() == ["R1__", "__VIS"]
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from instrumentation import collecter
+from rapprochement import apparier
+
+
+def lignes(references, designations, index=None):
+    return pd.DataFrame({"reference": references, "designation": designations},
+                        index=index)
+
+
+def test_seuil():
+    anciens = lignes(["A"], ["POMPE GASOIL 230V"])
+    nouveaux = lignes(["A"], ["POMPE GASOIL 230 V"], index=[7])
+
+    similarite = apparier(anciens, nouveaux, seuil=0)["similarite"].iloc[0]
+    assert 0 < similarite < 1
+    assert apparier(anciens, nouveaux, seuil=similarite).index.tolist() == [7]
+    assert apparier(anciens, nouveaux, seuil=similarite + 0.01).empty
+
+
+def test_meme_reference_uniquement():
+    anciens = lignes(["A", "B"], ["POMPE A MAIN", "POMPE A MAIN"])
+    nouveaux = lignes(["B", "C"], ["POMPE A MAIN", "POMPE A MAIN"])
+
+    resultat = apparier(anciens, nouveaux)
+    assert resultat["position"].to_dict() == {0: 1}
+    assert resultat["similarite"].tolist() == [1.0]
+
+
+def test_egalite_premier_candidat():
+    anciens = lignes(["A", "A", "A"], ["FLEXIBLE 2M", "JOINT", "FLEXIBLE 2M"],
+                     index=[30, 10, 20])
+    nouveaux = lignes(["A", "A"], ["FLEXIBLE 2M", "FLEXIBLE 2M"], index=[5, 6])
+
+    # Positions dans `anciens`, pas son index ; chaque ligne est rapprochée
+    assert apparier(anciens, nouveaux)["position"].to_dict() == {5: 0, 6: 0}
+
+
+def test_references_manquantes():
+    anciens = lignes([None, "A"], ["JOINT TORIQUE", "JOINT TORIQUE"])
+    nouveaux = lignes([None, "A", pd.NA], ["JOINT TORIQUE", "JOINT TORIQUE", None])
+
+    assert apparier(anciens, nouveaux)["position"].to_dict() == {1: 1}
+    assert apparier(anciens.iloc[:1], nouveaux).empty
+
+
+def test_gros_bloc():
+    # Une seule référence : les n-grammes communs à tout le bloc ne génèrent pas
+    # de paires, qui restent proportionnelles au nombre de désignations
+    taille = 5000
+    anciens = lignes(["A"] * taille, [f"POMPE {i:05d} {i * 7919 % 10007}"
+                                      for i in range(taille)])
+    nouveaux = lignes(["A"] * taille, [f"POMPE {i:05d} {i * 7919 % 10007} V2"
+                                       for i in range(taille)])
+
+    with collecter() as mesures:
+        resultat = apparier(anciens, nouveaux)
+    assert resultat["position"].tolist() == list(range(taille))
+    paires = next(m["paires"] for m in mesures if m["etape"] == "similarites")
+    assert paires < 100 * taille
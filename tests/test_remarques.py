@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from remarques import BLS, SUIVI, enregistrer, enregistrer_bls, rechercher
+
+
+def test_aller_retour(tmp_path):
+    cles = pd.Series(["BL1", "BL2", "BL2", "BL3"])
+    remarques = pd.Series(["livré", "partiel", "  complet ", None])
+
+    assert enregistrer(BLS, cles, remarques, dossier=tmp_path) == (2, 0)
+    trouvees = rechercher(BLS, pd.Series(["BL2", "BL1", "BL3", "BL4", None]),
+                          dossier=tmp_path)
+    assert trouvees.tolist()[:2] == ["complet", "livré"]
+    assert trouvees.iloc[2:].isna().all()
+    # Un registre ne voit pas les remarques de l'autre
+    assert rechercher(SUIVI, pd.Series(["BL1"]), dossier=tmp_path).isna().all()
+
+
+def test_premiere_remarque_conservee(tmp_path):
+    enregistrer(BLS, pd.Series(["BL1", "BL1"]), pd.Series(["a", "b"]),
+                conserver="premier", dossier=tmp_path)
+    assert rechercher(BLS, pd.Series(["BL1"]), dossier=tmp_path).tolist() == ["a"]
+
+
+def test_remarque_effacee_retiree(tmp_path):
+    enregistrer(BLS, pd.Series(["BL1", "BL2"]), pd.Series(["a", "b"]),
+                dossier=tmp_path)
+
+    # BL1 effacée, BL2 absente du fichier : seule BL1 est retirée
+    assert enregistrer(BLS, pd.Series(["BL1", "BL3"]), pd.Series(["", "c"]),
+                       dossier=tmp_path) == (1, 1)
+    trouvees = rechercher(BLS, pd.Series(["BL1", "BL2", "BL3"]), dossier=tmp_path)
+    assert pd.isna(trouvees.iloc[0])
+    assert trouvees.iloc[1:].tolist() == ["b", "c"]
+
+
+def test_bls_sans_colonne_remarques(tmp_path):
+    bls = pd.DataFrame({"N° Pièce": [" bl1 ", "BL2"], "Commentaire": ["a", ""]})
+    assert enregistrer_bls(bls, dossier=tmp_path) == (1, 0)
+    assert rechercher(BLS, pd.Series(["BL1"]), dossier=tmp_path).tolist() == ["a"]
+
+    with pytest.raises(ValueError, match="REMARQUES"):
+        enregistrer_bls(pd.DataFrame({"N° Pièce": ["BL1"], "Montant": [3]}),
+                        dossier=tmp_path)
+    assert rechercher(BLS, pd.Series(["BL1"]), dossier=tmp_path).tolist() == ["a"]
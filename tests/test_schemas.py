@@ -0,0 +1,54 @@
+import pandas as pd
+
+from rapports import SCHEMA_BLS, SCHEMA_BLS_ANCIENS, SCHEMA_VENTES, verifier_fichier
+from schemas import controler, noms_canoniques
+
+
+def test_alias_et_variantes_reconnus():
+    entetes = ["Reference article", "Désignation  Article", "Qté Vendue", "CA HT"]
+    assert noms_canoniques(entetes) == [
+        "Référence Article", "Désignation Article", "Qté Vendues",
+        "Chiffre d'affaires HT"
+    ]
+    assert controler(entetes, [["A1", "Vis", "3", "1 200,50"]], SCHEMA_VENTES) == []
+
+
+def test_nom_deja_present_garde():
+    assert noms_canoniques(["Qté Vendues", "Qté Vendue"]) == ["Qté Vendues",
+                                                              "Qté Vendue"]
+
+
+def test_alias_du_schema():
+    entetes = ["N° Pièce", "N° Compte Client", "commentaires"]
+    assert controler(entetes, [], SCHEMA_BLS_ANCIENS) == []
+
+    problemes = controler(["N° Pièce", "N° Compte Client"], [], SCHEMA_BLS_ANCIENS)
+    assert problemes == ["colonne(s) manquante(s) : 'REMARQUES'"]
+
+
+def test_colonne_manquante_et_type():
+    entetes = ["Référence Article", "Designation Articl", "Qté Vendues",
+               "Chiffre d'affaires HT"]
+    problemes = controler(entetes, [["A1", "Vis", "trois", ""]], SCHEMA_VENTES)
+    assert problemes == [
+        "colonne(s) manquante(s) : 'Désignation Article' (colonne proche : "
+        "'Designation Articl')",
+        "la colonne 'Qté Vendues' devrait contenir des nombres (valeur lue : "
+        "'trois')",
+    ]
+
+
+def test_feuille_manquante(tmp_path):
+    chemin = tmp_path / "bls.xlsx"
+    pd.DataFrame({"N° Pièce": ["BL1"], "N° Compte Client": ["C1"]}).to_excel(
+        chemin, sheet_name="Feuil1", index=False
+    )
+    problemes = verifier_fichier(str(chemin), SCHEMA_BLS)
+    assert len(problemes) == 1
+    assert problemes[0].startswith("Fichier « bls.xlsx » (bons de livraison) : ")
+    assert "Feuil2" in problemes[0]
+
+    pd.DataFrame({"N° Pièce": ["BL1"], "N° Compte Client": ["C1"]}).to_excel(
+        chemin, sheet_name="Feuil2", index=False
+    )
+    assert verifier_fichier(str(chemin), SCHEMA_BLS) == []
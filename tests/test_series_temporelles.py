@@ -0,0 +1,46 @@
+import pandas as pd
+
+from series_temporelles import series_rotation
+
+
+STOCKS = pd.DataFrame({
+    "Référence Article": ["A", "B"],
+    "Désignation Article": ["Vis", "Ecrou"],
+    "Qté Stock Réel": [10, 1],
+})
+
+
+def test_stock_reconstitue_a_rebours():
+    # A : entrée de 5 et sortie de 3 en janvier, rien en février, sortie de 4
+    # en mars ; B : sortie de 1 en février
+    mouvements = pd.DataFrame({
+        "Référence Article": ["A", "A", "A", "B"],
+        "Quantité": [5, -3, -4, -1],
+        "Date": pd.to_datetime(["2025-01-10", "2025-01-20", "2025-03-05",
+                                "2025-02-14"]),
+    })
+    series = series_rotation(STOCKS, mouvements)
+
+    mois = ["2025-01", "2025-02", "2025-03"]
+    assert list(series["stock_fin"].columns) == mois
+    assert series["stock_fin"].loc["A"].tolist() == [14, 14, 10]
+    assert series["stock_debut"].loc["A"].tolist() == [12, 14, 14]
+    assert series["sorties"].loc["A"].tolist() == [3, 0, 4]
+    assert series["stock_fin"].loc["B"].tolist() == [2, 1, 1]
+    assert series["stock_debut"].loc["B"].tolist() == [2, 2, 1]
+    assert series["stock_moyen"].loc["A"].tolist() == [13, 14, 12]
+
+
+def test_ventes_stock_constant():
+    ventes = pd.DataFrame({
+        "Référence Article": ["A", "A"],
+        "Qté Vendues": [2, 3],
+        "Date": pd.to_datetime(["2025-01-10", "2025-02-10"]),
+    })
+    series = series_rotation(STOCKS, ventes, colonne_quantite="Qté Vendues",
+                             ventes=True)
+
+    assert series["sorties"].loc["A"].tolist() == [2, 3]
+    assert series["stock_debut"].loc["A"].tolist() == [10, 10]
+    assert series["stock_fin"].loc["A"].tolist() == [10, 10]
+    assert series["articles"].loc["A", "Désignation Article"] == "Vis"
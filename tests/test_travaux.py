@@ -0,0 +1,133 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import pytest
+
+import travaux
+
+
+STOCKS = ("Référence Article;Désignation Article;Qté Stock Réel\n"
+          "A1;Vis;10\nA2;Ecrou;4\n")
+VENTES = ("Référence Article;Désignation Article;Qté Vendues;Chiffre d'affaires HT\n"
+          "A1;Vis;5;50\nA2;Ecrou;2;20\n")
+
+
+@pytest.fixture(scope="module")
+def dossier(tmp_path_factory):
+    """Travaux et extraits dans un dossier temporaire, pour ce processus et
+    pour les processus de calcul (qui relisent l'environnement)."""
+    dossier = tmp_path_factory.mktemp("travaux")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("AUTOREPORTING_TRAVAUX", str(dossier / "travaux"))
+        mp.setenv("AUTOREPORTING_EXTRAITS", str(dossier / "extraits"))
+        mp.setattr(travaux, "DOSSIER_TRAVAUX", str(dossier / "travaux"))
+        mp.setattr(travaux, "_pool", None)
+        for nom, contenu in [("stocks.csv", STOCKS), ("ventes.csv", VENTES)]:
+            (dossier / nom).write_text(contenu, encoding="utf-8")
+        yield dossier
+        if travaux._pool is not None:
+            travaux._pool.shutdown(cancel_futures=True)
+
+
+def attendre(id_travail, delai=120):
+    fin = time.monotonic() + delai
+    while travaux.etat(id_travail)["statut"] in travaux.ACTIFS:
+        assert time.monotonic() < fin, "travail toujours actif"
+        time.sleep(0.1)
+    return travaux.etat(id_travail)
+
+
+def entrees(dossier):
+    return [str(dossier / "stocks.csv"), str(dossier / "ventes.csv")]
+
+
+def test_travail_termine(dossier):
+    id_travail = travaux.soumettre("rotation_ventes", entrees(dossier), cle=("ok",))
+    assert travaux.etat(id_travail)["statut"] in travaux.ACTIFS
+
+    etat = attendre(id_travail)
+    assert etat["statut"] == travaux.TERMINE
+    assert etat["progression"] == 1.0
+    resultats, mesures = travaux.resultat(id_travail)
+    assert resultats["taux_rotation"]["Référence Article"].tolist() == ["A1", "A2"]
+    assert mesures
+
+    # Même clé : le travail terminé est retrouvé, sauf pour une relance
+    assert travaux.soumettre("rotation_ventes", entrees(dossier),
+                             cle=("ok",)) == id_travail
+    relance = travaux.soumettre("rotation_ventes", entrees(dossier), cle=("ok",),
+                                relancer=True)
+    assert relance != id_travail
+    assert attendre(relance)["statut"] == travaux.TERMINE
+
+
+def test_travail_en_erreur(dossier):
+    (dossier / "ventes_sans_designation.csv").write_text(
+        "Référence Article;Qté Vendues;Chiffre d'affaires HT\nA1;5;50\n",
+        encoding="utf-8"
+    )
+    id_travail = travaux.soumettre(
+        "rotation_ventes",
+        [str(dossier / "stocks.csv"), str(dossier / "ventes_sans_designation.csv")]
+    )
+    etat = attendre(id_travail)
+    assert etat["statut"] == travaux.ERREUR
+    assert "Désignation Article" in etat["message"]
+
+
+def _inserer(id_travail, statut, instance=travaux.INSTANCE):
+    connexion = travaux._connexion()
+    try:
+        connexion.execute(
+            "INSERT INTO travaux (id, rapport, options, cle, instance, statut, cree) "
+            "VALUES (?, 'rotation_ventes', '[]', ?, ?, ?, ?)",
+            (id_travail, repr(id_travail), instance, statut, time.time())
+        )
+    finally:
+        connexion.close()
+
+
+def test_travaux_d_un_serveur_arrete_interrompus(dossier, monkeypatch):
+    _inserer("ancien", travaux.EN_COURS, instance="serveur_arrete")
+    _inserer("actuel", travaux.EN_ATTENTE)
+    monkeypatch.setattr(travaux, "_pool", None)
+
+    travaux._obtenir_pool().shutdown()
+    assert travaux.etat("ancien")["statut"] == travaux.INTERROMPU
+    assert travaux.etat("actuel")["statut"] == travaux.EN_ATTENTE
+
+
+def test_processus_arrete_brutalement(dossier):
+    _inserer("arrete", travaux.EN_COURS)
+    pool, future = travaux._soumettre_au_pool(os._exit, 1)
+    future.add_done_callback(partial(travaux._terminer, "arrete", pool))
+    with pytest.raises(BrokenProcessPool):
+        future.result(timeout=120)
+
+    etat = attendre("arrete")
+    assert etat["statut"] == travaux.ERREUR
+    assert "brutalement" in etat["message"]
+    # Le pool inutilisable est remplacé au travail suivant
+    id_travail = travaux.soumettre("rotation_ventes", entrees(dossier))
+    assert attendre(id_travail)["statut"] == travaux.TERMINE
+    assert travaux._pool is not pool
+
+
+def processus_de_lecture():
+    import ingestion
+
+    return ingestion.NB_PROCESSUS
+
+
+def test_part_du_budget_de_processus(dossier, monkeypatch):
+    monkeypatch.setenv("AUTOREPORTING_BUDGET_PROCESSUS", "4")
+    monkeypatch.setenv("AUTOREPORTING_PROCESSUS", "4")
+    monkeypatch.setattr(travaux, "NB_TRAVAUX", 2)
+    monkeypatch.setattr(travaux, "_pool", None)
+
+    # Chaque travail garde un pool de lecture : deux processus sur quatre
+    parts = [f.result(timeout=120) for f in travaux.prechauffer(processus_de_lecture)]
+    travaux._pool.shutdown()
+    assert parts == [2, 2]
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from visionneuse import (
+    chercher, codes_filtre, index_recherche, nb_pages, page, selection,
+    valeurs_filtre
+)
+
+
+FAMILLE = "Code - Intitulé Famille"
+
+RESULTAT = pd.DataFrame({
+    "Référence": ["ab12", "AB1", " ab2", None, "b1"],
+    FAMILLE: ["F1 - x", "f1 - X", "F1 - x", None, "F2"],
+    "Qté": [3, 1, 2, 5, 4],
+})
+
+
+def test_chercher_debut_et_exact():
+    index = index_recherche(RESULTAT, "Référence")
+
+    assert sorted(chercher(index, "ab1")) == [0, 1]
+    assert sorted(chercher(index, " Ab")) == [0, 1, 2]
+    assert list(chercher(index, "ab1", exact=True)) == [1]
+    assert list(chercher(index, "c")) == []
+
+
+def test_filtre_sur_valeur_exacte():
+    index = codes_filtre(RESULTAT, FAMILLE)
+    assert valeurs_filtre(index) == ["F1 - x", "F2", "f1 - X"]
+
+    assert list(selection(RESULTAT, ("filtre",),
+                          filtres={FAMILLE: "F1 - x"})) == [0, 2]
+    assert list(selection(RESULTAT, ("filtre",),
+                          filtres={FAMILLE: "f1 - X"})) == [1]
+
+
+def test_selection_triee_et_paginee():
+    positions = selection(RESULTAT, ("tri",), tri="Qté", croissant=False,
+                          recherches={"Référence": "ab"},
+                          filtres={FAMILLE: None})
+    assert list(positions) == [0, 2, 1]
+
+    assert page(RESULTAT, positions, 2, 2)["Qté"].tolist() == [1]
+    assert nb_pages(len(positions), 2) == 2
+    assert nb_pages(0, 50) == 1
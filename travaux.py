@@ -0,0 +1,343 @@
+import functools
+import multiprocessing
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import instrumentation
+
+
+# File de travaux : les rapports sont calculés dans un pool de processus, hors
+# du thread de la session Streamlit. L'état de chaque travail est tenu dans une
+# table SQLite et son résultat écrit sur disque : une session peut suivre un
+# travail lancé avant un rafraîchissement de la page, ou avant un redémarrage.
+
+DOSSIER_TRAVAUX = os.environ.get("AUTOREPORTING_TRAVAUX", ".travaux")
+
+# Nombre de rapports calculés en même temps
+NB_TRAVAUX = int(os.environ.get("AUTOREPORTING_NB_TRAVAUX", "2"))
+
+# Durée de conservation des travaux terminés (jours)
+CONSERVATION_JOURS = float(os.environ.get("AUTOREPORTING_CONSERVATION_JOURS", "7"))
+
+# Intervalle de mise à jour de la progression par le processus de calcul (s)
+INTERVALLE_PROGRESSION = 0.5
+
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ERREUR = "erreur"
+INTERROMPU = "interrompu"
+ACTIFS = (EN_ATTENTE, EN_COURS)
+
+# Identifiant de ce serveur : les travaux actifs d'un autre serveur (arrêté)
+# sont marqués interrompus au démarrage du pool
+INSTANCE = uuid.uuid4().hex
+
+_pool = None
+_verrou = threading.Lock()
+
+
+def _connexion():
+    os.makedirs(DOSSIER_TRAVAUX, exist_ok=True)
+    connexion = sqlite3.connect(os.path.join(DOSSIER_TRAVAUX, "travaux.sqlite"),
+                                timeout=30, isolation_level=None)
+    connexion.row_factory = sqlite3.Row
+    connexion.execute("PRAGMA journal_mode=WAL")
+    connexion.execute("""
+        CREATE TABLE IF NOT EXISTS travaux (
+            id TEXT PRIMARY KEY,
+            rapport TEXT NOT NULL,
+            options TEXT NOT NULL,
+            cle TEXT NOT NULL,
+            instance TEXT NOT NULL,
+            statut TEXT NOT NULL,
+            etape TEXT,
+            nb_etapes INTEGER DEFAULT 0,
+            progression REAL DEFAULT 0,
+            message TEXT,
+            cree REAL NOT NULL,
+            debut REAL,
+            fin REAL
+        )
+    """)
+    connexion.execute("CREATE INDEX IF NOT EXISTS travaux_cle ON travaux (cle)")
+    return connexion
+
+
+def _mettre_a_jour(id_travail, **valeurs):
+    colonnes = ", ".join(f"{c} = ?" for c in valeurs)
+    connexion = _connexion()
+    try:
+        connexion.execute(f"UPDATE travaux SET {colonnes} WHERE id = ?",
+                          list(valeurs.values()) + [id_travail])
+    finally:
+        connexion.close()
+
+
+def _dossier(id_travail):
+    return os.path.join(DOSSIER_TRAVAUX, id_travail)
+
+
+def _initialiser_processus(nb_travaux):
+    """Exécutée au démarrage de chaque processus de calcul : ses lectures
+    parallèles (voir `ingestion.precharger`) sont limitées à sa part du budget
+    de processus, partagé avec les autres travaux."""
+    import ingestion
+
+    ingestion.partager_processus(nb_travaux)
+
+
+def _obtenir_pool():
+    """Pool de processus partagé par les sessions, créé au premier travail.
+    À sa création, les travaux laissés actifs par un serveur précédent sont
+    marqués interrompus et les travaux trop anciens supprimés."""
+    global _pool
+    with _verrou:
+        if _pool is None:
+            connexion = _connexion()
+            try:
+                connexion.execute(
+                    f"UPDATE travaux SET statut = ? WHERE statut IN "
+                    f"({', '.join('?' * len(ACTIFS))}) AND instance != ?",
+                    (INTERROMPU,) + ACTIFS + (INSTANCE,)
+                )
+            finally:
+                connexion.close()
+            purger()
+            _pool = ProcessPoolExecutor(
+                max_workers=NB_TRAVAUX,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialiser_processus,
+                initargs=(NB_TRAVAUX,)
+            )
+        return _pool
+
+
+def _abandonner_pool(pool):
+    """Oublie un pool devenu inutilisable (un processus de calcul s'est arrêté
+    brutalement, par exemple faute de mémoire ; le pool a alors arrêté ses
+    autres processus) : le travail suivant en crée un nouveau."""
+    global _pool
+    with _verrou:
+        if _pool is pool:
+            _pool = None
+
+
+def _soumettre_au_pool(fonction, *args):
+    """
+    Soumet `fonction` au pool, remplacé une fois s'il est inutilisable.
+    Returns:
+        tuple: (pool utilisé, future de l'exécution)
+    """
+    pool = _obtenir_pool()
+    try:
+        return pool, pool.submit(fonction, *args)
+    except BrokenProcessPool:
+        _abandonner_pool(pool)
+        pool = _obtenir_pool()
+        return pool, pool.submit(fonction, *args)
+
+
+def _terminer(id_travail, pool, future):
+    """
+    Appelée à la fin de chaque travail. `_executer` enregistre lui-même ses
+    erreurs : une exception ici signifie que le processus de calcul a disparu
+    (ou que le travail a été annulé), le travail est alors marqué en erreur
+    pour pouvoir être relancé.
+    """
+    erreur = "travail annulé" if future.cancelled() else future.exception()
+    if erreur is None:
+        return
+    if isinstance(erreur, BrokenProcessPool):
+        _abandonner_pool(pool)
+        erreur = ("le processus de calcul s'est arrêté brutalement (mémoire "
+                  "insuffisante ?)")
+    _mettre_a_jour(id_travail, statut=ERREUR, message=str(erreur), fin=time.time())
+
+
+def prechauffer(fonction):
+    """
+    Démarre le pool et exécute `fonction` (sans argument, importable depuis
+    un module) dans chacun de ses processus, qui sont ainsi lancés avant le
+    premier travail.
+    Returns:
+        list: Les futures des exécutions.
+    """
+    return [_soumettre_au_pool(fonction)[1] for _ in range(NB_TRAVAUX)]
+
+
+def _enregistrer_entrees(fichiers, dossier):
+    """
+    Écrit les fichiers Streamlit dans le dossier du travail (un processus de
+    calcul ne peut lire qu'un chemin) ; les chemins sont gardés tels quels.
+    Returns:
+        list: Les chemins de chaque emplacement (un chemin ou une liste).
+    """
+    os.makedirs(dossier, exist_ok=True)
+    chemins = []
+    for i, emplacement in enumerate(fichiers):
+        liste = emplacement if isinstance(emplacement, (list, tuple)) else [emplacement]
+        copies = []
+        for j, fichier in enumerate(liste):
+            if isinstance(fichier, str):
+                copies.append(fichier)
+                continue
+            chemin = os.path.join(dossier, f"{i}_{j}_{os.path.basename(fichier.name)}")
+            with open(chemin, "wb") as f:
+                f.write(fichier.getvalue())
+            copies.append(chemin)
+        chemins.append(copies if isinstance(emplacement, (list, tuple)) else copies[0])
+    return chemins
+
+
+def _suivre(id_travail, mesures, nb_etapes_prevues, arret):
+    """Écrit régulièrement l'étape en cours et la progression, estimée d'après
+    le nombre d'étapes distinctes du dernier travail du même rapport (une étape
+    répétée pour chaque bloc lu ne compte qu'une fois)."""
+    while not arret.wait(INTERVALLE_PROGRESSION):
+        terminees = len({m["etape"] for m in mesures if "statut" in m})
+        en_cours = [m["etape"] for m in mesures if "statut" not in m]
+        progression = (min(terminees / nb_etapes_prevues, 0.99)
+                       if nb_etapes_prevues else 0)
+        _mettre_a_jour(id_travail, etape=en_cours[-1] if en_cours else None,
+                       progression=progression)
+
+
+def _executer(id_travail, nom, chemins, options, nb_etapes_prevues):
+    """Calcule un rapport dans un processus du pool et écrit son résultat."""
+    import rapports
+
+    _mettre_a_jour(id_travail, statut=EN_COURS, debut=time.time())
+    arret = threading.Event()
+    try:
+        with instrumentation.collecter() as mesures:
+            suivi = threading.Thread(
+                target=_suivre, args=(id_travail, mesures, nb_etapes_prevues, arret),
+                daemon=True
+            )
+            suivi.start()
+            resultats = rapports.executer(nom, *chemins, **options)
+
+        chemin = os.path.join(_dossier(id_travail), "resultat.pkl")
+        temporaire = f"{chemin}.{uuid.uuid4().hex}.tmp"
+        with open(temporaire, "wb") as f:
+            pickle.dump({"resultats": resultats, "mesures": mesures}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaire, chemin)
+    except Exception as e:
+        arret.set()
+        _mettre_a_jour(id_travail, statut=ERREUR, message=str(e), fin=time.time())
+        return
+    arret.set()
+    suivi.join()
+    _mettre_a_jour(id_travail, statut=TERMINE, progression=1.0, etape=None,
+                   nb_etapes=len({m["etape"] for m in mesures}), fin=time.time())
+
+
+def soumettre(nom, fichiers, options=None, cle=None, relancer=False):
+    """
+    Soumet le calcul d'un rapport (voir `rapports.RAPPORTS`). Si un travail de
+    même clé est en cours, terminé (y compris avant un redémarrage) ou en
+    erreur, son identifiant est renvoyé au lieu d'en lancer un nouveau.
+    Args:
+        nom (str): Le nom du rapport.
+        fichiers (list): Les fichiers de chaque emplacement.
+        options (dict, optional): Les options du rapport.
+        cle (tuple, optional): L'identifiant du calcul (empreintes des fichiers
+            et options), pour retrouver un travail identique.
+        relancer (bool): Lancer un nouveau travail même s'il en existe un de
+            même clé (par exemple après une erreur).
+    Returns:
+        str: L'identifiant du travail.
+    """
+    options = options or {}
+    options_texte = repr(sorted(options.items()))
+    cle = repr(cle if cle is not None else uuid.uuid4().hex)
+    _obtenir_pool()
+
+    connexion = _connexion()
+    try:
+        lignes = [] if relancer else connexion.execute(
+            "SELECT id, statut FROM travaux WHERE cle = ? AND statut IN (?, ?, ?, ?) "
+            "ORDER BY cree DESC", (cle,) + ACTIFS + (TERMINE, ERREUR)
+        )
+        for ligne in lignes:
+            if ligne["statut"] != TERMINE or os.path.exists(
+                    os.path.join(_dossier(ligne["id"]), "resultat.pkl")):
+                return ligne["id"]
+
+        precedent = connexion.execute(
+            "SELECT nb_etapes FROM travaux WHERE rapport = ? AND options = ? "
+            "AND statut = ? ORDER BY fin DESC LIMIT 1", (nom, options_texte, TERMINE)
+        ).fetchone()
+        id_travail = uuid.uuid4().hex
+        chemins = _enregistrer_entrees(fichiers, _dossier(id_travail))
+        connexion.execute(
+            "INSERT INTO travaux (id, rapport, options, cle, instance, statut, cree) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (id_travail, nom, options_texte, cle, INSTANCE, EN_ATTENTE, time.time())
+        )
+    finally:
+        connexion.close()
+
+    # Le travail est enregistré avant d'être soumis (son processus met sa ligne
+    # à jour) ; s'il ne peut pas l'être, il est marqué en erreur
+    try:
+        pool, future = _soumettre_au_pool(
+            _executer, id_travail, nom, chemins, options,
+            precedent["nb_etapes"] if precedent else 0
+        )
+    except Exception as e:
+        _mettre_a_jour(id_travail, statut=ERREUR, message=str(e), fin=time.time())
+        return id_travail
+    future.add_done_callback(functools.partial(_terminer, id_travail, pool))
+    return id_travail
+
+
+def etat(id_travail):
+    """
+    Returns:
+        dict: L'état du travail (statut, étape en cours, progression entre 0
+        et 1, message d'erreur, horodatages), ou None s'il n'existe pas.
+    """
+    connexion = _connexion()
+    try:
+        ligne = connexion.execute("SELECT * FROM travaux WHERE id = ?",
+                                  (id_travail,)).fetchone()
+    finally:
+        connexion.close()
+    return dict(ligne) if ligne is not None else None
+
+
+def resultat(id_travail):
+    """
+    Lit le résultat d'un travail terminé.
+    Returns:
+        tuple: (résultats du rapport, mesures des étapes du calcul)
+    """
+    with open(os.path.join(_dossier(id_travail), "resultat.pkl"), "rb") as f:
+        contenu = pickle.load(f)
+    return contenu["resultats"], contenu["mesures"]
+
+
+def purger(conservation_jours=CONSERVATION_JOURS):
+    """Supprime les travaux inactifs créés il y a plus de `conservation_jours`."""
+    limite = time.time() - conservation_jours * 86400
+    connexion = _connexion()
+    try:
+        anciens = [ligne["id"] for ligne in connexion.execute(
+            f"SELECT id FROM travaux WHERE cree < ? AND statut NOT IN "
+            f"({', '.join('?' * len(ACTIFS))})", (limite,) + ACTIFS
+        )]
+        for id_travail in anciens:
+            shutil.rmtree(_dossier(id_travail), ignore_errors=True)
+            connexion.execute("DELETE FROM travaux WHERE id = ?", (id_travail,))
+    finally:
+        connexion.close()
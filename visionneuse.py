@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from cache import memoiser
+from fonctions2 import normaliser_texte
+from instrumentation import etape
+
+
+# Affichage paginé des résultats : le DataFrame reste sur le serveur, seule la
+# page visible est envoyée au navigateur. Tris et recherches s'appuient sur
+# des index (ordre des lignes pour chaque colonne, clés triées des colonnes de
+# recherche) calculés une fois par résultat et gardés dans `cache`.
+
+# Nombre de lignes par page proposé
+TAILLES_PAGE = [50, 100, 500]
+
+# Colonnes de recherche : la saisie est comparée au début des valeurs
+COLONNES_RECHERCHE = ["Référence Article", "N° Pièce", "Référence"]
+
+# Colonnes de filtre : une valeur est choisie parmi les valeurs présentes,
+# retenue telle quelle (sans normalisation)
+COLONNES_FILTRE = ["Code - Intitulé Famille"]
+
+
+def ordre(df, colonne, croissant=True):
+    """
+    Positions des lignes triées selon une colonne (tri stable, valeurs
+    manquantes en dernier). Une colonne de types mélangés est triée comme texte.
+    Args:
+        df (pd.DataFrame): Le résultat.
+        colonne (str): La colonne de tri.
+        croissant (bool): Le sens du tri.
+    Returns:
+        np.ndarray: Les positions des lignes dans l'ordre du tri.
+    """
+    valeurs = pd.Series(df[colonne].to_numpy())
+    try:
+        triees = valeurs.sort_values(ascending=croissant, kind="stable",
+                                     na_position="last")
+    except TypeError:
+        triees = valeurs.astype("string").sort_values(ascending=croissant,
+                                                      kind="stable",
+                                                      na_position="last")
+    return triees.index.to_numpy()
+
+
+def index_recherche(df, colonne):
+    """
+    Index d'une colonne de recherche : ses valeurs normalisées (voir
+    `normaliser_texte`) triées, et la position de chaque valeur.
+    Args:
+        df (pd.DataFrame): Le résultat.
+        colonne (str): La colonne indexée.
+    Returns:
+        tuple: (clés triées, positions des lignes correspondantes)
+    """
+    cles = normaliser_texte(pd.Series(df[colonne].to_numpy()), tous_espaces=False)
+    cles = cles[df[colonne].notna().to_numpy()].astype(object)
+    triees = cles.sort_values(kind="stable")
+    return triees.to_numpy(), triees.index.to_numpy()
+
+
+def chercher(index, texte, exact=False):
+    """
+    Positions des lignes dont la valeur commence par `texte` (ou lui est égale
+    si `exact`), par recherche dichotomique dans l'index.
+    Args:
+        index (tuple): L'index de la colonne (voir `index_recherche`).
+        texte (str): La saisie.
+        exact (bool): Si True, seules les valeurs égales sont retenues.
+    Returns:
+        np.ndarray: Les positions des lignes trouvées.
+    """
+    cles, positions = index
+    texte = normaliser_texte(pd.Series([texte]), tous_espaces=False).iloc[0]
+    debut = np.searchsorted(cles, texte, side="left")
+    fin = np.searchsorted(cles, texte if exact else texte + "\uffff", side="right")
+    return positions[debut:fin]
+
+
+def codes_filtre(df, colonne):
+    """
+    Index d'une colonne de filtre : le code de la valeur de chaque ligne et
+    les valeurs distinctes (voir `pd.factorize`, valeurs manquantes : -1).
+    Returns:
+        tuple: (codes, valeurs distinctes en texte)
+    """
+    codes, valeurs = pd.factorize(df[colonne])
+    return codes, [str(v) for v in valeurs]
+
+
+def valeurs_filtre(index):
+    """Les valeurs proposées pour une colonne de filtre, triées."""
+    return sorted(set(index[1]))
+
+
+def selection(df, cle, tri=None, croissant=True, recherches=None, filtres=None):
+    """
+    Lignes à afficher : celles qui correspondent à toutes les recherches et à
+    tous les filtres, dans l'ordre du tri. Les index sont mis en cache pour
+    `cle` : changer de tri, de page ou de recherche ne reparcourt pas le
+    résultat.
+    Args:
+        df (pd.DataFrame): Le résultat.
+        cle (tuple): L'identifiant du résultat.
+        tri (str): La colonne de tri (ordre d'origine si None).
+        croissant (bool): Le sens du tri.
+        recherches (dict): Colonne -> début des valeurs recherchées.
+        filtres (dict): Colonne -> valeur retenue (exactement, voir
+            `codes_filtre`).
+    Returns:
+        np.ndarray: Les positions des lignes à afficher, dans l'ordre.
+    """
+    with etape("selection_visionneuse", len(df)) as mesure:
+        if tri is None:
+            positions = np.arange(len(df))
+        else:
+            positions = memoiser(("ordre", tri, croissant) + cle,
+                                 ordre, df, tri, croissant)
+
+        retenues = np.ones(len(df), dtype=bool)
+        for colonne, texte in (recherches or {}).items():
+            if texte:
+                index = memoiser(("index_recherche", colonne) + cle,
+                                 index_recherche, df, colonne)
+                trouvees = np.zeros(len(df), dtype=bool)
+                trouvees[chercher(index, texte)] = True
+                retenues &= trouvees
+        for colonne, valeur in (filtres or {}).items():
+            if valeur is not None:
+                codes, valeurs = memoiser(("codes_filtre", colonne) + cle,
+                                          codes_filtre, df, colonne)
+                retenues &= np.isin(codes, [i for i, v in enumerate(valeurs)
+                                            if v == valeur])
+        if not retenues.all():
+            positions = positions[retenues[positions]]
+        mesure["lignes_sortie"] = len(positions)
+    return positions
+
+
+def page(df, positions, numero, taille):
+    """
+    Args:
+        df (pd.DataFrame): Le résultat.
+        positions (np.ndarray): Les lignes à afficher (voir `selection`).
+        numero (int): Le numéro de la page, à partir de 1.
+        taille (int): Le nombre de lignes par page.
+    Returns:
+        pd.DataFrame: Les lignes de la page.
+    """
+    debut = (numero - 1) * taille
+    return df.iloc[positions[debut:debut + taille]]
+
+
+def nb_pages(nb_lignes, taille):
+    """Nombre de pages (au moins une, même vide)."""
+    return max((nb_lignes + taille - 1) // taille, 1)